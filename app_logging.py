@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Non-blocking application logging.
+Records are put on an in-memory queue by a QueueHandler; a QueueListener
+thread does the (blocking) writes to stdout, so logging never waits on I/O
+in the event loop. Categories are child loggers of "omi" (omi.webhook,
+omi.storage, ...); LOG_SAMPLE keeps only 1 in N records below WARNING for
+noisy categories.
+"""
+import atexit
+import itertools
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from typing import Dict, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "category=N,...": keep 1 in N DEBUG/INFO records of that category
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "segments=10")
+LOG_FORMAT = "%(levelname)s [%(name)s] %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that formats in place instead of copying each record"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = self.format(record)
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+
+class SampleFilter(logging.Filter):
+    """Keep 1 in every N records below WARNING"""
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = every
+        self._count = itertools.count()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or next(self._count) % self.every == 0
+
+
+def _parse_sample_rates(spec: str) -> Dict[str, int]:
+    rates = {}
+    for item in spec.split(","):
+        category, _, every = item.partition("=")
+        try:
+            rates[category.strip()] = int(every)
+        except ValueError:
+            continue
+    return rates
+
+
+def setup_logging():
+    """Attach the queue handler and start the writer thread (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+    # LOG_FORMAT doesn't use them; skip collecting them on every record
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    root = logging.getLogger("omi")
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root.addHandler(_QueueHandler(log_queue))
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(log_queue, stream)
+    _listener.start()
+    atexit.register(stop_logging)
+
+    for category, every in _parse_sample_rates(LOG_SAMPLE).items():
+        if every > 1:
+            logging.getLogger(f"omi.{category}").addFilter(SampleFilter(every))
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(category: str) -> logging.Logger:
+    """Logger for one category, e.g. get_logger("webhook") -> omi.webhook."""
+    setup_logging()
+    return logging.getLogger(f"omi.{category}")
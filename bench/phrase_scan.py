@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Trigger / end phrase detection: the per-phrase loops TweetDetector used to run
+against one PhraseMatcher scan per segment, at realistic transcript lengths.
+The old path lowercases the text and searches it once per phrase, three times
+over (detect_trigger, detect_end, extract_tweet_content); the new one scans
+once and shares the result. The scan also normalizes width, kana and spacing,
+which the old loops did not, so the "found" columns can differ.
+
+    python bench/phrase_scan.py [--lengths 50 150 300 1000 4000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tweet_detector import TweetDetector  # noqa: E402
+
+TRIGGERS = TweetDetector.TRIGGER_PHRASES
+ENDS = TweetDetector.END_PHRASES
+
+TEXTS = {
+    "en": ("so I was walking down the street today and the weather was really nice "
+           "and I thought about what to have for dinner ", " tweet now "),
+    # Katakana trigger: only the normalizing matcher folds it onto "\u3048\u304f\u3059\u306a\u3046"
+    "ja": ("\u4eca\u65e5\u306f\u3068\u3066\u3082\u5929\u6c17\u304c\u826f\u304b\u3063\u305f"
+           "\u306e\u3067\u516c\u5712\u3092\u6563\u6b69\u3057\u307e\u3057\u305f\u3002",
+           "\u30a8\u30c3\u30af\u30b9\u306a\u3046"),
+}
+
+
+# The loops before the automaton (one lowercase + find per phrase, per method)
+def old_detect_trigger(text: str) -> bool:
+    normalized = text.lower().strip()
+    return any(phrase in normalized for phrase in TRIGGERS)
+
+
+def old_detect_end(text: str) -> bool:
+    normalized = text.lower().strip()
+    return any(phrase in normalized for phrase in ENDS)
+
+
+def old_extract_tweet_content(text: str):
+    normalized = text.lower().strip()
+    for trigger in TRIGGERS:
+        index = normalized.find(trigger)
+        if index != -1:
+            content = text[index + len(trigger):].strip()
+            for end in ENDS:
+                if content.lower().endswith(end):
+                    content = content[:-len(end)].strip()
+                    break
+            return content or None
+    return None
+
+
+def old_segment(text: str):
+    old_detect_end(text)
+    return old_detect_trigger(text) and old_extract_tweet_content(text)
+
+
+def new_segment(text: str, matcher=TweetDetector.matcher()):
+    # Every webhook brings new text: measure real scans, not cache hits
+    matcher._cache.clear()
+    result = TweetDetector.scan(text)
+    result.has("end")
+    return result.has("trigger") and TweetDetector.extract_tweet_content(text, result)
+
+
+def per_call_us(func, text: str, number: int) -> float:
+    return min(timeit.repeat(lambda: func(text), number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[50, 150, 300, 1000, 4000])
+    args = parser.parse_args()
+
+    print(f"{'text':>4} {'chars':>6} {'trigger':>8} {'old us':>8} {'new us':>8} {'old found':>10} {'new found':>10}")
+    for language, (base, trigger) in TEXTS.items():
+        for length in args.lengths:
+            text = (base * (length // len(base) + 1))[:length]
+            with_trigger = text[:length // 3] + trigger + text[length // 3:]
+            number = 2000 if length < 2000 else 300
+            for label, sample in (("no", text), ("mid", with_trigger)):
+                old_us = per_call_us(old_segment, sample, number)
+                new_us = per_call_us(new_segment, sample, number)
+                old_found = old_segment(sample) is not False
+                new_found = new_segment(sample) is not False
+                print(
+                    f"{language:>4} {length:>6} {label:>8} {old_us:>8.2f} {new_us:>8.2f} "
+                    f"{old_found!s:>10} {new_found!s:>10}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Cold-start benchmark: import-to-first-request latency with 10k / 100k users.
+Each run is a fresh process on a generated JSON storage directory (user shard
+files), timing `import main_simple`, then startup() plus the first
+/setup-completed request for a stored user, with STORAGE_LAZY_LOAD off and on.
+
+    python bench/startup.py [--users 10000 100000] [--repeat 3]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRATCH = tempfile.mkdtemp(prefix="omi-bench-startup-")
+# Only user_shard is needed here: keep this process's own storage empty and quiet
+os.environ.update({"STORAGE_DIR": SCRATCH, "STORAGE_LAZY_LOAD": "true", "LOG_LEVEL": "WARNING"})
+sys.path.insert(0, ROOT)
+
+from records import UserRecord  # noqa: E402
+from simple_storage import user_shard  # noqa: E402
+
+# Runs in each fresh process
+CHILD = r"""
+import asyncio
+import json
+import sys
+import time
+
+started = time.perf_counter()
+import httpx
+import main_simple
+imported = time.perf_counter()
+
+
+async def main():
+    await main_simple.startup()
+    transport = httpx.ASGITransport(app=main_simple.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.get("/setup-completed", params={"uid": sys.argv[1]})
+    ready = time.perf_counter()
+    assert response.json()["is_setup_completed"], response.text
+    await main_simple.shutdown()
+    print(json.dumps({"import_ms": (imported - started) * 1000, "first_request_ms": (ready - started) * 1000}))
+
+
+asyncio.run(main())
+"""
+
+
+def write_users(storage_dir: str, count: int) -> str:
+    """Shard files as JsonFileBackend writes them; returns a uid to look up."""
+    now = time.time()
+    shards = {}
+    for n in range(count):
+        uid = f"user{n:07d}"
+        user = UserRecord(uid, f"access-{n}", f"refresh-{n}", now + 7200, now)
+        shards.setdefault(user_shard(uid), {})[uid] = user.to_dict()
+    shard_dir = os.path.join(storage_dir, "users")
+    os.makedirs(shard_dir)
+    for shard, shard_users in shards.items():
+        with open(os.path.join(shard_dir, shard + ".json"), "w") as f:
+            json.dump(shard_users, f)
+    return f"user{count // 2:07d}"
+
+
+def run_once(storage_dir: str, uid: str, lazy: bool) -> dict:
+    env = {
+        **os.environ,
+        "STORAGE_DIR": storage_dir,
+        "STORAGE_LAZY_LOAD": "true" if lazy else "false",
+        "DATABASE_URL": "",
+        "REDIS_URL": "",
+        "STORAGE_SHARED": "",
+        "WEB_CONCURRENCY": "1",
+        "LOG_LEVEL": "WARNING",
+    }
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, uid],
+        cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'users':>8} {'mode':>6} {'import ms':>10} {'first request ms':>17} {'process ms':>11}")
+    try:
+        for count in args.users:
+            storage_dir = os.path.join(SCRATCH, str(count))
+            uid = write_users(storage_dir, count)
+            for lazy in (False, True):
+                runs = [run_once(storage_dir, uid, lazy) for _ in range(args.repeat)]
+                median = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+                print(
+                    f"{count:>8} {'lazy' if lazy else 'eager':>6} {median['import_ms']:>10.0f} "
+                    f"{median['first_request_ms']:>17.0f} {median['process_ms']:>11.0f}"
+                )
+    finally:
+        shutil.rmtree(SCRATCH, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+/webhook payload decoding and response encoding: the old json.loads + dict
+walking and JSONResponse against orjson into Segment records and
+ORJSONResponse, on OMI-shaped payloads in both accepted forms (a bare segment
+list and {"session_id", "segments"}).
+
+    python bench/webhook_payload.py [--segments 1 3 10 50] [--number 20000]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse, ORJSONResponse  # noqa: E402
+
+from segments import join_text, parse_webhook_payload  # noqa: E402
+
+TEXTS = (
+    "I think the meeting went well, let's follow up tomorrow",
+    "\u4eca\u65e5\u306f\u3044\u3044\u5929\u6c17\u3067\u3059\u306d\u3001"
+    "\u305d\u308d\u305d\u308d\u6563\u6b69\u306b\u884c\u3053\u3046\u304b\u306a",
+)
+
+RESPONSE = {
+    "message": "Posted to X: 'hello world #omi #omi\u30a2\u30d7\u30ea\u304b\u3089\u6295\u7a3f #PostfromOmi'",
+    "session_id": "abc123",
+    "processed_segments": 3,
+}
+
+
+def omi_segment(n: int) -> dict:
+    return {
+        "id": f"seg_{n}",
+        "text": TEXTS[n % 2],
+        "speaker": f"SPEAKER_0{n % 2}",
+        "speaker_id": n % 2,
+        "is_user": n % 2 == 0,
+        "person_id": None,
+        "start": n * 2.5,
+        "end": n * 2.5 + 2.4,
+    }
+
+
+def old_decode(body: bytes):
+    """What the webhook did before: request.json() and dict lookups."""
+    payload = json.loads(body)
+    session_id = None
+    segments = []
+    if isinstance(payload, dict):
+        segments = payload.get("segments", [])
+        session_id = payload.get("session_id")
+    elif isinstance(payload, list):
+        segments = payload
+    return " ".join(seg.get("text", "") for seg in segments if isinstance(seg, dict)), session_id
+
+
+def new_decode(body: bytes):
+    segments, session_id = parse_webhook_payload(body)
+    return join_text(segments), session_id
+
+
+def per_call_us(func, number: int) -> float:
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--segments", type=int, nargs="+", default=[1, 3, 10, 50])
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"{'form':>5} {'segments':>9} {'bytes':>7} {'json us':>8} {'orjson us':>10}")
+    for count in args.segments:
+        raw = [omi_segment(n) for n in range(count)]
+        for form, payload in (("list", raw), ("dict", {"session_id": "abc123", "segments": raw})):
+            body = json.dumps(payload).encode()
+            assert old_decode(body) == new_decode(body)
+            old_us = per_call_us(lambda: old_decode(body), args.number)
+            new_us = per_call_us(lambda: new_decode(body), args.number)
+            print(f"{form:>5} {count:>9} {len(body):>7} {old_us:>8.2f} {new_us:>10.2f}")
+
+    old_us = per_call_us(lambda: JSONResponse(RESPONSE).body, args.number)
+    new_us = per_call_us(lambda: ORJSONResponse(RESPONSE).body, args.number)
+    print(f"\nresponse encode: JSONResponse {old_us:.2f} us, ORJSONResponse {new_us:.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent X posts against a local fake X API: the old blocking path (a new
+tweepy-style requests session per post, run on the event loop) vs the pooled
+httpx.AsyncClient in TwitterClient.post_tweet. The fake server answers
+POST /2/tweets after --latency-ms, like a real round trip.
+
+    python bench/x_posting.py [--posts 1 10 50 100] [--latency-ms 50]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRATCH = tempfile.mkdtemp(prefix="omi-bench-x-")
+
+
+class FakeX(BaseHTTPRequestHandler):
+    """POST /2/tweets -> 201 {"data": {"id", "text"}} after server.latency seconds"""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, keep-alive
+    # replies stall on Nagle + delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        time.sleep(self.server.latency)
+        reply = json.dumps({"data": {"id": str(time.monotonic_ns()), "text": body["text"]}}).encode()
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_fake_x(latency: float) -> str:
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeX)
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+async def blocking_post(base_url: str, access_token: str, text: str) -> dict:
+    """What post_tweet did before: tweepy.Client(...).create_tweet() on the loop."""
+    # A fresh Client per call meant a fresh requests session (and connection)
+    with requests.Session() as session:
+        response = session.post(
+            f"{base_url}/2/tweets",
+            json={"text": text},
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+    return {"success": response.status_code == 201}
+
+
+async def run(post, count: int) -> float:
+    started = time.perf_counter()
+    results = await asyncio.gather(*(post("token", f"post {n}") for n in range(count)))
+    elapsed = time.perf_counter() - started
+    assert all(result and result["success"] for result in results), results
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--posts", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    base_url = start_fake_x(args.latency_ms / 1000)
+    os.environ.update({
+        "TWITTER_API_BASE": base_url,
+        # twitter_client imports simple_storage: keep its storage out of the way
+        "STORAGE_DIR": SCRATCH,
+        "STORAGE_LAZY_LOAD": "true",
+        "LOG_LEVEL": "WARNING",
+    })
+    sys.path.insert(0, ROOT)
+    from twitter_client import TwitterClient
+
+    async def async_run(count: int) -> float:
+        client = TwitterClient()
+        try:
+            await run(client.post_tweet, 1)  # connection warm-up, as in a running app
+            return await run(client.post_tweet, count)
+        finally:
+            await client.aclose()
+
+    print(f"{'posts':>6} {'blocking s':>11} {'async s':>8} {'blocking/s':>11} {'async/s':>8}")
+    try:
+        for count in args.posts:
+            blocking = asyncio.run(run(lambda token, text: blocking_post(base_url, token, text), count))
+            pooled = asyncio.run(async_run(count))
+            print(f"{count:>6} {blocking:>11.2f} {pooled:>8.2f} {count / blocking:>11.0f} {count / pooled:>8.0f}")
+    finally:
+        shutil.rmtree(SCRATCH, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Local completeness scoring for transcribed text.
+A handful of surface features (sentence-final punctuation, Japanese sentence
+endings, a dangling conjunction/particle/article at the end, length) give a
+score in microseconds. Only scores inside the uncertainty band around 0.5 are
+worth a Gemini round trip (see TweetDetector.ai_check_completeness).
+"""
+import os
+import unicodedata
+
+# Local scores at least this far from 0.5 (as a fraction of 0.5) are trusted
+# without asking Gemini: 0.6 trusts >= 0.8 and <= 0.2. 0 never escalates,
+# above 1 always does
+COMPLETENESS_CONFIDENCE = float(os.getenv("COMPLETENESS_CONFIDENCE", "0.6"))
+
+# Feature weights, added to 0.5
+_FINAL_PUNCTUATION = 0.4
+_OPEN_PUNCTUATION = -0.35
+_DANGLING = -0.4
+_CLOSING = 0.3
+_JA_ENDING = 0.35
+_JA_WEAK_ENDING = 0.2
+_SHORT = -0.1
+_LONG = 0.1
+
+_FINAL_MARKS = ".!?\u3002\uff01\uff1f"
+_OPEN_MARKS = ",;:-\u3001"
+
+# Words a finished English sentence rarely ends on
+_DANGLING_WORDS = frozenset("""
+    and but or nor so because that which who whose whom if when where while
+    since unless until than as whether
+    to of in on at for with from about by into onto like
+    the a an my your his her our their its
+    is are was were am be been being will would can could should shall might must
+    have has had do does did very really just not
+    i we they he she it's i'm we're they're there's
+""".split())
+# ...and words that usually close one
+_CLOSING_WORDS = frozenset("""
+    ever today tonight now too again already finally though please thanks
+    everyone guys lol haha yes yeah done
+    it this them me him us here there out
+    great good amazing awesome nice cool beautiful delicious fun perfect wonderful
+""".split())
+
+# Japanese particles and conjunctive forms that expect more to follow
+_JA_DANGLING = (
+    "\u304c", "\u3092", "\u306b", "\u3067", "\u3068", "\u306f", "\u3082", "\u3078", "\u3084",
+    "\u304b\u3089", "\u3051\u3069", "\u3051\u308c\u3069", "\u3051\u308c\u3069\u3082",
+    "\u306e\u3067", "\u306e\u306b", "\u305f\u3089", "\u3070", "\u3066", "\u3057",
+    "\u3088\u308a", "\u3068\u304b", "\u3068\u3044\u3046",
+)
+# Sentence endings: masu/desu forms, past tense, final particles
+_JA_ENDINGS = (
+    "\u307e\u3059", "\u3067\u3059", "\u307e\u3057\u305f", "\u3067\u3057\u305f",
+    "\u307e\u305b\u3093", "\u307e\u3057\u3087\u3046", "\u3067\u3057\u3087\u3046",
+    "\u307e\u3059\u304b", "\u3067\u3059\u304b", "\u305f", "\u3060",
+    "\u3088", "\u306d", "\u304b\u306a", "\u308f", "\u305e",
+)
+# Plain adjective/negative endings: usually final, but also precede a noun
+_JA_WEAK_ENDINGS = ("\u3044",)
+
+_SHORT_WORDS = 2
+_LONG_WORDS = 12
+_LONG_JA_CHARS = 40
+
+
+def completeness_score(text: str) -> float:
+    """Local estimate (0.0-1.0) that text is a finished thought."""
+    text = unicodedata.normalize("NFKC", text).strip().lower()
+    if not text:
+        return 0.0
+    score = 0.5
+    if text.endswith("..."):
+        # Trailing off (NFKC also turns "\u2026" into "..."): no evidence either way
+        text = text.rstrip(". ")
+    elif text[-1] in _FINAL_MARKS:
+        score += _FINAL_PUNCTUATION
+    elif text[-1] in _OPEN_MARKS:
+        score += _OPEN_PUNCTUATION
+    body = text.rstrip(_FINAL_MARKS + _OPEN_MARKS + "\"') ")
+    if not body:
+        return 0.0
+
+    if body.isascii():
+        words = body.split()
+        last = words[-1].strip("\"'()")
+        if last in _DANGLING_WORDS:
+            score += _DANGLING
+        elif last in _CLOSING_WORDS:
+            score += _CLOSING
+        if len(words) < _SHORT_WORDS:
+            score += _SHORT
+        elif len(words) >= _LONG_WORDS:
+            score += _LONG
+    else:
+        if body.endswith(_JA_DANGLING):
+            score += _DANGLING
+        elif body.endswith(_JA_ENDINGS):
+            score += _JA_ENDING
+        elif body.endswith(_JA_WEAK_ENDINGS):
+            score += _JA_WEAK_ENDING
+        if len(body) >= _LONG_JA_CHARS:
+            score += _LONG
+    return round(min(1.0, max(0.0, score)), 2)
+
+
+class CompletenessScorer:
+    """Local completeness scores, with counters for how often they were trusted"""
+
+    def __init__(self, confidence: float = COMPLETENESS_CONFIDENCE):
+        self.confidence = confidence
+        self.metrics = {"checks": 0, "local_complete": 0, "local_incomplete": 0, "escalated": 0}
+
+    def score(self, text: str) -> float:
+        return completeness_score(text)
+
+    def is_confident(self, score: float) -> bool:
+        """Whether a local score is far enough from 0.5 to skip Gemini (counted)."""
+        self.metrics["checks"] += 1
+        if abs(score - 0.5) * 2 >= self.confidence - 1e-9:
+            self.metrics["local_complete" if score > 0.5 else "local_incomplete"] += 1
+            return True
+        self.metrics["escalated"] += 1
+        return False
+
+    def snapshot(self) -> dict:
+        checks = self.metrics["checks"]
+        local = checks - self.metrics["escalated"]
+        return {**self.metrics, "local_rate": round(local / checks, 3) if checks else None}
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+Per-key asyncio locks.
+Serializes work on one key (e.g. a session) without a global lock; waiters
+are served in arrival order and a key's entry is dropped once nobody holds
+or waits on it.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List
+
+
+class KeyedLocks:
+    """Lock table keyed by string, with refcounted cleanup"""
+
+    def __init__(self):
+        self._entries: Dict[str, List] = {}  # key -> [lock, holders + waiters]
+        self.metrics = {"acquired": 0, "contended": 0}
+
+    @asynccontextmanager
+    async def hold(self, key: str) -> AsyncIterator[None]:
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            if entry[0].locked():
+                self.metrics["contended"] += 1
+            async with entry[0]:
+                self.metrics["acquired"] += 1
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._entries[key]
+
+    def snapshot(self) -> dict:
+        return {**self.metrics, "active_keys": len(self._entries)}
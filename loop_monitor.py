@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Event-loop lag monitor.
+A background task sleeps for a fixed interval and records how late it wakes
+up; anything that blocks the loop (sync HTTP, file I/O, CPU work) shows up
+as lag in /metrics.
+"""
+import asyncio
+import os
+import time
+from typing import Optional
+
+LOOP_LAG_INTERVAL_MS = float(os.getenv("LOOP_LAG_INTERVAL_MS", "100"))
+# Lag above this counts as a stall
+LOOP_LAG_STALL_MS = float(os.getenv("LOOP_LAG_STALL_MS", "50"))
+
+
+class LoopLagMonitor:
+    """Measure how long the event loop is blocked"""
+
+    def __init__(self, interval_ms: float = LOOP_LAG_INTERVAL_MS, stall_ms: float = LOOP_LAG_STALL_MS):
+        self.interval = interval_ms / 1000
+        self.stall_ms = stall_ms
+        self._task: Optional[asyncio.Task] = None
+        self.metrics = {
+            "samples": 0,
+            "stalls": 0,
+            "last_lag_ms": 0.0,
+            "max_lag_ms": 0.0,
+            "total_lag_ms": 0.0,
+            "total_stall_ms": 0.0,
+        }
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def snapshot(self) -> dict:
+        samples = self.metrics["samples"]
+        return {
+            **self.metrics,
+            "avg_lag_ms": round(self.metrics["total_lag_ms"] / samples, 3) if samples else 0.0,
+        }
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (time.perf_counter() - started - self.interval) * 1000)
+            self.metrics["samples"] += 1
+            self.metrics["last_lag_ms"] = round(lag_ms, 3)
+            self.metrics["max_lag_ms"] = max(self.metrics["max_lag_ms"], round(lag_ms, 3))
+            self.metrics["total_lag_ms"] += lag_ms
+            if lag_ms >= self.stall_ms:
+                self.metrics["stalls"] += 1
+                self.metrics["total_stall_ms"] += lag_ms
@@ -1,30 +1,84 @@
 # -*- coding: utf-8 -*-
 from fastapi import FastAPI, Request, HTTPException, Query
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, ORJSONResponse
+import logging
 import os
 from dotenv import load_dotenv
-from typing import List, Dict, Any
+from contextlib import AsyncExitStack
+from typing import Optional, Tuple
 
 # Fix for Railway/production: Allow OAuth over HTTP (Railway handles HTTPS at proxy)
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 
-from simple_storage import SimpleUserStorage, SimpleSessionStorage, OAuthStateStorage, users, save_users
+from records import SessionRecord
+from simple_storage import (
+    SimpleUserStorage, SimpleSessionStorage, OAuthStateStorage, PostJobStorage, StorageLeases,
+    start_storage, stop_storage, get_storage_metrics, EPHEMERAL_SESSIONS, SHARED_STATE
+)
 from twitter_client import TwitterClient
 from tweet_detector import TweetDetector
+from phrase_matcher import PhraseStreams, ScanResult
+from phrase_registry import PhraseRegistry
+from loop_monitor import LoopLagMonitor
+from token_refresher import TokenRefresher, RefreshScheduler
+from post_jobs import PostJob, PostJobQueue
+from keyed_locks import KeyedLocks
+from segments import parse_webhook_payload, join_text
+from app_logging import get_logger, stop_logging
 
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))
 
+OAUTH_REDIRECT_URL = os.getenv("OAUTH_REDIRECT_URL", "http://localhost:8000/auth/callback")
+# Segments collected after a trigger before the tweet is extracted
+SEGMENTS_REQUIRED = int(os.getenv("SEGMENTS_REQUIRED", "3"))
+
 # Initialize services
 twitter_client = TwitterClient()
 tweet_detector = TweetDetector()
+loop_monitor = LoopLagMonitor()
+token_refresher = TokenRefresher(twitter_client)
+refresh_scheduler = RefreshScheduler(token_refresher)
+post_jobs = PostJobQueue(
+    lambda job: run_post_job(job),  # run_post_job is defined below
+    store=PostJobStorage if SHARED_STATE else None
+)
+session_locks = KeyedLocks()
+session_leases = StorageLeases("session:")  # across workers, shared mode only
+phrase_streams = PhraseStreams()  # per-session scan state, for triggers split across webhooks
+phrase_registry = PhraseRegistry({"trigger": TweetDetector.TRIGGER_PHRASES, "end": TweetDetector.END_PHRASES})
+
+log = get_logger("webhook")
+segment_log = get_logger("segments")  # per-segment text dumps, sampled (LOG_SAMPLE)
+auth_log = get_logger("auth")
 
 app = FastAPI(
     title="OMI X Integration",
     description="Real-time X posting via OMI voice commands",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 
+@app.on_event("startup")
+async def startup():
+    """Start background storage maintenance and token refresh."""
+    start_storage()
+    loop_monitor.start()
+    refresh_scheduler.start()
+    post_jobs.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Flush storage before the process exits."""
+    loop_monitor.stop()
+    await post_jobs.close()
+    await refresh_scheduler.close()
+    await twitter_client.aclose()
+    await stop_storage()
+    stop_logging()
+
+
 @app.get("/")
 async def root(uid: str = Query(None)):
     """Root endpoint with setup instructions."""
@@ -176,7 +230,7 @@ async def root(uid: str = Query(None)):
 @app.get("/auth")
 async def auth_start(uid: str = Query(..., description="User ID from OMI")):
     """Start OAuth flow for X authentication."""
-    redirect_uri = os.getenv("OAUTH_REDIRECT_URL", "http://localhost:8000/auth/callback")
+    redirect_uri = OAUTH_REDIRECT_URL
     
     try:
         # Get authorization URL (Tweepy generates its own state parameter)
@@ -217,7 +271,10 @@ async def auth_callback(
         # Exchange code for access token using stored OAuth handler
         # This also retrieves the uid we associated with this state
         full_url = str(request.url)
-        token_data, uid = twitter_client.get_access_token(full_url, state)
+        redirect_uri = OAUTH_REDIRECT_URL
+        # The /auth request may have been served by another worker or before a restart
+        await OAuthStateStorage.fetch_oauth_state(state)
+        token_data, uid = twitter_client.get_access_token(full_url, state, redirect_uri)
         
         # Save user tokens with expiration info
         access_token = token_data.get('access_token')
@@ -227,10 +284,13 @@ async def auth_callback(
         if not access_token:
             raise HTTPException(status_code=500, detail="OAuth failed: access_token missing")
         
-        print("INFO Token data received:", flush=True)
-        print(f"   Access token: {access_token[:20]}..." if access_token else "   Access token: None", flush=True)
-        print(f"   Refresh token: {refresh_token[:20]}..." if refresh_token else "   Refresh token: None", flush=True)
-        print(f"   Expires in: {expires_in}s ({expires_in/3600:.1f}h)", flush=True)
+        auth_log.info(
+            "Token data received: access_token=%s... refresh_token=%s expires_in=%ss (%.1fh)",
+            access_token[:20],
+            f"{refresh_token[:20]}..." if refresh_token else None,
+            expires_in,
+            expires_in / 3600
+        )
         
         SimpleUserStorage.save_user(
             uid=uid,
@@ -238,6 +298,7 @@ async def auth_callback(
             refresh_token=refresh_token,
             expires_in=expires_in
         )
+        refresh_scheduler.track(SimpleUserStorage.get_user(uid))
         
         return HTMLResponse(
             content="""
@@ -544,6 +605,7 @@ async def auth_callback(
 @app.get("/setup-completed")
 async def check_setup(uid: str = Query(..., description="User ID from OMI")):
     """Check if user has completed setup (authenticated with X)."""
+    await SimpleUserStorage.fetch_user(uid)
     is_setup = SimpleUserStorage.is_authenticated(uid)
     return {"is_setup_completed": is_setup}
 
@@ -562,99 +624,25 @@ async def webhook(
     # Fix for malformed URLs where uid is appended twice (e.g., ?uid=... ?uid=...)
     if uid and "?uid=" in uid:
         uid = uid.split("?uid=")[0]
-    # Get user
-    user = SimpleUserStorage.get_user(uid)
-    
-    if not user or not user.get("access_token"):
-        return JSONResponse(
-            content={
-                "message": "Not authenticated. Please complete setup in the OMI app.",
-                "setup_required": True
-            },
-            status_code=401
-        )
-    
-    # Check if token needs refresh
-    if SimpleUserStorage.is_token_expired(uid):
-        print(f"INFO Token expired for user {uid[:10]}...", flush=True)
-        
-        # Check if we have a valid refresh token
-        refresh_token = user.get("refresh_token")
-        
-        if not refresh_token or refresh_token == "null":
-            print("WARN No refresh token! User must re-authenticate with offline.access scope.", flush=True)
-            return JSONResponse(
-                content={
-                    "message": "Session expired. Please re-authenticate in the OMI app.",
-                    "setup_required": True
-                },
-                status_code=401
-            )
-        
-        # Try to refresh
-        try:
-            print("INFO Refreshing token...", flush=True)
-            new_token_data = twitter_client.refresh_access_token(refresh_token)
-
-            new_access_token = new_token_data.get("access_token")
-            if not new_access_token:
-                raise Exception("Token refresh failed: access_token missing")
-            
-            # Save new tokens
-            SimpleUserStorage.save_user(
-                uid=uid,
-                access_token=new_access_token,
-                refresh_token=new_token_data.get("refresh_token", refresh_token),
-                expires_in=new_token_data.get("expires_in", 7200)
-            )
-            
-            # Update user reference
-            user = SimpleUserStorage.get_user(uid)
-            print("INFO Token refreshed!", flush=True)
-            
-        except Exception as e:
-            print(f"ERROR Refresh error: {e}", flush=True)
-            # Delete old invalid token
-            del users[uid]
-            save_users()
-            return JSONResponse(
-                content={
-                    "message": "Session expired. Please re-authenticate in the OMI app.",
-                    "setup_required": True
-                },
-                status_code=401
-            )
-    
-    assert user is not None
 
-    # Parse payload from OMI
-    try:
-        payload = await request.json()
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid JSON payload: {str(e)}")
-    
-    # Handle both formats:
+    # Parse payload from OMI. Handles both formats:
     # 1. Direct list: [{"text": "...", ...}, ...]
     # 2. Dict with segments: {"session_id": "...", "segments": [...]}
-    segments = []
-    if isinstance(payload, dict):
-        # Extract segments from dict
-        segments = payload.get("segments", [])
-        # Use session_id from payload if not in query params
-        if not session_id and "session_id" in payload:
-            session_id = payload["session_id"]
-    elif isinstance(payload, list):
-        # Direct list of segments
-        segments = payload
+    try:
+        segments, payload_session_id = parse_webhook_payload(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON payload: {str(e)}")
+    # Use session_id from payload if not in query params
+    if not session_id and payload_session_id:
+        session_id = payload_session_id
     
     # Log what we received for debugging
-    print(f"INFO Received {len(segments) if segments else 0} segment(s) from OMI", flush=True)
-    if segments:
+    log.debug("Received %d segment(s) from OMI", len(segments))
+    if segment_log.isEnabledFor(logging.DEBUG):
         for i, seg in enumerate(segments[:3]):  # Show first 3
-            text = seg.get('text', 'NO TEXT') if isinstance(seg, dict) else str(seg)
-            print(f"   Segment {i}: {text[:100]}", flush=True)
+            segment_log.debug("Segment %d: %s", i, seg.text[:100])
     
-    if not segments or not isinstance(segments, list):
+    if not segments:
         # Silent response for empty/invalid data
         return {"status": "ok"}
     
@@ -663,19 +651,65 @@ async def webhook(
     if not session_id:
         session_id = f"omi_session_{uid}"
     
-    # Get or create session
-    session = SimpleSessionStorage.get_or_create_session(session_id, uid)
-    
-    # Debug: show current session state
-    print(f"INFO Session state: mode={session.get('tweet_mode')}, count={session.get('segments_count', 0)}", flush=True)
-    
-    # Process segments
-    response_message = await process_segments(session, segments, user)
+    full_text = join_text(segments)
+
+    # Segments of one session are applied one request at a time, in arrival
+    # order, so concurrent webhooks cannot interleave the read-modify-write
+    async with session_locks.hold(session_id), AsyncExitStack() as lease:
+        # Only the new text is scanned; the stream remembers where the previous
+        # webhook's text left off, so "tweet" / "now" across two calls triggers
+        scan = phrase_streams.feed(session_id, phrase_registry.matcher_for(uid), full_text)
+        triggered = scan.has("trigger")
+
+        session = await load_session(session_id, uid)
+        if session_leases.enabled and (triggered or is_recording(session)):
+            # Shared mode: this webhook will write the session. Hold its lease so
+            # other workers cannot interleave, and start from their latest write
+            await lease.enter_async_context(session_leases.hold(session_id))
+            session = await load_session(session_id, uid)
+        
+        if not triggered and not is_recording(session):
+            # Passive listening fast path: no user lookup, no token work,
+            # no session write
+            response_message = "listening"
+        else:
+            if triggered:
+                # Tokens are only needed once a post is queued; the post job
+                # refreshes them if needed, so here we only check the user exists
+                user = await SimpleUserStorage.fetch_user(uid)
+                if not user or not user.access_token:
+                    return ORJSONResponse(
+                        content={
+                            "message": "Not authenticated. Please complete setup in the OMI app.",
+                            "setup_required": True
+                        },
+                        status_code=401
+                    )
+                # Normally refreshed ahead of time by the scheduler; users loaded
+                # lazily or saved by another worker get scheduled here
+                refresh_scheduler.track(user)
+
+            if session is None:
+                # Entering recording: only now is the session created
+                session = SimpleSessionStorage.get_or_create_session(session_id, uid)
+
+            # Debug: show current session state
+            log.debug("Session state: mode=%s count=%d", session.tweet_mode, session.segments_count)
+
+            # Process segments
+            response_message = await process_segments(session, full_text, uid, scan)
+
+        # Posting finishes after an earlier webhook returned; report it now,
+        # unless this response carries its own news (a failure or a new job_id)
+        if not response_message.startswith(("Post failed:", "queued_")):
+            finished = await post_jobs.take_result(session_id)
+            if finished is not None:
+                response_message = finished.message
     
     # Only send notifications for final tweet post (success or failure)
     # Silent responses during collection so user doesn't get spammed
     if response_message and ("Posted to X:" in response_message or "Post failed:" in response_message):
-        print(f"INFO USER NOTIFICATION: {response_message}", flush=True)
+        log.info("User notification: %s", response_message)
         return {
             "message": response_message,
             "session_id": session_id,
@@ -683,14 +717,84 @@ async def webhook(
         }
     
     # Silent response for everything else (listening, collecting, etc.)
-    print(f"DEBUG Silent response: {response_message}", flush=True)
+    log.debug("Silent response: %s", response_message)
+    if response_message.startswith("queued_"):
+        return {"status": "ok", "job_id": response_message[len("queued_"):]}
     return {"status": "ok"}
 
 
+async def load_session(session_id: str, uid: str) -> Optional[SessionRecord]:
+    """The webhook's session (ephemeral mode: None for idle listeners, nothing is created)."""
+    if EPHEMERAL_SESSIONS:
+        return await SimpleSessionStorage.find_session(session_id)
+    return await SimpleSessionStorage.fetch_session(session_id, uid)
+
+
+def is_recording(session: Optional[SessionRecord]) -> bool:
+    return session is not None and session.tweet_mode == "recording"
+
+
+def ensure_hashtags(text: str) -> str:
+    """Append the required hashtags, trimming the text to stay within 280 chars."""
+    required = ["#omi", "#omi\u30a2\u30d7\u30ea\u304b\u3089\u6295\u7a3f", "#PostfromOmi"]
+    existing = {tag.lower() for tag in text.split() if tag.startswith("#")}
+    missing = [tag for tag in required if tag.lower() not in existing]
+    if not missing:
+        return text
+    suffix = " " + " ".join(missing)
+    if len(text) + len(suffix) <= 280:
+        return text + suffix
+    # Trim to fit 280 chars
+    trimmed = text[: max(0, 280 - len(suffix))].rstrip()
+    return trimmed + suffix
+
+
+async def run_post_job(job: PostJob) -> Tuple[str, str]:
+    """Extract the tweet with AI and post it to X (runs on a post_jobs worker)."""
+    cleaned_content = await tweet_detector.ai_extract_tweet_from_segments(job.text)
+
+    log.info("AI extracted tweet: '%s'", cleaned_content)
+
+    if not cleaned_content.strip():
+        log.warning("AI returned empty tweet")
+        return "empty", "No valid tweet content"
+
+    cleaned_content = ensure_hashtags(cleaned_content)
+
+    # Tokens may have been refreshed (or revoked) while the job was queued
+    user = await SimpleUserStorage.fetch_user(job.uid)
+    if user is not None and SimpleUserStorage.is_token_expired(job.uid):
+        user = await token_refresher.refresh(job.uid)
+    if user is None or not user.access_token:
+        return "failed", "Post failed: Not authenticated. Please complete setup in the OMI app."
+
+    log.info("Posting to X...")
+    result = await twitter_client.post_tweet(user.access_token, cleaned_content)
+
+    if result and result.get("success"):
+        log.info("Posted! Tweet ID: %s", result.get("tweet_id"))
+        return "posted", f"Posted to X: '{cleaned_content}'"
+    error = result.get("error", "Unknown") if result else "Failed"
+    log.error("Post failed: %s", error)
+    return "failed", f"Post failed: {error}"
+
+
+def queue_post(session_id: str, uid: str, text: str) -> str:
+    """Hand the collected text to the job pipeline and reset the session."""
+    job = post_jobs.submit(uid, session_id, text)
+    SimpleSessionStorage.reset_session(session_id)
+    if job is None:
+        log.error("Post queue full, dropping tweet")
+        return "Post failed: Server busy, please try again."
+    log.info("Queued post job %s", job.job_id)
+    return f"queued_{job.job_id}"
+
+
 async def process_segments(
-    session: dict,
-    segments: List[Dict[str, Any]],
-    user: dict
+    session: SessionRecord,
+    full_text: str,
+    uid: str,
+    scan: ScanResult
 ) -> str:
     """
     Collect exactly 3 segments after a trigger phrase, then use AI to
@@ -700,40 +804,21 @@ async def process_segments(
     - Segment 3: End part (auto-collected)
     - AI decides what the tweet should be and cleans it
     """
+    session_id = session.session_id
     
-    # Extract text from segments
-    segment_texts = [seg.get("text", "") for seg in segments]
-    full_text = " ".join(segment_texts)
-    
-    session_id = session["session_id"]
-    
-    required_segments = int(os.getenv("SEGMENTS_REQUIRED", "3"))
+    required_segments = SEGMENTS_REQUIRED
 
-    print(f"INFO Received: '{full_text}'", flush=True)
-    print(
-        f"INFO Session mode: {session['tweet_mode']}, Count: {session.get('segments_count', 0)}/{required_segments}",
-        flush=True
+    segment_log.debug("Received: '%s'", full_text)
+    log.debug(
+        "Session mode: %s, count: %d/%d", session.tweet_mode, session.segments_count, required_segments
     )
 
-    def ensure_hashtags(text: str) -> str:
-        required = ["#omi", "#omi\u30a2\u30d7\u30ea\u304b\u3089\u6295\u7a3f", "#PostfromOmi"]
-        existing = {tag.lower() for tag in text.split() if tag.startswith("#")}
-        missing = [tag for tag in required if tag.lower() not in existing]
-        if not missing:
-            return text
-        suffix = " " + " ".join(missing)
-        if len(text) + len(suffix) <= 280:
-            return text + suffix
-        # Trim to fit 280 chars
-        trimmed = text[: max(0, 280 - len(suffix))].rstrip()
-        return trimmed + suffix
-
-    # Check for trigger phrase
-    if tweet_detector.detect_trigger(full_text):
-        tweet_content = tweet_detector.extract_tweet_content(full_text) or ""
+    # Trigger phrase (detected by the webhook's stream scan of full_text)
+    if scan.has("trigger"):
+        tweet_content = tweet_detector.extract_tweet_content(full_text, scan) or ""
         
-        print(f"INFO TRIGGER! Starting {required_segments}-segment collection...", flush=True)
-        print(f"   Segment 1 content: '{tweet_content}'", flush=True)
+        log.info("Trigger detected, starting %d-segment collection", required_segments)
+        segment_log.debug("Segment 1 content: '%s'", tweet_content)
         
         if required_segments <= 1:
             if not tweet_content.strip():
@@ -746,28 +831,7 @@ async def process_segments(
                 )
                 return "collecting_0"
 
-            cleaned_content = await tweet_detector.ai_extract_tweet_from_segments(tweet_content)
-
-            print(f"INFO AI extracted tweet: '{cleaned_content}'", flush=True)
-
-            if cleaned_content.strip():
-                cleaned_content = ensure_hashtags(cleaned_content)
-                print("INFO Posting to X...", flush=True)
-                result = await twitter_client.post_tweet(user["access_token"], cleaned_content)
-
-                if result and result.get("success"):
-                    SimpleSessionStorage.reset_session(session_id)
-                    print(f"INFO SUCCESS! Tweet ID: {result.get('tweet_id')}", flush=True)
-                    return f"Posted to X: '{cleaned_content}'"
-                else:
-                    error = result.get("error", "Unknown") if result else "Failed"
-                    SimpleSessionStorage.reset_session(session_id)
-                    print(f"ERROR FAILED: {error}", flush=True)
-                    return f"Post failed: {error}"
-            else:
-                SimpleSessionStorage.reset_session(session_id)
-                print("WARN AI returned empty tweet", flush=True)
-                return "No valid tweet content"
+            return queue_post(session_id, uid, tweet_content)
 
         # Start collecting - wait for more segments
         SimpleSessionStorage.update_session(
@@ -781,44 +845,23 @@ async def process_segments(
         return "collecting_1"
     
     # If in recording mode, collect more segments
-    elif session["tweet_mode"] == "recording":
-        accumulated = session.get("accumulated_text", "") or ""
-        segments_count = session.get("segments_count", 0)
+    elif session.tweet_mode == "recording":
+        accumulated = session.accumulated_text
+        segments_count = session.segments_count
         
         # Add this segment
         accumulated += " " + full_text
         segments_count += 1
         
-        print(f"INFO Segment {segments_count}/{required_segments}: '{full_text}'", flush=True)
-        print(f"INFO Full accumulated: '{accumulated[:150]}...'", flush=True)
+        segment_log.debug("Segment %d/%d: '%s'", segments_count, required_segments, full_text)
+        segment_log.debug("Full accumulated: '%s...'", accumulated[:150])
         
         # Collect required number of segments
         if segments_count >= required_segments:
-            print(f"INFO Got all {required_segments} segments! Sending to AI...", flush=True)
-            
-            # AI extracts the actual tweet from all 3 segments
-            cleaned_content = await tweet_detector.ai_extract_tweet_from_segments(accumulated)
+            log.info("Got all %d segments, sending to AI", required_segments)
             
-            print(f"INFO AI extracted tweet: '{cleaned_content}'", flush=True)
-            
-            if cleaned_content.strip():
-                cleaned_content = ensure_hashtags(cleaned_content)
-                print("INFO Posting to X...", flush=True)
-                result = await twitter_client.post_tweet(user["access_token"], cleaned_content)
-                
-                if result and result.get("success"):
-                    SimpleSessionStorage.reset_session(session_id)
-                    print(f"INFO SUCCESS! Tweet ID: {result.get('tweet_id')}", flush=True)
-                    return f"Posted to X: '{cleaned_content}'"
-                else:
-                    error = result.get("error", "Unknown") if result else "Failed"
-                    SimpleSessionStorage.reset_session(session_id)
-                    print(f"ERROR FAILED: {error}", flush=True)
-                    return f"Post failed: {error}"
-            else:
-                SimpleSessionStorage.reset_session(session_id)
-                print("WARN AI returned empty tweet", flush=True)
-                return "No valid tweet content"
+            # AI extraction and posting run in the job pipeline
+            return queue_post(session_id, uid, accumulated)
         else:
             # Still collecting (need segment 2 or 3)
             SimpleSessionStorage.update_session(
@@ -1153,6 +1196,10 @@ async def test_interface():
                             } else if (data.message) {
                                 setStatus(data.message, 'recording');
                                 addLog(data.message);
+                            } else if (data.job_id) {
+                                setStatus('Posting...', 'recording');
+                                addLog('Queued post job ' + data.job_id);
+                                pollJob(data.job_id);
                             } else {
                                 setStatus('Listening...', 'recording');
                                 addLog('Listening...');
@@ -1167,6 +1214,24 @@ async def test_interface():
                     }
                 }
                 
+                async function pollJob(jobId) {
+                    for (let i = 0; i < 60; i++) {
+                        await new Promise(resolve => setTimeout(resolve, 1000));
+                        const response = await fetch(`/jobs/${jobId}`);
+                        if (!response.ok) return;
+                        const job = await response.json();
+                        if (job.status === 'posted') {
+                            setStatus(job.message, 'success');
+                            addLog(job.message, 'success');
+                            return;
+                        } else if (job.status === 'failed' || job.status === 'empty') {
+                            setStatus(job.message, 'error');
+                            addLog(job.message, 'error');
+                            return;
+                        }
+                    }
+                }
+                
                 function useExample(element) {
                     document.getElementById('voiceInput').value = element.textContent.trim();
                     addLog('Loaded example: "' + element.textContent.trim() + '"');
@@ -1193,6 +1258,34 @@ async def health_check():
     return {"status": "healthy", "service": "omi-x-integration"}
 
 
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Status of a queued extract-and-post job (job_id from the webhook response)."""
+    job = await post_jobs.fetch(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.done:
+        # Seen by the poller; don't repeat it on the next webhook response
+        post_jobs.ack(job)
+    return job.to_dict()
+
+
+@app.get("/metrics")
+async def metrics():
+    """Storage flush metrics, token refresh, post job and completeness counters, event-loop lag."""
+    return {
+        "storage": get_storage_metrics(),
+        "token_refresh": {**token_refresher.metrics, **refresh_scheduler.snapshot()},
+        "post_jobs": post_jobs.snapshot(),
+        "session_locks": session_locks.snapshot(),
+        "session_leases": session_leases.snapshot(),
+        "phrase_streams": phrase_streams.snapshot(),
+        "phrases": phrase_registry.snapshot(),
+        "completeness": TweetDetector.completeness.snapshot(),
+        "event_loop": loop_monitor.snapshot()
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("APP_PORT", 8000))
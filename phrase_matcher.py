@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-phrase matching with an Aho-Corasick automaton.
+All phrases (trigger and end phrases alike) are compiled once into one
+trie: a regex built from it finds every position where a phrase starts in one
+C-level pass, and the trie lists the phrases starting there, overlapping ones
+included. Scan results are cached per text, so the
+detector's checks on the same segment text share one scan. PhraseStreams
+carries the automaton state across chunks (webhook calls) of one session.
+Text and phrases are normalized (text_normalizer) before matching; match
+positions refer to the normalized text and map back with source_span().
+"""
+import os
+import re
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from text_normalizer import KATAKANA_OFFSET, NormalizedText, fold_kana, normalize
+
+# Scan results kept per matcher (one webhook's text is checked several times)
+SCAN_CACHE_SIZE = 64
+# Streams (e.g. sessions) whose scan state is kept between chunks
+PHRASE_STREAMS_MAX = int(os.getenv("PHRASE_STREAMS_MAX", "10000"))
+
+
+@dataclass(slots=True, frozen=True)
+class PhraseMatch:
+    """One phrase occurrence; start/end index into the normalized text"""
+
+    start: int
+    end: int
+    phrase: str
+    kind: str
+
+
+class ScanResult:
+    """All phrase occurrences in one text, in order of end position"""
+
+    __slots__ = ("matches", "kinds", "normalized")
+
+    def __init__(self, matches: List[PhraseMatch], normalized: Optional[NormalizedText] = None):
+        self.matches = matches
+        self.kinds = {match.kind for match in matches}
+        self.normalized = normalized
+
+    def source_span(self, match: PhraseMatch) -> Tuple[int, int]:
+        """(start, end) of a match in the original text; start is 0 for a match
+        that began in an earlier chunk."""
+        return self.normalized.to_source(max(match.start, 0), match.end)
+
+    @property
+    def length(self) -> int:
+        """Length of the normalized text (where an end phrase at the very end ends)."""
+        return len(self.normalized.text) if self.normalized is not None else 0
+
+    def has(self, kind: str) -> bool:
+        return kind in self.kinds
+
+    def first(self, kind: str) -> Optional[PhraseMatch]:
+        """Earliest occurrence of a kind; the longest phrase if several start there."""
+        best = None
+        for match in self.matches:
+            if match.kind != kind:
+                continue
+            if best is None or (match.start, -match.end) < (best.start, -best.end):
+                best = match
+        return best
+
+    def ending_at(self, kind: str, end: int, not_before: int = 0) -> Optional[PhraseMatch]:
+        """Longest occurrence of a kind that ends exactly at end and starts at or after not_before."""
+        best = None
+        for match in self.matches:
+            if match.kind == kind and match.end == end and match.start >= not_before:
+                if best is None or match.start < best.start:
+                    best = match
+        return best
+
+
+# Shared result for the common case of text without any phrase
+NO_MATCHES = ScanResult([])
+
+
+def _katakana(ch: str) -> str:
+    """Katakana for a hiragana character, else ""."""
+    return chr(ord(ch) + KATAKANA_OFFSET) if "\u3041" <= ch <= "\u3096" else ""
+
+
+class PhraseMatcher:
+    """Aho-Corasick automaton over normalized phrases, grouped by kind"""
+
+    def __init__(self, phrases: Dict[str, Iterable[str]]):
+        self._phrases: List[Tuple[str, str]] = []  # (phrase, kind)
+        goto: List[Dict[str, int]] = [{}]
+        terminal: List[bool] = [False]
+        outputs: List[Tuple[int, ...]] = [()]
+        for kind, group in phrases.items():
+            # Spelling variants collapse to one canonical phrase
+            for phrase in dict.fromkeys(fold_kana(normalize(phrase).text) for phrase in group):
+                if not phrase:
+                    continue
+                state = 0
+                for ch in phrase:
+                    nxt = goto[state].get(ch)
+                    if nxt is None:
+                        nxt = len(goto)
+                        goto[state][ch] = nxt
+                        goto.append({})
+                        terminal.append(False)
+                        outputs.append(())
+                    state = nxt
+                terminal[state] = True
+                outputs[state] += (len(self._phrases),)
+                self._phrases.append((phrase, kind))
+        # Phrases ending exactly at each trie node (before outputs are merged below)
+        self._ends = list(outputs)
+        # ASCII text can only contain the ASCII phrases, spelled exactly
+        self._ascii_phrases = [
+            (phrase, kind) for phrase, kind in self._phrases if phrase.isascii()
+        ]
+
+        # Failure links (breadth first), merging each state's outputs with
+        # those of its failure state
+        fail = [0] * len(goto)
+        order = [0]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0) if state else 0
+                outputs[nxt] += outputs[fail[nxt]]
+
+        # Full transition table, so scanning never walks failure links;
+        # characters missing from a state's table go back to the root.
+        # Built breadth first: a failure state is always shallower
+        self._delta: List[Dict[str, int]] = [{}] * len(goto)
+        for state in order:
+            row = dict(goto[state])
+            if state:
+                for ch, nxt in self._delta[fail[state]].items():
+                    row.setdefault(ch, nxt)
+            self._delta[state] = row
+        self._trie = [dict(row) for row in goto]
+        # Katakana steps like the matching hiragana
+        for row in self._delta + self._trie:
+            for ch, nxt in list(row.items()):
+                kana = _katakana(ch)
+                if kana:
+                    row[kana] = nxt
+        self._outputs = outputs
+        self.max_length = max((len(phrase) for phrase, _ in self._phrases), default=0)
+
+        # A regex built from the same trie finds each position where a whole
+        # phrase starts in C; only there is the trie walked in Python
+        pattern = self._trie_pattern(goto, terminal, 0)
+        self._skip = re.compile(pattern) if pattern else None
+        self._cache: "OrderedDict[str, ScanResult]" = OrderedDict()
+
+    @classmethod
+    def _trie_pattern(cls, goto: List[Dict[str, int]], terminal: List[bool], state: int) -> str:
+        branches = []
+        for ch, nxt in sorted(goto[state].items()):
+            rest = cls._trie_pattern(goto, terminal, nxt)
+            kana = _katakana(ch)
+            if not kana:
+                branches.append(re.escape(ch) + rest)
+            elif state:
+                branches.append(f"[{ch}{kana}]" + rest)
+            else:
+                # Literal first characters keep sre's first-character prefilter
+                branches.extend((ch + rest, kana + rest))
+        if not branches:
+            return ""
+        if not state:
+            # Top-level alternation: sre prefilters it on the set of first characters
+            return "|".join(branches)
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if terminal[state]:
+            body = "(?:" + body + ")?"
+        return body
+
+    def scan(self, text: str) -> ScanResult:
+        """Every phrase occurrence in text (cached per text)."""
+        result = self._cache.get(text)
+        if result is not None:
+            self._cache.move_to_end(text)
+            return result
+        normalized = normalize(text)
+        matches = self._scan(normalized.text)
+        result = ScanResult(matches, normalized) if matches else NO_MATCHES
+        self._cache[text] = result
+        if len(self._cache) > SCAN_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return result
+
+    def feed(self, state: int, folded: str, offset: int = 0) -> Tuple[List[PhraseMatch], int]:
+        """Continue a scan in state over folded text; returns (matches, new state).
+
+        Positions are relative to folded[offset:]; a phrase that started in
+        earlier chunks gets a negative start.
+        """
+        matches = self._scan(folded, state, offset)
+        if len(folded) >= self.max_length:
+            # The final state only depends on the last max_length characters
+            return matches, self.walk(folded[len(folded) - self.max_length:])
+        return matches, self.walk(folded, state)
+
+    def walk(self, folded: str, state: int = 0) -> int:
+        """State after folded text, ignoring matches."""
+        delta = self._delta
+        for ch in folded:
+            state = delta[state].get(ch, 0)
+        return state
+
+    def _scan(self, folded: str, state: int = 0, offset: int = 0) -> List[PhraseMatch]:
+        """Matches in folded, in order of end position; state: automaton state
+        after earlier chunks, whose phrases may end in this one."""
+        matches: List[PhraseMatch] = []
+        if self._skip is None:
+            return matches
+        phrases = self._phrases
+        if state:
+            # A phrase that started in an earlier chunk ends within max_length
+            # characters, or the automaton has gone back to the root
+            delta, outputs = self._delta, self._outputs
+            for i, ch in enumerate(folded[:self.max_length - 1]):
+                state = delta[state].get(ch, 0)
+                if not state:
+                    break
+                for index in outputs[state]:
+                    phrase, kind = phrases[index]
+                    if len(phrase) > i + 1:
+                        end = i + 1 - offset
+                        matches.append(PhraseMatch(end - len(phrase), end, phrase, kind))
+        # Every other match starts in this chunk
+        if folded.isascii():
+            # str.find per phrase (Boyer-Moore in C); the regex would try its
+            # branches at every common letter
+            for phrase, kind in self._ascii_phrases:
+                start = folded.find(phrase)
+                while start >= 0:
+                    matches.append(PhraseMatch(start - offset, start + len(phrase) - offset, phrase, kind))
+                    start = folded.find(phrase, start + 1)
+            if len(matches) > 1:
+                matches.sort(key=lambda match: (match.end, match.start))
+            return matches
+        trie, ends = self._trie, self._ends
+        n = len(folded)
+        found = self._skip.search(folded)
+        while found is not None:
+            start = found.start()
+            node = 0
+            for i in range(start, n):
+                node = trie[node].get(folded[i])
+                if node is None:
+                    break
+                for index in ends[node]:
+                    phrase, kind = phrases[index]
+                    matches.append(PhraseMatch(start - offset, i + 1 - offset, phrase, kind))
+            found = self._skip.search(folded, start + 1)
+        if len(matches) > 1:
+            # Longest first among matches with the same end, like the automaton's outputs
+            matches.sort(key=lambda match: (match.end, match.start))
+        return matches
+
+
+class PhraseStreams:
+    """Scan state per stream key, so phrases split across chunks are found.
+
+    Each key keeps its automaton state and a rolling tail of the last
+    max_length normalized characters (to rebuild the state if the matcher
+    changes); each chunk costs O(chunk). Least recently fed keys are dropped
+    beyond max_keys.
+    """
+
+    def __init__(self, max_keys: int = PHRASE_STREAMS_MAX):
+        self.max_keys = max_keys
+        self._streams: "OrderedDict[str, Tuple[PhraseMatcher, int, str]]" = OrderedDict()
+        self.metrics = {"chunks": 0, "evicted": 0}
+
+    def feed(self, key: str, matcher: PhraseMatcher, text: str) -> ScanResult:
+        """Phrases ending in text, including ones that started in earlier chunks."""
+        self.metrics["chunks"] += 1
+        normalized = normalize(text)
+        folded = normalized.text
+        entry = self._streams.pop(key, None)
+        offset = 0
+        if entry is None:
+            state, tail = 0, ""
+        else:
+            previous, state, tail = entry
+            if previous is not matcher:
+                state = matcher.walk(tail)
+            # Chunks are joined like segments, with one space (none next to Japanese)
+            if tail and folded and tail[-1].isascii() and folded[0].isascii():
+                folded = " " + folded
+                offset = 1
+        matches, state = matcher.feed(state, folded, offset)
+        self._streams[key] = (matcher, state, (tail + folded)[-matcher.max_length:])
+        if len(self._streams) > self.max_keys:
+            self._streams.popitem(last=False)
+            self.metrics["evicted"] += 1
+        return ScanResult(matches, normalized) if matches else NO_MATCHES
+
+    def reset(self, key: str):
+        self._streams.pop(key, None)
+
+    def snapshot(self) -> dict:
+        return {**self.metrics, "streams": len(self._streams)}
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Trigger and end phrase sets per user and per locale.
+Sets come from PHRASES_FILE (JSON, see phrases.example.json), which is
+re-read when its mtime changes, so phrases can be edited without a restart.
+Compiled matchers are cached by a hash of the normalized phrase set: users
+and locales with the same phrases share one automaton, and a reload only
+compiles sets that actually changed.
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+import orjson
+
+from app_logging import get_logger
+from phrase_matcher import PhraseMatcher
+from text_normalizer import fold_kana, normalize
+
+# Relative paths are resolved next to this file
+PHRASES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.getenv("PHRASES_FILE", "phrases.json"))
+# Seconds between mtime checks of PHRASES_FILE
+PHRASES_RELOAD_INTERVAL = float(os.getenv("PHRASES_RELOAD_INTERVAL", "5"))
+# Locale for users without one in PHRASES_FILE (overrides the file's "default_locale")
+PHRASES_DEFAULT_LOCALE = os.getenv("PHRASES_DEFAULT_LOCALE", "")
+# Distinct compiled phrase sets kept
+PHRASE_MATCHER_CACHE_SIZE = int(os.getenv("PHRASE_MATCHER_CACHE_SIZE", "64"))
+
+log = get_logger("phrases")
+
+PHRASE_KINDS = ("trigger", "end")
+
+
+def phrase_set_hash(phrases: Dict[str, Iterable[str]]) -> str:
+    """Hash of a phrase set after normalization (spelling variants hash alike)."""
+    canonical = {
+        kind: sorted({fold_kana(normalize(phrase).text) for phrase in phrases.get(kind, ())})
+        for kind in PHRASE_KINDS
+    }
+    return hashlib.sha1(orjson.dumps(canonical, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def _validate_entry(entry, where: str):
+    if not isinstance(entry, dict):
+        raise ValueError(f"{where} must be an object")
+    if not isinstance(entry.get("locale", ""), str):
+        raise ValueError(f'{where}: "locale" must be a string')
+    for kind in PHRASE_KINDS:
+        phrases = entry.get(kind, [])
+        if not isinstance(phrases, list) or not all(isinstance(phrase, str) for phrase in phrases):
+            raise ValueError(f'{where}: "{kind}" must be a list of strings')
+
+
+def _validate(config):
+    """Raise ValueError unless config has the shape of phrases.example.json."""
+    if not isinstance(config, dict):
+        raise ValueError("top level must be an object")
+    if not isinstance(config.get("default_locale", ""), str):
+        raise ValueError('"default_locale" must be a string')
+    _validate_entry(config.get("default", {}), '"default"')
+    for section in ("users", "locales"):
+        entries = config.get(section, {})
+        if not isinstance(entries, dict):
+            raise ValueError(f'"{section}" must be an object')
+        for name, entry in entries.items():
+            _validate_entry(entry, f'{section}["{name}"]')
+
+
+class PhraseRegistry:
+    """Resolve and cache the phrase matcher for a user.
+
+    Lookup order per kind: the user's entry, the user's locale (or the
+    default locale), the file's "default" entry, then the built-in phrases.
+    """
+
+    def __init__(
+        self,
+        defaults: Dict[str, Iterable[str]],
+        path: str = PHRASES_FILE,
+        reload_interval: float = PHRASES_RELOAD_INTERVAL
+    ):
+        self.defaults = {kind: list(phrases) for kind, phrases in defaults.items()}
+        self.path = path
+        self.reload_interval = reload_interval
+        self._config: dict = {}
+        self._mtime: Optional[int] = None
+        self._checked_at = float("-inf")
+        self._matchers: "OrderedDict[str, PhraseMatcher]" = OrderedDict()  # phrase-set hash -> matcher
+        self._resolved: Dict[Optional[str], PhraseMatcher] = {}  # uid or locale key -> matcher
+        self.metrics = {"reloads": 0, "reload_errors": 0, "compiled": 0}
+
+    def matcher_for(self, uid: Optional[str] = None, locale: Optional[str] = None) -> PhraseMatcher:
+        """Matcher for a user's phrase set (uid None: the default set)."""
+        self._maybe_reload()
+        user = self._config.get("users", {}).get(uid) if uid else None
+        if user is None and locale is None:
+            # Users without their own entry share the default locale's matcher
+            key = None
+        else:
+            key = f"{uid}\0{locale}"
+        matcher = self._resolved.get(key)
+        if matcher is None:
+            matcher = self._compile(self._phrase_set(user, locale))
+            self._resolved[key] = matcher
+        return matcher
+
+    def snapshot(self) -> dict:
+        return {**self.metrics, "phrase_sets": len(self._matchers), "file_loaded": self._mtime is not None}
+
+    def _phrase_set(self, user: Optional[dict], locale: Optional[str]) -> Dict[str, list]:
+        config = self._config
+        locale = (
+            locale
+            or (user or {}).get("locale")
+            or PHRASES_DEFAULT_LOCALE
+            or config.get("default_locale")
+        )
+        layers = [user, config.get("locales", {}).get(locale), config.get("default"), self.defaults]
+        phrases = {}
+        for kind in PHRASE_KINDS:
+            phrases[kind] = []
+            for layer in layers:
+                found = layer.get(kind) if layer else None
+                if found:
+                    phrases[kind] = list(found)
+                    break
+        return phrases
+
+    def _compile(self, phrases: Dict[str, list]) -> PhraseMatcher:
+        digest = phrase_set_hash(phrases)
+        matcher = self._matchers.get(digest)
+        if matcher is not None:
+            self._matchers.move_to_end(digest)
+            return matcher
+        matcher = PhraseMatcher(phrases)
+        self.metrics["compiled"] += 1
+        self._matchers[digest] = matcher
+        if len(self._matchers) > PHRASE_MATCHER_CACHE_SIZE:
+            self._matchers.popitem(last=False)
+        return matcher
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        if mtime is None:
+            config = {}
+        else:
+            try:
+                with open(self.path, "rb") as f:
+                    config = orjson.loads(f.read())
+                _validate(config)
+            except (OSError, ValueError) as e:
+                # Keep serving the previous phrases until the file is fixed
+                self.metrics["reload_errors"] += 1
+                log.error("Ignoring invalid phrases file %s: %s", self.path, e)
+                return
+        self._config = config
+        self._resolved.clear()
+        self.metrics["reloads"] += 1
+        log.info("Loaded phrase sets from %s (%d users, %d locales)",
+                 self.path, len(config.get("users", {})), len(config.get("locales", {})))
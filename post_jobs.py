@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+In-process job pipeline for tweet extraction (Gemini) and posting (X).
+The webhook enqueues a job and returns immediately; a small worker pool does
+the slow network work. Results are handed back on the session's next webhook
+response or polled via /jobs/{job_id}. Jobs run in this process; in shared
+mode their status also goes to storage, so any worker can report it.
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from app_logging import get_logger
+
+POST_WORKERS = int(os.getenv("POST_WORKERS", "4"))
+POST_QUEUE_MAX = int(os.getenv("POST_QUEUE_MAX", "100"))
+# Finished jobs stay pollable for this many seconds
+POST_JOB_RESULT_TTL = float(os.getenv("POST_JOB_RESULT_TTL", "600"))
+# Seconds to let queued jobs finish on shutdown
+POST_JOB_DRAIN_TIMEOUT = float(os.getenv("POST_JOB_DRAIN_TIMEOUT", "10"))
+
+log = get_logger("jobs")
+
+# Final states worth telling the user about on the next webhook response
+NOTIFY_STATUSES = ("posted", "failed")
+
+
+@dataclass(slots=True)
+class PostJob:
+    """One extract-and-post request"""
+
+    job_id: str
+    uid: str
+    session_id: str
+    text: str
+    status: str = "queued"  # queued / running / posted / failed / empty
+    message: str = ""
+    created_at: float = 0.0
+    started_at: float = 0.0
+    finished_at: float = 0.0
+
+    @property
+    def done(self) -> bool:
+        return self.finished_at > 0
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "message": self.message,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at or None,
+        }
+
+    def to_record(self) -> dict:
+        """Stored form (shared mode); the text and uid stay in this process."""
+        return {**self.to_dict(), "session_id": self.session_id}
+
+    @classmethod
+    def from_record(cls, data: dict) -> "PostJob":
+        return cls(
+            job_id=data["job_id"],
+            uid="",
+            session_id=data.get("session_id", ""),
+            text="",
+            status=data.get("status", "queued"),
+            message=data.get("message", ""),
+            created_at=float(data.get("created_at") or 0),
+            finished_at=float(data.get("finished_at") or 0)
+        )
+
+
+# Returns (status, message) for a job
+JobHandler = Callable[[PostJob], Awaitable[Tuple[str, str]]]
+
+
+class PostJobQueue:
+    """Bounded job queue drained by a fixed pool of worker tasks"""
+
+    def __init__(
+        self,
+        handler: JobHandler,
+        workers: int = POST_WORKERS,
+        maxsize: int = POST_QUEUE_MAX,
+        result_ttl: float = POST_JOB_RESULT_TTL,
+        store: Any = None
+    ):
+        self.handler = handler
+        # Shared mode: job status storage (simple_storage.PostJobStorage), read
+        # when the next webhook or /jobs poll reaches another worker
+        self.store = store
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self._queue: "asyncio.Queue[PostJob]" = asyncio.Queue(maxsize=maxsize)
+        self._jobs: "OrderedDict[str, PostJob]" = OrderedDict()  # oldest first
+        self._undelivered: Dict[str, str] = {}  # session_id -> finished job_id
+        self._tasks: Set[asyncio.Task] = set()
+        self.metrics = {
+            "submitted": 0,
+            "rejected": 0,
+            "posted": 0,
+            "failed": 0,
+            "empty": 0,
+            "running": 0,
+            "last_wait_ms": 0.0,
+            "max_wait_ms": 0.0,
+            "last_run_ms": 0.0,
+            "max_run_ms": 0.0,
+        }
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        while len(self._tasks) < self.workers:
+            task = loop.create_task(self._worker())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def close(self):
+        """Let queued and running jobs finish (up to POST_JOB_DRAIN_TIMEOUT), then stop the workers."""
+        if self._tasks:
+            # join() also waits for jobs already taken off the queue
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=POST_JOB_DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                log.warning(
+                    "Dropping %d post jobs on shutdown",
+                    self._queue.qsize() + self.metrics["running"]
+                )
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def submit(self, uid: str, session_id: str, text: str) -> Optional[PostJob]:
+        """Queue a job; None when the queue is full."""
+        self._purge()
+        job = PostJob(
+            job_id=uuid.uuid4().hex,
+            uid=uid,
+            session_id=session_id,
+            text=text,
+            created_at=time.time()
+        )
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.metrics["rejected"] += 1
+            return None
+        self._jobs[job.job_id] = job
+        self.metrics["submitted"] += 1
+        self._publish(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[PostJob]:
+        self._purge()
+        return self._jobs.get(job_id)
+
+    async def fetch(self, job_id: str) -> Optional[PostJob]:
+        """Job by id, read from storage if another worker ran it."""
+        job = self.get(job_id)
+        if job is None and self.store is not None:
+            data = await self.store.load_job(job_id)
+            job = PostJob.from_record(data) if data else None
+        return job
+
+    async def take_result(self, session_id: str) -> Optional[PostJob]:
+        """Finished job for this session not yet reported to the user (reported once)."""
+        if self.store is not None:
+            data = await self.store.take_job_result(session_id)
+            return PostJob.from_record(data) if data else None
+        job_id = self._undelivered.pop(session_id, None)
+        return self._jobs.get(job_id) if job_id else None
+
+    def ack(self, job: PostJob):
+        """Mark a finished job as reported."""
+        if self.store is not None:
+            self.store.ack_job_result(job.session_id, job.job_id)
+        self._forget(job)
+
+    def snapshot(self) -> dict:
+        return {**self.metrics, "queued": self._queue.qsize(), "tracked_jobs": len(self._jobs)}
+
+    def _purge(self):
+        cutoff = time.time() - self.result_ttl
+        while self._jobs:
+            job = next(iter(self._jobs.values()))
+            if not job.done or job.finished_at > cutoff:
+                break
+            self._jobs.popitem(last=False)
+            self._forget(job)
+
+    def _forget(self, job: PostJob):
+        if self._undelivered.get(job.session_id) == job.job_id:
+            del self._undelivered[job.session_id]
+
+    def _publish(self, job: PostJob):
+        if self.store is not None:
+            self.store.save_job(job.to_record(), job.status in NOTIFY_STATUSES, self.result_ttl)
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: PostJob):
+        job.status = "running"
+        job.started_at = time.time()
+        wait_ms = (job.started_at - job.created_at) * 1000
+        self.metrics["last_wait_ms"] = round(wait_ms, 3)
+        self.metrics["max_wait_ms"] = max(self.metrics["max_wait_ms"], round(wait_ms, 3))
+        self.metrics["running"] += 1
+        self._publish(job)
+        try:
+            job.status, job.message = await self.handler(job)
+        except Exception as e:
+            log.error("Post job %s failed: %s", job.job_id, e)
+            job.status, job.message = "failed", f"Post failed: {e}"
+        finally:
+            self.metrics["running"] -= 1
+        job.finished_at = time.time()
+        run_ms = (job.finished_at - job.started_at) * 1000
+        self.metrics["last_run_ms"] = round(run_ms, 3)
+        self.metrics["max_run_ms"] = max(self.metrics["max_run_ms"], round(run_ms, 3))
+        if job.status in self.metrics:
+            self.metrics[job.status] += 1
+        self._publish(job)
+        if job.status in NOTIFY_STATUSES and self.store is None:
+            self._undelivered[job.session_id] = job.job_id
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Typed user and session records.
+Timestamps are epoch seconds parsed once on load; dicts only exist at the
+persistence boundary (to_dict / from_dict).
+"""
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Optional
+import time
+
+
+def to_epoch(value: Any) -> float:
+    """Epoch seconds from a stored timestamp (number, numeric string or naive-UTC ISO string)."""
+    if value is None or value == "":
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+
+
+@dataclass(slots=True)
+class UserRecord:
+    """OAuth tokens of one OMI user"""
+
+    uid: str
+    access_token: Optional[str]
+    refresh_token: Optional[str]
+    expires_at: float
+    created_at: float
+
+    def to_dict(self) -> dict:
+        return {
+            "uid": self.uid,
+            "access_token": self.access_token,
+            "refresh_token": self.refresh_token,
+            "expires_at": self.expires_at,
+            "created_at": self.created_at
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "UserRecord":
+        return cls(
+            uid=data["uid"],
+            access_token=data.get("access_token"),
+            refresh_token=data.get("refresh_token"),
+            expires_at=to_epoch(data.get("expires_at")),
+            created_at=to_epoch(data.get("created_at"))
+        )
+
+
+@dataclass(slots=True)
+class SessionRecord:
+    """Tweet collection state of one OMI session"""
+
+    session_id: str
+    uid: str
+    tweet_mode: str = "idle"  # idle, recording
+    segments_count: int = 0
+    accumulated_text: str = ""
+    created_at: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "uid": self.uid,
+            "tweet_mode": self.tweet_mode,
+            "segments_count": self.segments_count,
+            "accumulated_text": self.accumulated_text,
+            "created_at": self.created_at
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SessionRecord":
+        return cls(
+            session_id=data["session_id"],
+            uid=data.get("uid", ""),
+            tweet_mode=data.get("tweet_mode") or "idle",
+            segments_count=data.get("segments_count") or 0,
+            accumulated_text=data.get("accumulated_text") or "",
+            created_at=to_epoch(data.get("created_at"))
+        )
+
+    @classmethod
+    def new(cls, session_id: str, uid: str) -> "SessionRecord":
+        return cls(session_id=session_id, uid=uid, created_at=time.time())
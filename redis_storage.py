@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+"""
+Redis-protocol backend for simple_storage (enable with REDIS_URL=redis://host:6379/0).
+Users and sessions are hashes, sessions expire after SESSION_IDLE_TTL and OAuth
+state after OAUTH_STATE_TTL. Speaks RESP directly over asyncio streams, so it
+works with Redis, Valkey, KeyDB or any local fake server that implements the
+handful of commands used here (plus EVAL for leases).
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+import asyncio
+import json
+import os
+import time
+
+from app_logging import get_logger
+from records import SessionRecord, UserRecord
+from storage_backend import StorageBackend
+
+log = get_logger("storage")
+
+KEY_PREFIX = "omi:"
+# Sorted set of uid -> expires_at, so the refresh scheduler can find expiring users
+USER_EXPIRY_KEY = f"{KEY_PREFIX}user_expiry"
+
+# A pipeline that failed on the connection is resent after this many seconds,
+# doubling up to REDIS_RETRY_MAX_DELAY
+REDIS_RETRY_DELAY = 0.05
+REDIS_RETRY_MAX_DELAY = float(os.getenv("REDIS_RETRY_MAX_DELAY", "5"))
+_TRANSIENT_ERRORS = (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError)
+
+# Leases: compare-and-set on the owner, so a holder never extends or deletes
+# a lease that has passed to someone else
+ACQUIRE_LEASE_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then return 1 end
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+# Compare-and-delete: releases a lease, acks a job result only if it is still the latest
+DELETE_IF_EQUAL_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+
+class RespError(Exception):
+    """Error reply from the server"""
+
+
+def _encode(command: Tuple[Any, ...]) -> bytes:
+    parts = [b"*%d\r\n" % len(command)]
+    for arg in command:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+class RespClient:
+    """Minimal async RESP2 client: one connection, pipelined commands"""
+
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        setup = []
+        if self.password:
+            setup.append(("AUTH", self.password))
+        if self.db:
+            setup.append(("SELECT", self.db))
+        for reply in await self._send(setup):
+            if isinstance(reply, RespError):
+                raise reply
+
+    async def pipeline(self, commands: List[Tuple[Any, ...]]) -> List[Any]:
+        """Send all commands in one write and read their replies in order.
+
+        Error replies are returned in place (as RespError) so one failing
+        command does not desynchronize the rest of the pipeline.
+        """
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await self._connect()
+                return await self._send(commands)
+            except (OSError, asyncio.IncompleteReadError):
+                await self.close()
+                raise
+
+    async def execute(self, *command: Any) -> Any:
+        reply = (await self.pipeline([command]))[0]
+        if isinstance(reply, RespError):
+            raise reply
+        return reply
+
+    async def _send(self, commands: List[Tuple[Any, ...]]) -> List[Any]:
+        if not commands:
+            return []
+        self._writer.write(b"".join(_encode(command) for command in commands))
+        await self._writer.drain()
+        return [await self._read_reply() for _ in commands]
+
+    async def _read_reply(self) -> Any:
+        line = await self._reader.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection closed by server")
+        prefix, rest = line[:1], line[1:-2]
+        if prefix == b"+":
+            return rest.decode("utf-8")
+        if prefix == b"-":
+            return RespError(rest.decode("utf-8"))
+        if prefix == b":":
+            return int(rest)
+        if prefix == b"$":
+            length = int(rest)
+            if length == -1:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2].decode("utf-8")
+        if prefix == b"*":
+            length = int(rest)
+            if length == -1:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply: {line[:20]!r}")
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+        self._reader = self._writer = None
+
+
+def _user_key(uid: str) -> str:
+    return f"{KEY_PREFIX}user:{uid}"
+
+
+def _session_key(session_id: str) -> str:
+    return f"{KEY_PREFIX}session:{session_id}"
+
+
+def _oauth_key(state: str) -> str:
+    return f"{KEY_PREFIX}oauth:{state}"
+
+
+def _lease_key(name: str) -> str:
+    return f"{KEY_PREFIX}lease:{name}"
+
+
+def _job_key(job_id: str) -> str:
+    return f"{KEY_PREFIX}job:{job_id}"
+
+
+def _job_result_key(session_id: str) -> str:
+    # job_id of the session's latest unreported result
+    return f"{KEY_PREFIX}job_result:{session_id}"
+
+
+def _hash_to_dict(reply: Optional[List[str]]) -> Dict[str, str]:
+    reply = reply or []
+    return dict(zip(reply[::2], reply[1::2]))
+
+
+def _flatten(fields: Dict[str, Any]) -> List[Any]:
+    flat: List[Any] = []
+    for field, value in fields.items():
+        # Hashes cannot hold nulls; "" reads back as None
+        flat.extend((field, "" if value is None else value))
+    return flat
+
+
+class RedisBackend(StorageBackend):
+    """Keep users, sessions and OAuth state in a Redis-protocol server"""
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: str, session_ttl: float, oauth_ttl: float):
+        super().__init__()
+        self.url = url
+        self.session_ttl = int(session_ttl)
+        self.oauth_ttl = int(oauth_ttl)
+        self._client = RespClient(url)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._writer_task: Optional[asyncio.Task] = None
+        self.metrics["write_retries"] = 0
+
+    async def load_user(self, uid: str) -> Optional[UserRecord]:
+        data = _hash_to_dict(await self._read(("HGETALL", _user_key(uid))))
+        if not data:
+            return None
+        return UserRecord(
+            uid=uid,
+            access_token=data.get("access_token") or None,
+            refresh_token=data.get("refresh_token") or None,
+            expires_at=float(data.get("expires_at") or 0),
+            created_at=float(data.get("created_at") or 0)
+        )
+
+    async def load_expiring_users(self, before: float) -> List[UserRecord]:
+        # Users saved before the expiry index existed are indexed on their next save
+        uids = await self._read(("ZRANGEBYSCORE", USER_EXPIRY_KEY, "-inf", f"({before}"))
+        loaded = await asyncio.gather(*(self.load_user(uid) for uid in uids or []))
+        return [user for user in loaded if user is not None and user.refresh_token]
+
+    async def load_session(self, session_id: str) -> Optional[SessionRecord]:
+        data = _hash_to_dict(await self._read(("HGETALL", _session_key(session_id))))
+        if not data:
+            return None
+        return SessionRecord(
+            session_id=session_id,
+            uid=data.get("uid", ""),
+            tweet_mode=data.get("tweet_mode") or "idle",
+            segments_count=int(data.get("segments_count") or 0),
+            accumulated_text=data.get("accumulated_text", ""),
+            created_at=float(data.get("created_at") or 0)
+        )
+
+    async def load_oauth_state(self, state: str) -> Optional[dict]:
+        value = await self._read(("GET", _oauth_key(state)))
+        return json.loads(value) if value else None
+
+    def save_user(self, uid: str, user: UserRecord):
+        # Every field is written, so no DEL first (a reader in between would see no user)
+        self._submit(("HSET", _user_key(uid), *_flatten(user.to_dict())))
+        self._submit(("ZADD", USER_EXPIRY_KEY, user.expires_at, uid))
+
+    def delete_user(self, uid: str):
+        self._submit(("DEL", _user_key(uid)))
+        self._submit(("ZREM", USER_EXPIRY_KEY, uid))
+
+    def save_session(self, session_id: str, session: SessionRecord):
+        self._write_session_fields(session_id, session.to_dict())
+
+    def update_session(self, session_id: str, fields: dict, session: SessionRecord):
+        # Only the changed fields; HSET + EXPIRE go out in the same pipeline
+        self._write_session_fields(session_id, fields)
+
+    def delete_session(self, session_id: str):
+        self._submit(("DEL", _session_key(session_id)))
+
+    def save_oauth_state(self, state: str, data: dict):
+        self._submit(("SET", _oauth_key(state), json.dumps(data), "EX", self.oauth_ttl))
+
+    def delete_oauth_state(self, state: str):
+        self._submit(("DEL", _oauth_key(state)))
+
+    def save_job(self, job: dict, notify: bool, ttl: float):
+        key = _job_key(job["job_id"])
+        self._submit(("HSET", key, *_flatten(job)))
+        self._submit(("EXPIRE", key, int(ttl)))
+        if notify:
+            self._submit(("SET", _job_result_key(job["session_id"]), job["job_id"], "EX", int(ttl)))
+
+    async def load_job(self, job_id: str) -> Optional[dict]:
+        data = _hash_to_dict(await self._read(("HGETALL", _job_key(job_id))))
+        if not data:
+            return None
+        return {
+            **data,
+            "created_at": float(data.get("created_at") or 0),
+            "finished_at": float(data.get("finished_at") or 0) or None,
+        }
+
+    async def take_job_result(self, session_id: str) -> Optional[dict]:
+        # GETDEL: of two workers taking at once, only one gets the job_id
+        job_id = await self._read(("GETDEL", _job_result_key(session_id)))
+        return await self.load_job(job_id) if job_id else None
+
+    def ack_job_result(self, session_id: str, job_id: str):
+        self._submit(("EVAL", DELETE_IF_EQUAL_SCRIPT, 1, _job_result_key(session_id), job_id))
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        reply = await self._read(("EVAL", ACQUIRE_LEASE_SCRIPT, 1, _lease_key(name), owner, int(ttl * 1000)))
+        return reply == 1
+
+    async def release_lease(self, name: str, owner: str):
+        # Queued behind this holder's writes, so the next holder reads them
+        self._submit(("EVAL", DELETE_IF_EQUAL_SCRIPT, 1, _lease_key(name), owner))
+
+    def start(self):
+        self._ensure_writer()
+
+    async def close(self):
+        if self._writer_task is not None:
+            await self._queue.join()
+            self._writer_task.cancel()
+            self._writer_task = None
+        await self._client.close()
+
+    def _write_session_fields(self, session_id: str, fields: dict):
+        key = _session_key(session_id)
+        self._submit(("HSET", key, *_flatten(fields)))
+        # Idle sessions expire on the server; every write pushes the deadline out
+        self._submit(("EXPIRE", key, self.session_ttl))
+
+    def _submit(self, command: Tuple[Any, ...]):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Scripts without an event loop: one blocking round trip
+            asyncio.run(self._execute_once(command))
+            return
+        self._queue.put_nowait((command, None))
+        self._ensure_writer()
+
+    async def _execute_once(self, command: Tuple[Any, ...]):
+        client = RespClient(self.url)
+        try:
+            await client.execute(*command)
+        finally:
+            await client.close()
+
+    async def _read(self, command: Tuple[Any, ...]) -> Any:
+        """Run a read after every queued write, in the same pipeline."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((command, waiter))
+        self._ensure_writer()
+        return await waiter
+
+    def _ensure_writer(self):
+        if self._writer_task is None:
+            self._writer_task = asyncio.get_running_loop().create_task(self._run_writer())
+
+    async def _run_writer(self):
+        while True:
+            batch = [await self._queue.get()]
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._apply(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _apply(self, batch: List[Tuple[Tuple[Any, ...], Optional[asyncio.Future]]]):
+        """Send a batch as one pipeline, resending its writes until the server has them.
+
+        Later writes stay queued behind it, so they are applied in order.
+        """
+        delay = REDIS_RETRY_DELAY
+        while True:
+            started = time.perf_counter()
+            try:
+                replies = await self._client.pipeline([command for command, _ in batch])
+                break
+            except _TRANSIENT_ERRORS as e:
+                # Readers get the error now; writes are resent. Every write used
+                # here is idempotent, so replaying a partly applied pipeline is safe
+                self._fail_readers(batch, e)
+                batch = [item for item in batch if item[1] is None]
+                if not batch:
+                    return
+                self.metrics["write_retries"] += 1
+                log.warning("Redis pipeline failed, retrying %d writes: %s", len(batch), e)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, REDIS_RETRY_MAX_DELAY)
+            except Exception as e:
+                self.metrics["flush_errors"] += 1
+                log.warning("Redis pipeline failed: %s", e)
+                self._fail_readers(batch, e)
+                return
+        writes = 0
+        for (command, waiter), reply in zip(batch, replies):
+            if waiter is None:
+                writes += 1
+                if isinstance(reply, RespError):
+                    self.metrics["flush_errors"] += 1
+                    log.warning("Redis %s failed: %s", command[0], reply)
+            elif waiter.done():
+                # The reader was cancelled while it waited
+                continue
+            elif isinstance(reply, RespError):
+                waiter.set_exception(reply)
+            else:
+                waiter.set_result(reply)
+        if writes:
+            self._record_flush(started, writes)
+
+    @staticmethod
+    def _fail_readers(batch: List[Tuple[Tuple[Any, ...], Optional[asyncio.Future]]], error: Exception):
+        for _, waiter in batch:
+            if waiter is not None and not waiter.done():
+                waiter.set_exception(error)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Typed transcript segments and fast /webhook payload decoding.
+OMI posts either a bare list of segments or {"session_id": ..., "segments": [...]};
+the body is decoded once with orjson into slotted Segment records.
+"""
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import orjson
+
+
+@dataclass(slots=True)
+class Segment:
+    """One transcript segment from OMI"""
+
+    text: str
+    speaker: str = ""
+    speaker_id: int = 0
+    is_user: bool = False
+    start: float = 0.0
+    end: float = 0.0
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Segment":
+        return cls(
+            text=data.get("text") or "",
+            speaker=data.get("speaker") or "",
+            speaker_id=data.get("speaker_id", data.get("speakerId")) or 0,
+            is_user=bool(data.get("is_user")),
+            start=data.get("start") or 0.0,
+            end=data.get("end") or 0.0
+        )
+
+
+def parse_webhook_payload(body: bytes) -> Tuple[List[Segment], Optional[str]]:
+    """Decode a webhook body into (segments, session_id from the payload).
+
+    Raises orjson.JSONDecodeError (a ValueError) on malformed JSON.
+    """
+    payload = orjson.loads(body)
+    session_id = None
+    if isinstance(payload, dict):
+        raw = payload.get("segments")
+        session_id = payload.get("session_id")
+    else:
+        raw = payload
+    if not isinstance(raw, list):
+        return [], session_id
+    return [Segment.from_dict(seg) for seg in raw if isinstance(seg, dict)], session_id
+
+
+def join_text(segments: List[Segment]) -> str:
+    """Transcript text of all segments, space separated."""
+    return " ".join(seg.text for seg in segments)
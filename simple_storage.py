@@ -1,66 +1,822 @@
 # -*- coding: utf-8 -*-
 """
 Simple storage with file persistence - survives server restarts!
-Note: For production, use a proper database
+Set DATABASE_URL=sqlite+aiosqlite:///... to persist to SQLite instead of JSON files
 """
-from typing import Dict, Optional
-from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import hashlib
 import json
 import os
+import socket
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+
+from app_logging import get_logger
+from records import SessionRecord, UserRecord
+from storage_backend import StorageBackend
+
+load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))  # Load .env file
+
+log = get_logger("storage")
+session_log = get_logger("session")
 
 # Storage file paths - use /app/data for Railway persistence
-STORAGE_DIR = os.getenv("STORAGE_DIR", os.path.dirname(os.path.abspath(__file__)))
+STORAGE_DIR = os.getenv("STORAGE_DIR", "")
 # Check if we're on Railway (has /app/data volume)
 if os.path.exists("/app/data"):
     STORAGE_DIR = "/app/data"
-    print("INFO Using persistent storage at: /app/data", flush=True)
+    log.info("Using persistent storage at: /app/data")
 else:
-    STORAGE_DIR = os.path.dirname(os.path.abspath(__file__))
-    print(f"INFO Using local storage at: {STORAGE_DIR}", flush=True)
+    STORAGE_DIR = STORAGE_DIR or os.path.dirname(os.path.abspath(__file__))
+    os.makedirs(STORAGE_DIR, exist_ok=True)
+    log.info("Using local storage at: %s", STORAGE_DIR)
 
+# Legacy single users file, migrated into USERS_SHARD_DIR on first start
 USERS_FILE = os.path.join(STORAGE_DIR, "users_data.json")
+# One JSON file per uid hash bucket, so a token refresh rewrites only its own shard
+USERS_SHARD_DIR = os.path.join(STORAGE_DIR, "users")
+USERS_SHARD_LOAD_WORKERS = 8
 SESSIONS_FILE = os.path.join(STORAGE_DIR, "sessions_data.json")
+# Append-only log of session mutations, folded into SESSIONS_FILE by compaction
+SESSIONS_JOURNAL_FILE = os.path.join(STORAGE_DIR, "sessions_journal.jsonl")
+# Pending OAuth attempts (uid + PKCE verifier), so callbacks survive a restart
+OAUTH_STATES_FILE = os.path.join(STORAGE_DIR, "oauth_states.json")
+
+# Compact the journal once it holds this many records (checked every interval)
+JOURNAL_COMPACT_THRESHOLD = int(os.getenv("JOURNAL_COMPACT_THRESHOLD", "1000"))
+JOURNAL_COMPACT_INTERVAL = float(os.getenv("JOURNAL_COMPACT_INTERVAL", "60"))
+# Buffered writes are flushed to disk at most this often
+FLUSH_INTERVAL_MS = int(os.getenv("FLUSH_INTERVAL_MS", "250"))
+# After a failed flush (e.g. disk full) the writes stay buffered and are
+# retried, backing off up to this many seconds
+FLUSH_RETRY_MAX_DELAY = float(os.getenv("FLUSH_RETRY_MAX_DELAY", "30"))
+
+# Sessions untouched this long are dropped from memory (and from storage unless recording)
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+# Recording sessions dropped from memory stay stored, to be reloaded on their
+# next webhook, until untouched this long
+SESSION_STORED_TTL = float(os.getenv("SESSION_STORED_TTL", str(7 * 24 * 3600)))
+# Least recently used sessions are dropped from memory beyond this many
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+
+# Ephemeral sessions: a session is only created (and persisted) when it
+# starts recording and is dropped again when it goes back to idle, so
+# trigger-less listeners cost no storage I/O
+EPHEMERAL_SESSIONS = os.getenv("EPHEMERAL_SESSIONS", "true").lower() in ("1", "true", "yes")
+
+# Opt-in fast start: skip loading at import; users are read shard by shard
+# (or row by row) on first lookup and sessions on first session access
+LAZY_LOAD = os.getenv("STORAGE_LAZY_LOAD", "").lower() in ("1", "true", "yes")
+
+# Tokens this close to expiry (seconds) are treated as expired
+TOKEN_EXPIRY_MARGIN = 300
+
+# Unanswered OAuth attempts are forgotten after this many seconds; at most
+# OAUTH_STATE_MAX_ENTRIES are kept (oldest dropped first)
+OAUTH_STATE_TTL = float(os.getenv("OAUTH_STATE_TTL", "600"))
+OAUTH_STATE_MAX_ENTRIES = int(os.getenv("OAUTH_STATE_MAX_ENTRIES", "10000"))
+
+# Redis-protocol server for state shared by several replicas
+REDIS_URL = os.getenv("REDIS_URL", "")
+
+# Shared-state mode for `uvicorn --workers N`: every read goes to the database
+# so workers see each other's writes (defaults on when WEB_CONCURRENCY > 1)
+SHARED_STATE = bool(REDIS_URL) or os.getenv(
+    "STORAGE_SHARED", "true" if int(os.getenv("WEB_CONCURRENCY", "1")) > 1 else ""
+).lower() in ("1", "true", "yes")
+
+# Shared mode: a worker holds a lease on a session while it updates it, so
+# workers cannot interleave read-modify-writes of the same session. A worker
+# that dies holding a lease blocks that session for at most this many seconds
+SHARED_LEASE_TTL = float(os.getenv("SHARED_LEASE_TTL", "30"))
+# Identifies this process as a lease holder
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+if SHARED_STATE and not REDIS_URL and not DATABASE_URL.startswith("sqlite"):
+    # JSON files cannot be shared between processes
+    DATABASE_URL = "sqlite+aiosqlite:///twitter_omi.db"
+    log.info("Shared state enabled, using SQLite storage")
+
+
+class SessionCache(OrderedDict):
+    """Sessions in least-recently-used order, bounded by idle TTL and entry count"""
+
+    def __init__(self, idle_ttl: float, max_entries: int):
+        super().__init__()
+        self.idle_ttl = idle_ttl
+        self.max_entries = max_entries
+        self.last_access: Dict[str, float] = {}
+        self.metrics = {"evicted_idle": 0, "evicted_capacity": 0, "reloaded": 0}
+
+    def touch(self, session_id: str):
+        """Mark a session as just used."""
+        self.move_to_end(session_id)
+        self.last_access[session_id] = time.monotonic()
+
+    def add(self, session_id: str, session: SessionRecord) -> List[Tuple[str, SessionRecord]]:
+        """Insert a session; returns the least recently used ones pushed out."""
+        self[session_id] = session
+        self.touch(session_id)
+        evicted = []
+        while len(self) > self.max_entries:
+            evicted.append(self._evict_oldest())
+            self.metrics["evicted_capacity"] += 1
+        return evicted
+
+    def sweep(self) -> List[Tuple[str, SessionRecord]]:
+        """Drop sessions idle for longer than idle_ttl (oldest first)."""
+        deadline = time.monotonic() - self.idle_ttl
+        evicted = []
+        for session_id in self:
+            if self.last_access.get(session_id, 0.0) > deadline:
+                break
+            evicted.append(session_id)
+        for session_id in evicted:
+            self.last_access.pop(session_id, None)
+        self.metrics["evicted_idle"] += len(evicted)
+        return [(session_id, self.pop(session_id)) for session_id in evicted]
+
+    def discard(self, session_id: str):
+        """Forget a session without counting it as evicted."""
+        self.pop(session_id, None)
+        self.last_access.pop(session_id, None)
+
+    def clear(self):
+        super().clear()
+        self.last_access.clear()
+
+    def _evict_oldest(self) -> Tuple[str, SessionRecord]:
+        session_id, session = self.popitem(last=False)
+        self.last_access.pop(session_id, None)
+        return session_id, session
+
 
 # In-memory storage
-users: Dict[str, dict] = {}
-sessions: Dict[str, dict] = {}
-oauth_states: Dict[str, dict] = {}  # Store OAuth state and code_verifier
+users: Dict[str, UserRecord] = {}
+sessions = SessionCache(SESSION_IDLE_TTL, SESSION_MAX_ENTRIES)
+# Session ids known to have no stored session (single-process mode only), so
+# idle listeners don't hit the backend on every webhook; oldest dropped first
+_missing_sessions: "OrderedDict[str, None]" = OrderedDict()
+_sweeper_task: Optional[asyncio.Task] = None
+_sessions_loaded = False
+_sessions_load_lock: Optional[asyncio.Lock] = None
+oauth_states: "OrderedDict[str, dict]" = OrderedDict()  # OAuth state -> uid, code_verifier (oldest first)
+oauth_metrics = {"oauth_expired": 0, "oauth_evicted": 0}
+
+
+def user_shard(uid: str) -> str:
+    """Bucket name (00-ff) of the shard file holding uid."""
+    return hashlib.sha1(uid.encode("utf-8")).hexdigest()[:2]
+
+
+def _read_json(path: str) -> dict:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _write_json_atomic(path: str, data: dict):
+    """Write JSON to a temp file and rename it over path."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, default=str)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class JsonFileBackend(StorageBackend):
+    """Users in per-bucket JSON shards, sessions in a snapshot plus an append-only journal.
+
+    Writes are buffered: mutations only mark state dirty, and a background task
+    flushes at most every FLUSH_INTERVAL_MS (temp file + fsync + os.replace).
+    """
+
+    name = "json"
+
+    def __init__(self):
+        super().__init__()
+        self._journal_file = None
+        self._journal_records = 0
+        self._pending_records: List[str] = []
+        self._shard_members: Dict[str, set] = {}
+        self._loaded_shards: set = set()
+        self._all_shards_loaded = False
+        self._sessions_loaded = False
+        self._evicted: Dict[str, float] = {}  # stored, not in memory -> evicted at
+        self._dirty_shards: set = set()
+        self._oauth_dirty = False
+        self._oauth_loaded = False
+        self._pending_mutations = 0
+        self._dirty: Optional[asyncio.Event] = None
+        self._io_lock: Optional[asyncio.Lock] = None
+        self._closing: Optional[asyncio.Event] = None
+        self._flusher_task: Optional[asyncio.Task] = None
+        self._compactor_task: Optional[asyncio.Task] = None
+
+    def load_users(self) -> Dict[str, UserRecord]:
+        self._all_shards_loaded = True
+        if not os.path.isdir(USERS_SHARD_DIR):
+            return self._migrate_users_file()
+        paths = [
+            os.path.join(USERS_SHARD_DIR, name)
+            for name in os.listdir(USERS_SHARD_DIR)
+            if name.endswith(".json")
+        ]
+        loaded: Dict[str, UserRecord] = {}
+        with ThreadPoolExecutor(max_workers=USERS_SHARD_LOAD_WORKERS) as pool:
+            for shard_users in pool.map(_read_json, paths):
+                for uid, user in shard_users.items():
+                    loaded[uid] = UserRecord.from_dict(user)
+        for uid in loaded:
+            self._shard_members.setdefault(user_shard(uid), set()).add(uid)
+        return loaded
+
+    async def load_user(self, uid: str) -> Optional[UserRecord]:
+        """Lazy mode: read only the shard that holds uid, once."""
+        shard = user_shard(uid)
+        if not self._is_shard_loaded(shard):
+            self._merge_shard(shard, await asyncio.to_thread(self._read_shard, shard))
+        return users.get(uid)
+
+    def _is_shard_loaded(self, shard: str) -> bool:
+        return self._all_shards_loaded or shard in self._loaded_shards
+
+    def _read_shard(self, shard: str) -> dict:
+        if not os.path.isdir(USERS_SHARD_DIR):
+            self._migrate_users_file()
+        path = os.path.join(USERS_SHARD_DIR, shard + ".json")
+        return _read_json(path) if os.path.exists(path) else {}
+
+    def _merge_shard(self, shard: str, shard_users: dict):
+        if self._is_shard_loaded(shard):
+            return
+        for uid, user in shard_users.items():
+            # Anything already in memory is newer than the file
+            users.setdefault(uid, UserRecord.from_dict(user))
+            self._shard_members.setdefault(shard, set()).add(uid)
+        self._loaded_shards.add(shard)
+
+    def _ensure_shard_loaded(self, shard: str):
+        # A flush rewrites the whole shard, so its other users must be known first
+        if not self._is_shard_loaded(shard):
+            self._merge_shard(shard, self._read_shard(shard))
+
+    def _migrate_users_file(self) -> Dict[str, UserRecord]:
+        """Split the legacy users_data.json into shard files."""
+        os.makedirs(USERS_SHARD_DIR, exist_ok=True)
+        if not os.path.exists(USERS_FILE):
+            return {}
+        loaded = _read_json(USERS_FILE)
+        shards: Dict[str, dict] = {}
+        for uid, user in loaded.items():
+            shards.setdefault(user_shard(uid), {})[uid] = user
+            self._shard_members.setdefault(user_shard(uid), set()).add(uid)
+        for shard, shard_users in shards.items():
+            _write_json_atomic(os.path.join(USERS_SHARD_DIR, shard + ".json"), shard_users)
+        os.replace(USERS_FILE, USERS_FILE + ".migrated")
+        log.info("Migrated %d users into %d shard files", len(loaded), len(shards))
+        return {uid: UserRecord.from_dict(user) for uid, user in loaded.items()}
+
+    def load_sessions(self) -> Dict[str, SessionRecord]:
+        loaded: Dict[str, dict] = {}
+        if os.path.exists(SESSIONS_FILE):
+            loaded = _read_json(SESSIONS_FILE)
+        self._journal_records = self._replay_journal(loaded)
+        self._sessions_loaded = True
+        return {session_id: SessionRecord.from_dict(session) for session_id, session in loaded.items()}
+
+    async def preload_sessions(self) -> Dict[str, SessionRecord]:
+        return await asyncio.to_thread(self.load_sessions)
+
+    async def load_session(self, session_id: str) -> Optional[SessionRecord]:
+        # Every other stored session is in memory
+        if session_id not in self._evicted:
+            return None
+        await self.flush()
+        if self._io_lock is None:
+            stored = self._read_stored_sessions()
+        else:
+            # Not while compaction swaps the journal for its tail
+            async with self._io_lock:
+                stored = await asyncio.to_thread(self._read_stored_sessions)
+        data = stored.get(session_id)
+        if data is None:
+            return None
+        self._evicted.pop(session_id, None)
+        return SessionRecord.from_dict(data)
+
+    def save_user(self, uid: str, user: UserRecord):
+        shard = user_shard(uid)
+        self._ensure_shard_loaded(shard)
+        self._shard_members.setdefault(shard, set()).add(uid)
+        self._dirty_shards.add(shard)
+        self._mark_dirty()
+
+    def delete_user(self, uid: str):
+        shard = user_shard(uid)
+        self._ensure_shard_loaded(shard)
+        self._shard_members.get(shard, set()).discard(uid)
+        self._dirty_shards.add(shard)
+        self._mark_dirty()
+
+    def save_session(self, session_id: str, session: SessionRecord):
+        self._queue_session_record("set", session_id, session.to_dict())
+
+    def update_session(self, session_id: str, fields: dict, session: SessionRecord):
+        self._queue_session_record("update", session_id, fields)
+
+    def delete_session(self, session_id: str):
+        self._evicted.pop(session_id, None)
+        self._queue_session_record("delete", session_id)
+
+    def load_oauth_states(self) -> Dict[str, dict]:
+        self._oauth_loaded = True
+        return self._read_oauth_states()
+
+    async def load_oauth_state(self, state: str) -> Optional[dict]:
+        """Lazy mode: states saved before a restart are read on first lookup."""
+        if not self._oauth_loaded:
+            self._merge_oauth_states(await asyncio.to_thread(self._read_oauth_states))
+        return oauth_states.get(state)
+
+    def _read_oauth_states(self) -> Dict[str, dict]:
+        return _read_json(OAUTH_STATES_FILE) if os.path.exists(OAUTH_STATES_FILE) else {}
+
+    def _merge_oauth_states(self, file_states: Dict[str, dict]):
+        if self._oauth_loaded:
+            return
+        # Anything already in memory is newer than the file; keep creation order
+        merged = {**file_states, **oauth_states}
+        oauth_states.clear()
+        oauth_states.update(sorted(merged.items(), key=lambda item: item[1]["created_at"]))
+        self._oauth_loaded = True
+
+    def _ensure_oauth_loaded(self):
+        # A flush rewrites the whole file, so the states already in it must be known first
+        if not self._oauth_loaded:
+            self._merge_oauth_states(self._read_oauth_states())
+
+    def save_oauth_state(self, state: str, data: dict):
+        self._ensure_oauth_loaded()
+        self._oauth_dirty = True
+        self._mark_dirty()
+
+    def delete_oauth_state(self, state: str):
+        if not self._oauth_loaded:
+            self._ensure_oauth_loaded()
+            # The caller dropped it from memory before the file was merged in
+            oauth_states.pop(state, None)
+        self._oauth_dirty = True
+        self._mark_dirty()
+
+    def evict_session(self, session_id: str):
+        # Left in the snapshot and journal; load_session reads it back
+        self._evicted[session_id] = time.time()
+
+    def purge_idle_sessions(self, cutoff: float):
+        for session_id, evicted_at in list(self._evicted.items()):
+            if evicted_at < cutoff:
+                self.delete_session(session_id)
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._flusher_task is None:
+            self._dirty = asyncio.Event()
+            self._io_lock = asyncio.Lock()
+            self._closing = asyncio.Event()
+            if self._pending_mutations:
+                self._dirty.set()
+            self._flusher_task = loop.create_task(self._run_flusher())
+        if self._compactor_task is None:
+            self._compactor_task = loop.create_task(self._run_compactor())
+
+    async def close(self):
+        # Not cancelled: a flush or compaction running in a thread would carry on
+        # next to the final one. Let them finish their current write and exit
+        tasks = [task for task in (self._flusher_task, self._compactor_task) if task is not None]
+        if self._closing is not None:
+            self._closing.set()
+            self._dirty.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.flush()
+        await self.compact_sessions()
+        self._flusher_task = None
+        self._compactor_task = None
+        if self._pending_mutations:
+            # Written while the final flush ran
+            await self.flush()
+
+    def _mark_dirty(self):
+        self._pending_mutations += 1
+        if self._flusher_task is None:
+            # No event loop yet (startup, scripts): write straight through
+            self._restore_pending(self._flush_sync(*self._take_pending()))
+        else:
+            self._dirty.set()
+
+    def _queue_session_record(self, op: str, session_id: str, data: Optional[dict] = None):
+        record = {"op": op, "id": session_id}
+        if data is not None:
+            record["data"] = data
+        # Serialize now: the session keeps changing after this call
+        self._pending_records.append(json.dumps(record, default=str) + "\n")
+        self._mark_dirty()
+
+    def _take_pending(self) -> Tuple[List[str], Dict[str, dict], Optional[dict], int]:
+        records, self._pending_records = self._pending_records, []
+        shard_snapshots = {
+            shard: {uid: users[uid].to_dict() for uid in self._shard_members.get(shard, ()) if uid in users}
+            for shard in self._dirty_shards
+        }
+        self._dirty_shards = set()
+        oauth_snapshot = dict(oauth_states) if self._oauth_dirty else None
+        self._oauth_dirty = False
+        mutations, self._pending_mutations = self._pending_mutations, 0
+        return records, shard_snapshots, oauth_snapshot, mutations
+
+    def _restore_pending(self, unwritten: Optional[Tuple[List[str], List[str], bool, int]]):
+        """Put back what a failed flush could not write, ahead of newer writes."""
+        if unwritten is None:
+            return
+        records, shards, oauth, mutations = unwritten
+        self._pending_records = records + self._pending_records
+        # Shards and OAuth states are snapshotted again at the next flush (from newer data)
+        self._dirty_shards.update(shards)
+        self._oauth_dirty = self._oauth_dirty or oauth
+        self._pending_mutations += mutations
+        if self._dirty is not None:
+            self._dirty.set()
+
+    def _flush_sync(
+        self,
+        records: List[str],
+        shard_snapshots: Dict[str, dict],
+        oauth_snapshot: Optional[dict],
+        mutations: int
+    ) -> Optional[Tuple[List[str], List[str], bool, int]]:
+        """Write one batch; returns what could not be written (None when all of it was)."""
+        if not mutations:
+            return None
+        started = time.perf_counter()
+        shards = list(shard_snapshots)
+        try:
+            if records:
+                self._append_journal(records)
+                records = []
+            while shards:
+                path = os.path.join(USERS_SHARD_DIR, shards[0] + ".json")
+                if shard_snapshots[shards[0]]:
+                    _write_json_atomic(path, shard_snapshots[shards[0]])
+                elif os.path.exists(path):
+                    os.remove(path)
+                shards.pop(0)
+            if oauth_snapshot is not None:
+                _write_json_atomic(OAUTH_STATES_FILE, oauth_snapshot)
+        except Exception as e:
+            self.metrics["flush_errors"] += 1
+            log.warning("Could not flush storage, will retry: %s", e)
+            return records, shards, oauth_snapshot is not None, mutations
+        self._record_flush(started, mutations)
+        return None
+
+    def _append_journal(self, records: List[str]):
+        if self._journal_file is None:
+            self._journal_file = open(SESSIONS_JOURNAL_FILE, 'a')
+        size = self._journal_file.tell()
+        try:
+            self._journal_file.write("".join(records))
+            self._journal_file.flush()
+            os.fsync(self._journal_file.fileno())
+        except OSError:
+            # Cut off a partly written tail, so the retry starts on a fresh line
+            try:
+                self._journal_file.close()
+            except OSError:
+                pass
+            self._journal_file = None
+            try:
+                os.truncate(SESSIONS_JOURNAL_FILE, size)
+            except OSError:
+                pass
+            raise
+        self._journal_records += len(records)
+
+    async def flush(self) -> bool:
+        """Persist everything buffered since the last flush; False if some of it failed."""
+        if self._io_lock is None:
+            unwritten = self._flush_sync(*self._take_pending())
+            self._restore_pending(unwritten)
+        else:
+            async with self._io_lock:
+                unwritten = await asyncio.to_thread(self._flush_sync, *self._take_pending())
+                self._restore_pending(unwritten)
+        return unwritten is None
+
+    async def _wait_closing(self, timeout: float) -> bool:
+        """Sleep up to timeout seconds; True once close() has been called."""
+        try:
+            await asyncio.wait_for(self._closing.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self._closing.is_set()
+
+    async def _run_flusher(self):
+        delay = FLUSH_INTERVAL_MS / 1000
+        while not self._closing.is_set():
+            await self._dirty.wait()
+            # Let a burst of mutations pile up so they share one write
+            if await self._wait_closing(delay):
+                return
+            self._dirty.clear()
+            if await self.flush():
+                delay = FLUSH_INTERVAL_MS / 1000
+            else:
+                delay = min(max(delay * 2, 1.0), FLUSH_RETRY_MAX_DELAY)
+
+    @classmethod
+    def _read_stored_sessions(cls) -> Dict[str, dict]:
+        """Sessions as stored: the snapshot with the journal replayed on top."""
+        loaded = _read_json(SESSIONS_FILE) if os.path.exists(SESSIONS_FILE) else {}
+        cls._replay_journal(loaded)
+        return loaded
+
+    @staticmethod
+    def _replay_journal(loaded: Dict[str, dict]) -> int:
+        """Replay journal records on top of the loaded snapshot."""
+        if not os.path.exists(SESSIONS_JOURNAL_FILE):
+            return 0
+        count = 0
+        with open(SESSIONS_JOURNAL_FILE, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-append
+                    continue
+                op = record.get("op")
+                session_id = record.get("id")
+                data = record.get("data") or {}
+                if op == "set":
+                    loaded[session_id] = data
+                elif op == "update" and session_id in loaded:
+                    loaded[session_id].update(data)
+                elif op == "delete":
+                    loaded.pop(session_id, None)
+                count += 1
+        return count
+
+    def _rewrite_journal_tail(self, offset: int):
+        """Keep only journal records written after offset (already in the snapshot otherwise)."""
+        with open(SESSIONS_JOURNAL_FILE, 'r') as f:
+            f.seek(offset)
+            tail = f.read()
+        self._journal_file.close()
+        self._journal_file = None
+        tmp_path = SESSIONS_JOURNAL_FILE + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, SESSIONS_JOURNAL_FILE)
+        self._journal_records = tail.count("\n")
 
-# Load from file on startup
+    async def compact_sessions(self):
+        """Fold the journal into a fresh sessions snapshot."""
+        await self.flush()
+        # Lazy mode: until sessions are loaded, memory is not the full picture
+        if not self._sessions_loaded or self._journal_file is None or self._journal_records == 0:
+            return
+        try:
+            offset = self._journal_file.tell()
+            snapshot = {session_id: session.to_dict() for session_id, session in sessions.items()}
+            evicted = [session_id for session_id in self._evicted if session_id not in snapshot]
+            # The O(sessions) dump runs off the event loop; new records keep being
+            # buffered meanwhile. Replaying the full journal over the new snapshot
+            # is idempotent, so a crash before the tail rewrite loses nothing.
+            await asyncio.to_thread(self._write_snapshot, snapshot, evicted)
+            if self._io_lock is None:
+                self._rewrite_journal_tail(offset)
+            else:
+                async with self._io_lock:
+                    self._rewrite_journal_tail(offset)
+            log.info("Compacted %d sessions into snapshot", len(snapshot))
+        except Exception as e:
+            log.warning("Could not compact sessions: %s", e)
+
+    def _write_snapshot(self, snapshot: Dict[str, dict], evicted: List[str]):
+        if evicted:
+            # Sessions evicted from memory are carried over from the old snapshot
+            stored = self._read_stored_sessions()
+            snapshot.update((session_id, stored[session_id]) for session_id in evicted if session_id in stored)
+        _write_json_atomic(SESSIONS_FILE, snapshot)
+
+    async def _run_compactor(self):
+        while not await self._wait_closing(JOURNAL_COMPACT_INTERVAL):
+            if self._journal_records >= JOURNAL_COMPACT_THRESHOLD:
+                await self.compact_sessions()
+
+
+def _create_backend() -> StorageBackend:
+    """Pick the persistence backend from REDIS_URL / DATABASE_URL (JSON files by default)."""
+    if REDIS_URL:
+        from redis_storage import RedisBackend
+        return RedisBackend(REDIS_URL, session_ttl=SESSION_IDLE_TTL, oauth_ttl=OAUTH_STATE_TTL)
+    if DATABASE_URL.startswith("sqlite"):
+        from sqlite_storage import SQLiteBackend, sqlite_path_from_url
+        return SQLiteBackend(sqlite_path_from_url(DATABASE_URL, STORAGE_DIR))
+    return JsonFileBackend()
+
+
+backend = _create_backend()
+
+
+def _import_legacy_json():
+    """Copy users/sessions from the JSON files into a freshly created database."""
+    legacy = JsonFileBackend()
+    try:
+        for uid, user in legacy.load_users().items():
+            users[uid] = user
+            backend.save_user(uid, user)
+        for session_id, session in legacy.load_sessions().items():
+            sessions.add(session_id, session)
+            backend.save_session(session_id, session)
+        log.info("Imported %d users and %d sessions from JSON files", len(users), len(sessions))
+    except Exception as e:
+        log.warning("Could not import JSON storage: %s", e)
+
+
+def _drop_sessions(evicted: List[Tuple[str, SessionRecord]]):
+    """Remove evicted sessions from persistence too.
+
+    Idle sessions hold no state, so a later webhook simply recreates them.
+    Sessions still recording stay stored, to be reloaded by
+    SimpleSessionStorage.find_session, until SESSION_STORED_TTL.
+    """
+    for session_id, session in evicted:
+        if session.tweet_mode != "recording":
+            backend.delete_session(session_id)
+        else:
+            backend.evict_session(session_id)
+
+def _remember_missing_session(session_id: str):
+    _missing_sessions[session_id] = None
+    _missing_sessions.move_to_end(session_id)
+    while len(_missing_sessions) > SESSION_MAX_ENTRIES:
+        _missing_sessions.popitem(last=False)
+
+# Load from backend on startup
 def load_storage():
-    global users, sessions
+    global _sessions_loaded
     try:
-        if os.path.exists(USERS_FILE):
-            with open(USERS_FILE, 'r') as f:
-                users = json.load(f)
-                print(f"INFO Loaded {len(users)} users from storage")
+        users.clear()
+        users.update(backend.load_users())
+        log.info("Loaded %d users from %s storage", len(users), backend.name)
     except Exception as e:
-            print(f"WARN Could not load users: {e}")
+        log.warning("Could not load users: %s", e)
     
     try:
-        if os.path.exists(SESSIONS_FILE):
-            with open(SESSIONS_FILE, 'r') as f:
-                sessions = json.load(f)
-                print(f"INFO Loaded {len(sessions)} sessions from storage")
+        sessions.clear()
+        for session_id, session in backend.load_sessions().items():
+            _drop_sessions(sessions.add(session_id, session))
+        _sessions_loaded = True
+        log.info("Loaded %d sessions from %s storage", len(sessions), backend.name)
     except Exception as e:
-            print(f"WARN Could not load sessions: {e}")
+        log.warning("Could not load sessions: %s", e)
 
-def save_users():
     try:
-        with open(USERS_FILE, 'w') as f:
-            json.dump(users, f, default=str)
+        oauth_states.clear()
+        oauth_states.update(backend.load_oauth_states())
     except Exception as e:
-        print(f"WARN Could not save users: {e}")
+        log.warning("Could not load OAuth states: %s", e)
 
-def save_sessions():
-    try:
-        with open(SESSIONS_FILE, 'w') as f:
-            json.dump(sessions, f, default=str)
-    except Exception as e:
-        print(f"WARN Could not save sessions: {e}")
+    if backend.name == "sqlite" and not users and (os.path.exists(USERS_FILE) or os.path.isdir(USERS_SHARD_DIR)):
+        _import_legacy_json()
+
+async def _ensure_sessions_loaded():
+    """Lazy mode: load sessions on the first session access."""
+    global _sessions_loaded, _sessions_load_lock
+    if _sessions_loaded:
+        return
+    if _sessions_load_lock is None:
+        _sessions_load_lock = asyncio.Lock()
+    async with _sessions_load_lock:
+        if _sessions_loaded:
+            return
+        try:
+            loaded = await backend.preload_sessions()
+        except Exception as e:
+            log.warning("Could not load sessions: %s", e)
+            loaded = {}
+        for session_id, session in loaded.items():
+            if session_id not in sessions:
+                _drop_sessions(sessions.add(session_id, session))
+        _sessions_loaded = True
+        log.info("Lazily loaded %d sessions from %s storage", len(loaded), backend.name)
+
+async def _run_sweeper():
+    while True:
+        await asyncio.sleep(SESSION_SWEEP_INTERVAL)
+        evicted = sessions.sweep()
+        if SHARED_STATE:
+            # Another worker may have used these sessions since; only the
+            # shared updated_at decides what is really idle
+            backend.purge_idle_sessions(time.time() - SESSION_IDLE_TTL)
+        else:
+            _drop_sessions(evicted)
+            # Recording sessions _drop_sessions left in storage
+            backend.purge_idle_sessions(time.time() - SESSION_STORED_TTL)
+        if evicted:
+            log.info("Evicted %d idle sessions (%d cached)", len(evicted), len(sessions))
+        OAuthStateStorage.purge_expired()
+
+def start_storage():
+    """Start background storage tasks (call from the app's startup hook)."""
+    global _sweeper_task
+    backend.start()
+    if _sweeper_task is None:
+        _sweeper_task = asyncio.get_running_loop().create_task(_run_sweeper())
+
+async def stop_storage():
+    """Flush pending writes and stop background tasks before shutdown."""
+    global _sweeper_task
+    if _sweeper_task is not None:
+        _sweeper_task.cancel()
+        _sweeper_task = None
+    await backend.close()
+
+def get_storage_metrics() -> dict:
+    """Flush counters and latencies of the active backend, plus session cache counters."""
+    return {
+        "backend": backend.name,
+        **backend.metrics,
+        "sessions_cached": len(sessions),
+        **sessions.metrics,
+        "oauth_pending": len(oauth_states),
+        **oauth_metrics,
+    }
 
 # Load on module import
-load_storage()
+if not LAZY_LOAD:
+    load_storage()
+
+
+class StorageLeases:
+    """Named leases in the storage backend: locks shared by every worker.
+
+    Disabled (always granted) unless state is shared between processes. A
+    lease expires after ttl unless renewed, so a dead holder cannot keep it.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        ttl: float = SHARED_LEASE_TTL,
+        enabled: bool = SHARED_STATE,
+        owner: str = LEASE_OWNER
+    ):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.enabled = enabled
+        self.owner = owner
+        self.metrics = {"acquired": 0, "contended": 0}
+
+    async def try_acquire(self, name: str) -> bool:
+        """Take (or renew) a lease without waiting."""
+        if not self.enabled:
+            return True
+        return await backend.acquire_lease(self.prefix + name, self.owner, self.ttl)
+
+    async def acquire(self, name: str):
+        """Wait until the lease is ours."""
+        delay = 0.005
+        if not await self.try_acquire(name):
+            self.metrics["contended"] += 1
+            while not await self.try_acquire(name):
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.1)
+        self.metrics["acquired"] += 1
+
+    async def release(self, name: str):
+        if self.enabled:
+            await backend.release_lease(self.prefix + name, self.owner)
+
+    @asynccontextmanager
+    async def hold(self, name: str) -> AsyncIterator[None]:
+        await self.acquire(name)
+        try:
+            yield
+        finally:
+            await self.release(name)
+
+    def snapshot(self) -> dict:
+        return {**self.metrics, "enabled": self.enabled}
 
 
 class SimpleUserStorage:
@@ -69,109 +825,235 @@ class SimpleUserStorage:
     @staticmethod
     def save_user(uid: str, access_token: str, refresh_token: Optional[str] = None, expires_in: int = 7200):
         """Save user tokens with expiration time"""
-        users[uid] = {
-            "uid": uid,
-            "access_token": access_token,
-            "refresh_token": refresh_token,
-            "expires_at": (datetime.utcnow() + timedelta(seconds=expires_in)).isoformat(),
-            "created_at": datetime.utcnow().isoformat()
-        }
-        save_users()  # Persist to file
-        print(f"INFO Saved tokens for user {uid[:10]}... (expires in {expires_in/3600:.1f} hours)")
+        now = time.time()
+        users[uid] = UserRecord(
+            uid=uid,
+            access_token=access_token,
+            refresh_token=refresh_token,
+            expires_at=now + expires_in,
+            created_at=now
+        )
+        backend.save_user(uid, users[uid])  # Persist
+        log.info("Saved tokens for user %s... (expires in %.1f hours)", uid[:10], expires_in / 3600)
     
     @staticmethod
-    def get_user(uid: str) -> Optional[dict]:
+    def get_user(uid: str) -> Optional[UserRecord]:
         """Get user by uid"""
         return users.get(uid)
+
+    @staticmethod
+    async def fetch_user(uid: str) -> Optional[UserRecord]:
+        """Get user by uid, reading it from storage first in lazy mode"""
+        user = users.get(uid)
+        if SHARED_STATE:
+            # Another worker may have refreshed (and rotated) the tokens
+            user = await backend.load_user(uid)
+            if user is None:
+                users.pop(uid, None)
+            else:
+                users[uid] = user
+        elif user is None and LAZY_LOAD:
+            user = await backend.load_user(uid)
+            if user is not None:
+                users.setdefault(uid, user)
+        return user
     
+    @staticmethod
+    def list_users() -> List[UserRecord]:
+        """Users currently held in memory"""
+        return list(users.values())
+
+    @staticmethod
+    async def fetch_expiring_users(before: float) -> List[UserRecord]:
+        """Users whose tokens expire before `before`; every worker's users in shared mode"""
+        if SHARED_STATE:
+            return await backend.load_expiring_users(before)
+        return [user for user in users.values() if user.expires_at < before]
+
     @staticmethod
     def is_authenticated(uid: str) -> bool:
         """Check if user is authenticated"""
         user = users.get(uid)
-        return user is not None and user.get("access_token") is not None
+        return user is not None and user.access_token is not None
     
     @staticmethod
     def is_token_expired(uid: str) -> bool:
         """Check if user's token is expired"""
         user = users.get(uid)
-        if not user or not user.get("expires_at"):
-            return True
-        
-        try:
-            expires_at = datetime.fromisoformat(user["expires_at"])
-            # Consider expired if less than 5 minutes remaining
-            return datetime.utcnow() >= (expires_at - timedelta(minutes=5))
-        except:
-            return True
+        # Consider expired if less than 5 minutes remaining
+        return user is None or time.time() >= user.expires_at - TOKEN_EXPIRY_MARGIN
+
+    @staticmethod
+    def delete_user(uid: str):
+        """Forget a user (e.g. after an unrecoverable token refresh failure)"""
+        if users.pop(uid, None) is not None:
+            backend.delete_user(uid)
 
 
 class SimpleSessionStorage:
     """Store session state in memory"""
     
     @staticmethod
-    def get_or_create_session(session_id: str, uid: str) -> dict:
+    def get_or_create_session(session_id: str, uid: str) -> SessionRecord:
         """Get or create a session"""
-        if session_id not in sessions:
-            sessions[session_id] = {
-                "session_id": session_id,
-                "uid": uid,
-                "transcript": "",
-                "tweet_mode": "idle",  # idle, recording, posted
-                "tweet_content": "",
-                "segments_count": 0,
-                "last_segment_time": None,
-                "accumulated_text": "",
-                "created_at": datetime.utcnow().isoformat()
-            }
-            print(f"INFO Created new session: {session_id}", flush=True)
-            save_sessions()  # Persist to file
-        return sessions[session_id]
+        if session_id in sessions:
+            sessions.touch(session_id)
+            return sessions[session_id]
+        session = SessionRecord.new(session_id, uid)
+        _missing_sessions.pop(session_id, None)
+        _drop_sessions(sessions.add(session_id, session))
+        session_log.debug("Created new session: %s", session_id)
+        backend.save_session(session_id, session)
+        return session
+
+    @staticmethod
+    async def find_session(session_id: str) -> Optional[SessionRecord]:
+        """Get a session, reloading it from storage if it was evicted; None if there is none"""
+        await _ensure_sessions_loaded()
+        if SHARED_STATE:
+            # The latest state may have been written by another worker
+            session = await backend.load_session(session_id)
+            if session is not None:
+                _drop_sessions(sessions.add(session_id, session))
+            else:
+                sessions.discard(session_id)
+        elif session_id not in sessions and session_id not in _missing_sessions:
+            session = await backend.load_session(session_id)
+            # Re-check: another request may have created it while we awaited
+            if session is not None and session_id not in sessions:
+                _drop_sessions(sessions.add(session_id, session))
+                sessions.metrics["reloaded"] += 1
+            elif session is None and session_id not in sessions:
+                _remember_missing_session(session_id)
+        session = sessions.get(session_id)
+        if session is not None:
+            sessions.touch(session_id)
+        return session
+
+    @staticmethod
+    async def fetch_session(session_id: str, uid: str) -> SessionRecord:
+        """Get a session, reloading it from storage if it was evicted, or create it"""
+        session = await SimpleSessionStorage.find_session(session_id)
+        return session or SimpleSessionStorage.get_or_create_session(session_id, uid)
     
     @staticmethod
     def update_session(session_id: str, **kwargs):
         """Update session fields"""
-        if session_id in sessions:
-            sessions[session_id].update(kwargs)
-            save_sessions()  # Persist to file
-            print(f"INFO Updated session {session_id}: {kwargs}", flush=True)
+        session = sessions.get(session_id)
+        if session is not None:
+            for field, value in kwargs.items():
+                setattr(session, field, value)
+            sessions.touch(session_id)
+            backend.update_session(session_id, kwargs, session)
+            session_log.debug("Updated session %s: %s", session_id, kwargs)
         else:
-            print(f"WARN Session {session_id} not found for update!", flush=True)
+            session_log.warning("Session %s not found for update!", session_id)
     
+    @staticmethod
+    def delete_session(session_id: str):
+        """Forget a session in memory and storage"""
+        sessions.discard(session_id)
+        backend.delete_session(session_id)
+        _remember_missing_session(session_id)
+
     @staticmethod
     def reset_session(session_id: str):
         """Reset session to idle state"""
-        if session_id in sessions:
-            sessions[session_id].update({
-                "transcript": "",
-                "tweet_mode": "idle",
-                "tweet_content": "",
-                "segments_count": 0,
-                "last_segment_time": None,
-                "accumulated_text": ""
-            })
-            save_sessions()  # Persist to file
+        if session_id not in sessions:
+            return
+        if EPHEMERAL_SESSIONS:
+            # Idle sessions are not kept
+            SimpleSessionStorage.delete_session(session_id)
+        else:
+            SimpleSessionStorage.update_session(
+                session_id,
+                tweet_mode="idle",
+                segments_count=0,
+                accumulated_text=""
+            )
+
+
+class PostJobStorage:
+    """Post job status in the storage backend (shared mode), so the worker the
+    next webhook or /jobs poll reaches can report a job another worker ran"""
+
+    @staticmethod
+    def save_job(job: dict, notify: bool, ttl: float):
+        backend.save_job(job, notify, ttl)
+
+    @staticmethod
+    async def load_job(job_id: str) -> Optional[dict]:
+        return await backend.load_job(job_id)
+
+    @staticmethod
+    async def take_job_result(session_id: str) -> Optional[dict]:
+        return await backend.take_job_result(session_id)
+
+    @staticmethod
+    def ack_job_result(session_id: str, job_id: str):
+        backend.ack_job_result(session_id, job_id)
 
 
 class OAuthStateStorage:
-    """Store OAuth state and code_verifier temporarily"""
+    """Store pending OAuth attempts (uid + PKCE code_verifier), keyed by the OAuth state.
+
+    Entries expire after OAUTH_STATE_TTL and the oldest are dropped beyond
+    OAUTH_STATE_MAX_ENTRIES, so abandoned /auth hits cannot pile up.
+    """
     
     @staticmethod
-    def save_oauth_state(uid: str, code_verifier: str, state: str):
+    def save_oauth_state(state: str, uid: str, code_verifier: str):
         """Save OAuth state and code_verifier"""
-        oauth_states[uid] = {
+        oauth_states[state] = {
+            "uid": uid,
             "code_verifier": code_verifier,
-            "state": state,
-            "created_at": datetime.utcnow()
+            "created_at": time.time()
         }
+        # Persisted so the callback survives restarts and can land on any worker
+        backend.save_oauth_state(state, oauth_states[state])
+        while len(oauth_states) > OAUTH_STATE_MAX_ENTRIES:
+            oldest, _ = oauth_states.popitem(last=False)
+            backend.delete_oauth_state(oldest)
+            oauth_metrics["oauth_evicted"] += 1
     
     @staticmethod
-    def get_oauth_state(uid: str) -> Optional[dict]:
-        """Get OAuth state by uid"""
-        return oauth_states.get(uid)
+    def get_oauth_state(state: str) -> Optional[dict]:
+        """Get OAuth state (None once expired)"""
+        data = oauth_states.get(state)
+        if data is not None and OAuthStateStorage._is_expired(data):
+            OAuthStateStorage.remove_oauth_state(state)
+            oauth_metrics["oauth_expired"] += 1
+            return None
+        return data
+
+    @staticmethod
+    async def fetch_oauth_state(state: str) -> Optional[dict]:
+        """Get OAuth state, reading it from storage if another worker saved it"""
+        if state not in oauth_states:
+            data = await backend.load_oauth_state(state)
+            if data is not None:
+                oauth_states[state] = data
+        return OAuthStateStorage.get_oauth_state(state)
     
     @staticmethod
-    def remove_oauth_state(uid: str):
+    def remove_oauth_state(state: str):
         """Remove OAuth state after use"""
-        if uid in oauth_states:
-            del oauth_states[uid]
+        if oauth_states.pop(state, None) is not None:
+            backend.delete_oauth_state(state)
 
+    @staticmethod
+    def purge_expired():
+        """Drop every expired OAuth state (called by the storage sweeper)"""
+        cutoff = time.time() - OAUTH_STATE_TTL
+        # Insertion order is creation order, so expired entries sit at the front
+        while oauth_states:
+            state, data = next(iter(oauth_states.items()))
+            if data["created_at"] > cutoff:
+                break
+            OAuthStateStorage.remove_oauth_state(state)
+            oauth_metrics["oauth_expired"] += 1
+        backend.purge_oauth_states(cutoff)
+
+    @staticmethod
+    def _is_expired(data: dict) -> bool:
+        return time.time() - data["created_at"] > OAUTH_STATE_TTL
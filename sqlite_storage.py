@@ -0,0 +1,429 @@
+# -*- coding: utf-8 -*-
+"""
+Async SQLite backend for simple_storage.
+One row per user and per session. Writes are queued and applied in order by a
+single aiosqlite connection, so request handlers never wait on disk.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import os
+import sqlite3
+import time
+import uuid
+
+import aiosqlite
+
+from app_logging import get_logger
+from records import SessionRecord, UserRecord, to_epoch
+from storage_backend import StorageBackend
+
+log = get_logger("storage")
+
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS users (
+        uid TEXT PRIMARY KEY,
+        access_token TEXT,
+        refresh_token TEXT,
+        expires_at REAL,
+        created_at REAL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_users_expires_at ON users (expires_at)",
+    """CREATE TABLE IF NOT EXISTS sessions (
+        session_id TEXT PRIMARY KEY,
+        uid TEXT NOT NULL,
+        tweet_mode TEXT NOT NULL DEFAULT 'idle',
+        segments_count INTEGER NOT NULL DEFAULT 0,
+        accumulated_text TEXT NOT NULL DEFAULT '',
+        created_at REAL,
+        updated_at REAL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_sessions_uid ON sessions (uid)",
+    "CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at)",
+    """CREATE TABLE IF NOT EXISTS oauth_states (
+        state TEXT PRIMARY KEY,
+        uid TEXT NOT NULL,
+        code_verifier TEXT NOT NULL,
+        created_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_oauth_states_created_at ON oauth_states (created_at)",
+    """CREATE TABLE IF NOT EXISTS post_jobs (
+        job_id TEXT PRIMARY KEY,
+        session_id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        message TEXT NOT NULL DEFAULT '',
+        created_at REAL,
+        finished_at REAL,
+        undelivered INTEGER NOT NULL DEFAULT 0,
+        claim TEXT,
+        expires_at REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_post_jobs_session_id ON post_jobs (session_id)",
+    "CREATE INDEX IF NOT EXISTS idx_post_jobs_expires_at ON post_jobs (expires_at)",
+    """CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )""",
+)
+
+# Statements are constant strings with ? placeholders so sqlite3's statement
+# cache prepares each one once per connection.
+UPSERT_USER_SQL = """
+    INSERT INTO users (uid, access_token, refresh_token, expires_at, created_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (uid) DO UPDATE SET
+        access_token = excluded.access_token,
+        refresh_token = excluded.refresh_token,
+        expires_at = excluded.expires_at,
+        created_at = excluded.created_at
+"""
+DELETE_USER_SQL = "DELETE FROM users WHERE uid = ?"
+SELECT_USERS_SQL = "SELECT uid, access_token, refresh_token, expires_at, created_at FROM users"
+SELECT_USER_SQL = SELECT_USERS_SQL + " WHERE uid = ?"
+SELECT_EXPIRING_USERS_SQL = SELECT_USERS_SQL + " WHERE expires_at < ? AND refresh_token IS NOT NULL"
+
+UPSERT_SESSION_SQL = """
+    INSERT INTO sessions (session_id, uid, tweet_mode, segments_count, accumulated_text, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (session_id) DO UPDATE SET
+        tweet_mode = excluded.tweet_mode,
+        segments_count = excluded.segments_count,
+        accumulated_text = excluded.accumulated_text,
+        updated_at = excluded.updated_at
+"""
+DELETE_SESSION_SQL = "DELETE FROM sessions WHERE session_id = ?"
+SELECT_SESSIONS_SQL = "SELECT session_id, uid, tweet_mode, segments_count, accumulated_text, created_at FROM sessions"
+SELECT_SESSION_SQL = SELECT_SESSIONS_SQL + " WHERE session_id = ?"
+PURGE_SESSIONS_SQL = "DELETE FROM sessions WHERE updated_at < ?"
+
+UPSERT_OAUTH_STATE_SQL = """
+    INSERT OR REPLACE INTO oauth_states (state, uid, code_verifier, created_at)
+    VALUES (?, ?, ?, ?)
+"""
+DELETE_OAUTH_STATE_SQL = "DELETE FROM oauth_states WHERE state = ?"
+SELECT_OAUTH_STATE_SQL = "SELECT uid, code_verifier, created_at FROM oauth_states WHERE state = ?"
+PURGE_OAUTH_STATES_SQL = "DELETE FROM oauth_states WHERE created_at < ?"
+
+UPSERT_POST_JOB_SQL = """
+    INSERT OR REPLACE INTO post_jobs
+        (job_id, session_id, status, message, created_at, finished_at, undelivered, expires_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+SELECT_POST_JOBS_SQL = "SELECT job_id, session_id, status, message, created_at, finished_at FROM post_jobs"
+SELECT_POST_JOB_SQL = SELECT_POST_JOBS_SQL + " WHERE job_id = ? AND expires_at >= ?"
+# Unreported results are claimed with a one-off token, then read back by it, so
+# two workers never both report the same result
+CLAIM_POST_JOB_RESULTS_SQL = """
+    UPDATE post_jobs SET undelivered = 0, claim = ?
+    WHERE session_id = ? AND undelivered = 1 AND expires_at >= ?
+"""
+SELECT_CLAIMED_POST_JOB_SQL = SELECT_POST_JOBS_SQL + " WHERE claim = ? ORDER BY finished_at DESC LIMIT 1"
+ACK_POST_JOB_SQL = "UPDATE post_jobs SET undelivered = 0 WHERE job_id = ?"
+PURGE_POST_JOBS_SQL = "DELETE FROM post_jobs WHERE expires_at < ?"
+
+# Taken when free, expired or already ours; the owner read back after it says who holds it
+ACQUIRE_LEASE_SQL = """
+    INSERT INTO leases (name, owner, expires_at)
+    VALUES (?, ?, ?)
+    ON CONFLICT (name) DO UPDATE SET
+        owner = excluded.owner,
+        expires_at = excluded.expires_at
+    WHERE leases.owner = excluded.owner OR leases.expires_at < ?
+"""
+SELECT_LEASE_OWNER_SQL = "SELECT owner FROM leases WHERE name = ?"
+RELEASE_LEASE_SQL = "DELETE FROM leases WHERE name = ? AND owner = ?"
+PURGE_LEASES_SQL = "DELETE FROM leases WHERE expires_at < ?"
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+)
+
+# A batch that fails with a transient error (another worker holds the write
+# lock, disk full) is rolled back and retried after this delay, doubling up to
+# SQLITE_RETRY_MAX_DELAY; nothing is dropped
+SQLITE_RETRY_DELAY = 0.05
+SQLITE_RETRY_MAX_DELAY = float(os.getenv("SQLITE_RETRY_MAX_DELAY", "5"))
+_TRANSIENT_ERRORS = ("locked", "busy", "disk is full", "disk i/o error")
+
+
+def sqlite_path_from_url(url: str, base_dir: str) -> str:
+    """Turn sqlite[+aiosqlite]:///path into a file path (relative paths live in base_dir)."""
+    path = url.split(":///", 1)[-1]
+    if not os.path.isabs(path):
+        path = os.path.join(base_dir, path)
+    return os.path.normpath(path)
+
+
+def _user_params(uid: str, user: UserRecord) -> Tuple[Any, ...]:
+    return (uid, user.access_token, user.refresh_token, user.expires_at, user.created_at)
+
+
+def _user_from_row(row: Tuple[Any, ...]) -> UserRecord:
+    uid, access_token, refresh_token, expires_at, created_at = row
+    # to_epoch also reads rows written before timestamps were stored as REAL
+    return UserRecord(uid, access_token, refresh_token, to_epoch(expires_at), to_epoch(created_at))
+
+
+def _session_params(session_id: str, session: SessionRecord) -> Tuple[Any, ...]:
+    return (
+        session_id,
+        session.uid,
+        session.tweet_mode,
+        session.segments_count,
+        session.accumulated_text,
+        session.created_at,
+        time.time(),
+    )
+
+
+def _is_transient(error: Exception) -> bool:
+    """Whether retrying the same statements later can succeed."""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and any(text in message for text in _TRANSIENT_ERRORS)
+
+
+def _session_from_row(row: Tuple[Any, ...]) -> SessionRecord:
+    session_id, uid, tweet_mode, segments_count, accumulated_text, created_at = row
+    return SessionRecord(session_id, uid, tweet_mode, segments_count, accumulated_text, to_epoch(created_at))
+
+
+def _job_from_row(row: Optional[Tuple[Any, ...]]) -> Optional[dict]:
+    if not row:
+        return None
+    job_id, session_id, status, message, created_at, finished_at = row
+    return {
+        "job_id": job_id,
+        "session_id": session_id,
+        "status": status,
+        "message": message,
+        "created_at": created_at,
+        "finished_at": finished_at,
+    }
+
+
+class SQLiteBackend(StorageBackend):
+    """Persist users and sessions to SQLite (WAL mode)"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._writer_task: Optional[asyncio.Task] = None
+        self._conn: Optional[aiosqlite.Connection] = None
+        self.metrics["write_retries"] = 0
+        self._ensure_schema()
+
+    def _connect_sync(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _ensure_schema(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with self._connect_sync() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def load_users(self) -> Dict[str, UserRecord]:
+        with self._connect_sync() as conn:
+            return {row[0]: _user_from_row(row) for row in conn.execute(SELECT_USERS_SQL)}
+
+    async def load_user(self, uid: str) -> Optional[UserRecord]:
+        row = await self._read(SELECT_USER_SQL, (uid,))
+        return _user_from_row(row) if row else None
+
+    async def load_expiring_users(self, before: float) -> List[UserRecord]:
+        # A periodic scan that may lag queued writes: read it on its own
+        # connection instead of holding up the writer
+        return await asyncio.to_thread(self._select_expiring_users, before)
+
+    def _select_expiring_users(self, before: float) -> List[UserRecord]:
+        with self._connect_sync() as conn:
+            return [_user_from_row(row) for row in conn.execute(SELECT_EXPIRING_USERS_SQL, (before,))]
+
+    def load_sessions(self) -> Dict[str, SessionRecord]:
+        with self._connect_sync() as conn:
+            return {row[0]: _session_from_row(row) for row in conn.execute(SELECT_SESSIONS_SQL)}
+
+    async def load_session(self, session_id: str) -> Optional[SessionRecord]:
+        row = await self._read(SELECT_SESSION_SQL, (session_id,))
+        return _session_from_row(row) if row else None
+
+    async def preload_sessions(self) -> Dict[str, SessionRecord]:
+        # Nothing to bulk load: load_session() reads rows one at a time
+        return {}
+
+    def save_user(self, uid: str, user: UserRecord):
+        self._submit(UPSERT_USER_SQL, _user_params(uid, user))
+
+    def delete_user(self, uid: str):
+        self._submit(DELETE_USER_SQL, (uid,))
+
+    def save_session(self, session_id: str, session: SessionRecord):
+        self._submit(UPSERT_SESSION_SQL, _session_params(session_id, session))
+
+    def update_session(self, session_id: str, fields: dict, session: SessionRecord):
+        self._submit(UPSERT_SESSION_SQL, _session_params(session_id, session))
+
+    def delete_session(self, session_id: str):
+        self._submit(DELETE_SESSION_SQL, (session_id,))
+
+    def evict_session(self, session_id: str):
+        # The row stays; load_session() brings it back on the next webhook
+        pass
+
+    def purge_idle_sessions(self, cutoff: float):
+        self._submit(PURGE_SESSIONS_SQL, (cutoff,))
+        # Leases left behind by workers that died while holding them
+        self._submit(PURGE_LEASES_SQL, (time.time(),))
+        self._submit(PURGE_POST_JOBS_SQL, (time.time(),))
+
+    def save_oauth_state(self, state: str, data: dict):
+        self._submit(UPSERT_OAUTH_STATE_SQL, (state, data["uid"], data["code_verifier"], data["created_at"]))
+
+    def delete_oauth_state(self, state: str):
+        self._submit(DELETE_OAUTH_STATE_SQL, (state,))
+
+    def purge_oauth_states(self, cutoff: float):
+        self._submit(PURGE_OAUTH_STATES_SQL, (cutoff,))
+
+    async def load_oauth_state(self, state: str) -> Optional[dict]:
+        row = await self._read(SELECT_OAUTH_STATE_SQL, (state,))
+        if not row:
+            return None
+        uid, code_verifier, created_at = row
+        return {"uid": uid, "code_verifier": code_verifier, "created_at": created_at}
+
+    def save_job(self, job: dict, notify: bool, ttl: float):
+        self._submit(UPSERT_POST_JOB_SQL, (
+            job["job_id"], job["session_id"], job["status"], job["message"],
+            job["created_at"], job["finished_at"], int(notify), time.time() + ttl
+        ))
+
+    async def load_job(self, job_id: str) -> Optional[dict]:
+        return _job_from_row(await self._read(SELECT_POST_JOB_SQL, (job_id, time.time())))
+
+    async def take_job_result(self, session_id: str) -> Optional[dict]:
+        claim = uuid.uuid4().hex
+        self._submit(CLAIM_POST_JOB_RESULTS_SQL, (claim, session_id, time.time()))
+        return _job_from_row(await self._read(SELECT_CLAIMED_POST_JOB_SQL, (claim,)))
+
+    def ack_job_result(self, session_id: str, job_id: str):
+        self._submit(ACK_POST_JOB_SQL, (job_id,))
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        self._submit(ACQUIRE_LEASE_SQL, (name, owner, now + ttl, now))
+        row = await self._read(SELECT_LEASE_OWNER_SQL, (name,))
+        return row is not None and row[0] == owner
+
+    async def release_lease(self, name: str, owner: str):
+        # Queued behind this holder's writes, so the next holder reads them
+        self._submit(RELEASE_LEASE_SQL, (name, owner))
+
+    def start(self):
+        self._ensure_writer()
+
+    async def close(self):
+        """Apply every queued write, then close the connection."""
+        if self._writer_task is not None:
+            await self._queue.join()
+            self._writer_task.cancel()
+            self._writer_task = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    def _submit(self, sql: str, params: Tuple[Any, ...]):
+        """Queue a write for the background connection (or run it now outside an event loop)."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # Startup / scripts: no loop yet, a blocking write is fine here
+            with self._connect_sync() as conn:
+                conn.execute(sql, params)
+            return
+        self._queue.put_nowait((sql, params, None))
+        self._ensure_writer()
+
+    async def _read(self, sql: str, params: Tuple[Any, ...]) -> Optional[Tuple[Any, ...]]:
+        """Fetch one row through the writer connection, after every queued write."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((sql, params, waiter))
+        self._ensure_writer()
+        return await waiter
+
+    def _ensure_writer(self):
+        if self._writer_task is None:
+            self._writer_task = asyncio.get_running_loop().create_task(self._run_writer())
+
+    async def _run_writer(self):
+        self._conn = await aiosqlite.connect(self.path)
+        for pragma in PRAGMAS:
+            await self._conn.execute(pragma)
+        while True:
+            batch = [await self._queue.get()]
+            # Everything queued while we waited goes into the same transaction
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._apply(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _apply(self, batch: List[Tuple[str, Tuple[Any, ...], Optional[asyncio.Future]]]):
+        """Run a batch in one transaction, retrying it until it commits.
+
+        Read results are handed out only after the commit, so a caller never
+        acts on a write that was rolled back.
+        """
+        delay = SQLITE_RETRY_DELAY
+        while True:
+            started = time.perf_counter()
+            try:
+                rows = []
+                for sql, params, waiter in batch:
+                    cursor = await self._conn.execute(sql, params)
+                    rows.append(await cursor.fetchone() if waiter is not None else None)
+                await self._conn.commit()
+                break
+            except Exception as e:
+                await self._rollback()
+                if _is_transient(e):
+                    self.metrics["write_retries"] += 1
+                    log.warning("SQLite write failed, retrying %d statements: %s", len(batch), e)
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, SQLITE_RETRY_MAX_DELAY)
+                    continue
+                if len(batch) > 1:
+                    # One bad statement must not take the rest of the batch with it
+                    for item in batch:
+                        await self._apply([item])
+                    return
+                self.metrics["flush_errors"] += 1
+                sql, _, waiter = batch[0]
+                log.error("SQLite statement failed, dropped: %s (%s)", e, " ".join(sql.split())[:60])
+                if waiter is not None and not waiter.done():
+                    waiter.set_exception(e)
+                return
+        writes = 0
+        for (_, _, waiter), row in zip(batch, rows):
+            if waiter is None:
+                writes += 1
+            elif not waiter.done():
+                waiter.set_result(row)
+        if writes:
+            self._record_flush(started, writes)
+
+    async def _rollback(self):
+        try:
+            await self._conn.rollback()
+        except Exception as e:
+            log.warning("SQLite rollback failed: %s", e)
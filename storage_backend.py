@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Interface every simple_storage persistence backend implements.
+simple_storage keeps the in-memory users / sessions and calls a backend after
+each mutation; writes must not block the event loop.
+"""
+from typing import Dict, List, Optional
+import time
+
+from records import SessionRecord, UserRecord
+
+
+class StorageBackend:
+    """Base class for JSON / SQLite / Redis persistence"""
+
+    name = "base"
+    # State lives outside this process; every lookup must read the backend
+    shared = False
+
+    def __init__(self):
+        self.metrics = {
+            "flushes": 0,
+            "coalesced_writes": 0,
+            "flush_errors": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    # Startup bulk loads (blocking, before the event loop starts serving)
+    def load_users(self) -> Dict[str, UserRecord]:
+        return {}
+
+    def load_sessions(self) -> Dict[str, SessionRecord]:
+        return {}
+
+    def load_oauth_states(self) -> Dict[str, dict]:
+        return {}
+
+    # Point reads
+    async def load_user(self, uid: str) -> Optional[UserRecord]:
+        return None
+
+    async def load_session(self, session_id: str) -> Optional[SessionRecord]:
+        return None
+
+    async def preload_sessions(self) -> Dict[str, SessionRecord]:
+        """Lazy mode: sessions to load on first session access."""
+        return {}
+
+    async def load_oauth_state(self, state: str) -> Optional[dict]:
+        return None
+
+    async def load_expiring_users(self, before: float) -> List[UserRecord]:
+        """Shared mode: users whose access token expires before `before` (epoch seconds)."""
+        return []
+
+    # Writes (queued; must return without waiting on I/O)
+    def save_user(self, uid: str, user: UserRecord):
+        raise NotImplementedError
+
+    def delete_user(self, uid: str):
+        raise NotImplementedError
+
+    def save_session(self, session_id: str, session: SessionRecord):
+        raise NotImplementedError
+
+    def update_session(self, session_id: str, fields: dict, session: SessionRecord):
+        raise NotImplementedError
+
+    def delete_session(self, session_id: str):
+        raise NotImplementedError
+
+    def evict_session(self, session_id: str):
+        """A session left the memory cache; keep it if load_session can bring it back."""
+        pass
+
+    def purge_idle_sessions(self, cutoff: float):
+        """Drop stored sessions last written (or evicted) before cutoff (epoch seconds)."""
+        pass
+
+    def save_oauth_state(self, state: str, data: dict):
+        pass
+
+    def delete_oauth_state(self, state: str):
+        pass
+
+    def purge_oauth_states(self, cutoff: float):
+        """Drop OAuth states created before cutoff (epoch seconds)."""
+        pass
+
+    # Post jobs (shared mode): status kept for ttl seconds so any worker can
+    # report a job another one ran
+    def save_job(self, job: dict, notify: bool, ttl: float):
+        """Store a job's status; notify marks it as a result still to be reported."""
+        pass
+
+    async def load_job(self, job_id: str) -> Optional[dict]:
+        return None
+
+    async def take_job_result(self, session_id: str) -> Optional[dict]:
+        """Latest unreported result for the session, reported to one caller only."""
+        return None
+
+    def ack_job_result(self, session_id: str, job_id: str):
+        """The job's result was reported some other way (e.g. polled)."""
+        pass
+
+    # Leases: named locks shared by every process using this backend
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Take name for ttl seconds (or extend it if owner holds it); False if someone else does."""
+        # Only one process uses this backend
+        return True
+
+    async def release_lease(self, name: str, owner: str):
+        """Give name up, if owner still holds it."""
+        pass
+
+    # Lifecycle
+    def start(self):
+        """Start background tasks (called with the event loop running)."""
+        pass
+
+    async def close(self):
+        """Persist everything still queued."""
+        pass
+
+    def _record_flush(self, started: float, writes: int):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.metrics["flushes"] += 1
+        self.metrics["coalesced_writes"] += writes - 1
+        self.metrics["last_flush_ms"] = round(elapsed_ms, 3)
+        self.metrics["max_flush_ms"] = round(max(self.metrics["max_flush_ms"], elapsed_ms), 3)
+        self.metrics["total_flush_ms"] = round(self.metrics["total_flush_ms"] + elapsed_ms, 3)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Shared test setup.
+The app modules live at the repository root; storage settings are pinned
+here, before any test imports simple_storage, so a developer's .env or data
+files are never touched.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.update({
+    "STORAGE_DIR": tempfile.mkdtemp(prefix="omi-test-storage-"),
+    "DATABASE_URL": "",
+    "REDIS_URL": "",
+    "STORAGE_SHARED": "",
+    "STORAGE_LAZY_LOAD": "",
+    "WEB_CONCURRENCY": "1",
+    "LOG_LEVEL": "WARNING",
+})
+
+
+@pytest.fixture
+def json_storage(tmp_path, monkeypatch):
+    """simple_storage backed by a fresh JsonFileBackend writing under tmp_path."""
+    import simple_storage
+
+    paths = {
+        "USERS_FILE": "users_data.json",
+        "USERS_SHARD_DIR": "users",
+        "SESSIONS_FILE": "sessions_data.json",
+        "SESSIONS_JOURNAL_FILE": "sessions_journal.jsonl",
+        "OAUTH_STATES_FILE": "oauth_states.json",
+    }
+    for name, filename in paths.items():
+        monkeypatch.setattr(simple_storage, name, str(tmp_path / filename))
+    _clear_memory(simple_storage)
+    backend = simple_storage.JsonFileBackend()
+    monkeypatch.setattr(simple_storage, "backend", backend)
+    yield backend
+    if backend._journal_file is not None:
+        backend._journal_file.close()
+    _clear_memory(simple_storage)
+
+
+def _clear_memory(simple_storage):
+    simple_storage.users.clear()
+    simple_storage.sessions.clear()
+    simple_storage.oauth_states.clear()
+    simple_storage._missing_sessions.clear()
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from completeness import CompletenessScorer, completeness_score
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Best day ever", 0.8),
+    ("Best day ever!", 1.0),
+    ("I really think that", 0.1),
+    ("I really think that,", 0.0),
+    ("", 0.0),
+    # desu / masu endings, with and without the full stop
+    ("\u4eca\u65e5\u306f\u6674\u308c\u3067\u3059", 0.85),  # "it is sunny today"
+    ("\u516c\u5712\u3092\u6563\u6b69\u3057\u307e\u3059\u3002", 1.0),  # "I walk in the park."
+    # "the weather ..." ends on the particle ga: more is coming
+    ("\u5929\u6c17\u304c", 0.1),
+])
+def test_completeness_score(text, expected):
+    assert completeness_score(text) == expected
+
+
+def test_trailing_off_is_no_evidence():
+    assert completeness_score("so I was thinking...") == completeness_score("so I was thinking")
+
+
+def test_scorer_trusts_only_confident_scores():
+    scorer = CompletenessScorer(confidence=0.6)
+    assert scorer.is_confident(completeness_score("Best day ever"))
+    assert scorer.is_confident(completeness_score("I really think that"))
+    assert not scorer.is_confident(completeness_score("went to the park today with friends"))
+    assert scorer.snapshot()["escalated"] == 1
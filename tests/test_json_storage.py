@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import errno
+import threading
+import time
+
+import simple_storage
+from records import SessionRecord
+from simple_storage import JsonFileBackend, OAuthStateStorage, SimpleSessionStorage, SimpleUserStorage
+
+
+def _fail_once(monkeypatch, module, name):
+    real = getattr(module, name)
+    calls = {"count": 0}
+
+    def flaky(*args, **kwargs):
+        calls["count"] += 1
+        if calls["count"] == 1:
+            raise OSError(errno.ENOSPC, "No space left on device")
+        return real(*args, **kwargs)
+
+    monkeypatch.setattr(module, name, flaky)
+
+
+def test_user_kept_after_failed_shard_write(json_storage, monkeypatch):
+    _fail_once(monkeypatch, simple_storage, "_write_json_atomic")
+
+    async def run():
+        json_storage.start()
+        SimpleUserStorage.save_user("u1", "access", "refresh")
+        assert not await json_storage.flush()
+        # Shutdown flush writes what the failed flush could not
+        await json_storage.close()
+
+    asyncio.run(run())
+    assert json_storage.metrics["flush_errors"] == 1
+    assert JsonFileBackend().load_users()["u1"].refresh_token == "refresh"
+
+
+def test_journal_records_kept_after_failed_append(json_storage, monkeypatch):
+    _fail_once(monkeypatch, simple_storage.os, "fsync")
+
+    async def run():
+        json_storage.start()
+        json_storage.save_session("s1", SessionRecord.new("s1", "u1"))
+        json_storage.update_session("s1", {"tweet_mode": "recording"}, None)
+        assert not await json_storage.flush()
+        assert await json_storage.flush()
+
+    asyncio.run(run())
+    json_storage._journal_file.close()
+    json_storage._journal_file = None
+    # The partly written batch was cut off before the retry: no duplicates, no torn line
+    with open(simple_storage.SESSIONS_JOURNAL_FILE) as f:
+        assert len(f.readlines()) == 2
+    assert JsonFileBackend().load_sessions()["s1"].tweet_mode == "recording"
+
+
+def _write_oauth_file(states):
+    simple_storage._write_json_atomic(simple_storage.OAUTH_STATES_FILE, states)
+
+
+def test_lazy_oauth_state_survives_restart(json_storage):
+    saved = {"uid": "u1", "code_verifier": "verifier", "created_at": time.time() - 5}
+    _write_oauth_file({"old": saved})
+
+    async def run():
+        json_storage.start()
+        return await OAuthStateStorage.fetch_oauth_state("old")
+
+    assert asyncio.run(run()) == saved
+
+
+def test_lazy_oauth_flush_keeps_states_on_disk(json_storage):
+    created = time.time() - 5
+    _write_oauth_file({
+        "old": {"uid": "u1", "code_verifier": "v1", "created_at": created},
+        "gone": {"uid": "u2", "code_verifier": "v2", "created_at": created},
+    })
+
+    async def run():
+        json_storage.start()
+        # Neither call has read the file yet: both must merge it before the rewrite
+        OAuthStateStorage.save_oauth_state("new", "u3", "v3")
+        simple_storage.oauth_states.pop("gone")
+        json_storage.delete_oauth_state("gone")
+        assert await json_storage.flush()
+
+    asyncio.run(run())
+    on_disk = JsonFileBackend().load_oauth_states()
+    assert list(on_disk) == ["old", "new"]
+    assert list(simple_storage.oauth_states) == ["old", "new"]
+
+
+def test_close_waits_for_running_flush(json_storage, monkeypatch):
+    real_flush = json_storage._flush_sync
+    state = {"running": 0, "overlaps": 0, "calls": 0}
+    lock = threading.Lock()
+
+    def slow_flush(*pending):
+        with lock:
+            state["running"] += 1
+            state["calls"] += 1
+            state["overlaps"] += state["running"] > 1
+        try:
+            time.sleep(0.1)
+            return real_flush(*pending)
+        finally:
+            with lock:
+                state["running"] -= 1
+
+    monkeypatch.setattr(json_storage, "_flush_sync", slow_flush)
+    monkeypatch.setattr(simple_storage, "FLUSH_INTERVAL_MS", 0)
+
+    async def run():
+        json_storage.start()
+        SimpleUserStorage.save_user("u1", "access", "refresh")
+        while not state["running"]:
+            await asyncio.sleep(0.005)
+        # Written while the flusher's flush is in its thread
+        json_storage.save_session("s1", SessionRecord.new("s1", "u1"))
+        await json_storage.close()
+
+    asyncio.run(run())
+    assert state["overlaps"] == 0
+    assert state["calls"] >= 2
+    assert JsonFileBackend().load_users()["u1"].refresh_token == "refresh"
+    assert "s1" in JsonFileBackend().load_sessions()
+
+
+def test_evicted_recording_session_reloads_after_compaction(json_storage, monkeypatch):
+    monkeypatch.setattr(simple_storage.sessions, "max_entries", 1)
+    monkeypatch.setattr(simple_storage.sessions, "idle_ttl", 0)
+    simple_storage.load_storage()
+
+    async def run():
+        json_storage.start()
+        SimpleSessionStorage.get_or_create_session("s1", "u1")
+        SimpleSessionStorage.update_session("s1", tweet_mode="recording", accumulated_text="hello", segments_count=1)
+        # s2 pushes s1 out of memory, then the sweeper finds both idle
+        SimpleSessionStorage.get_or_create_session("s2", "u1")
+        evicted = simple_storage.sessions.sweep()
+        simple_storage._drop_sessions(evicted)
+        await json_storage.compact_sessions()
+        reloaded = await SimpleSessionStorage.find_session("s1")
+        await json_storage.close()
+        return reloaded
+
+    reloaded = asyncio.run(run())
+    assert (reloaded.tweet_mode, reloaded.accumulated_text) == ("recording", "hello")
+    stored = JsonFileBackend().load_sessions()
+    assert stored["s1"].accumulated_text == "hello"
+    # Not recording: nothing to keep
+    assert "s2" not in stored
+
+
+def test_evicted_session_dropped_after_stored_ttl(json_storage):
+    simple_storage.load_storage()
+
+    async def run():
+        json_storage.start()
+        SimpleSessionStorage.get_or_create_session("s1", "u1")
+        SimpleSessionStorage.update_session("s1", tweet_mode="recording")
+        simple_storage._drop_sessions([("s1", simple_storage.sessions.pop("s1"))])
+        json_storage.purge_idle_sessions(time.time() + 1)
+        reloaded = await SimpleSessionStorage.find_session("s1")
+        await json_storage.close()
+        return reloaded
+
+    assert asyncio.run(run()) is None
+    assert "s1" not in JsonFileBackend().load_sessions()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Several worker processes on one STORAGE_DIR in shared mode, all appending
+segments to the same recording session at once.
+"""
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+pytest.importorskip("tweepy")
+
+from records import SessionRecord, UserRecord
+from sqlite_storage import SQLiteBackend
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKERS = 4
+SEGMENTS_PER_WORKER = 10
+
+# Runs in each worker: wait for the others, then fire every segment at once
+WORKER = r"""
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+import main_simple
+
+worker, count, go_file = int(sys.argv[1]), int(sys.argv[2]), sys.argv[3]
+
+
+async def main():
+    await main_simple.startup()
+    open(go_file + f".ready{worker}", "w").close()
+    while not os.path.exists(go_file):
+        time.sleep(0.01)
+    transport = httpx.ASGITransport(app=main_simple.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://worker") as client:
+        responses = await asyncio.gather(*(
+            client.post(
+                "/webhook",
+                params={"uid": "u1", "session_id": "s1"},
+                json=[{"text": f"w{worker}s{i}"}]
+            )
+            for i in range(count)
+        ))
+    await main_simple.shutdown()
+    assert all(response.status_code == 200 for response in responses), responses
+
+
+asyncio.run(main())
+"""
+
+
+def test_workers_do_not_lose_each_others_segments(tmp_path):
+    storage_dir = tmp_path / "storage"
+    storage_dir.mkdir()
+    db_path = str(storage_dir / "omi.db")
+    seed = SQLiteBackend(db_path)
+    now = time.time()
+    seed.save_user("u1", UserRecord("u1", "access", "refresh", now + 7200, now))
+    seed.save_session("s1", SessionRecord("s1", "u1", "recording", 1, "start", now))
+
+    env = {
+        **os.environ,
+        "STORAGE_DIR": str(storage_dir),
+        "STORAGE_SHARED": "true",
+        "DATABASE_URL": "sqlite+aiosqlite:///omi.db",
+        "SEGMENTS_REQUIRED": "1000",
+        "EPHEMERAL_SESSIONS": "true",
+    }
+    go_file = str(tmp_path / "go")
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-c", WORKER, str(worker), str(SEGMENTS_PER_WORKER), go_file],
+            cwd=ROOT,
+            env=env
+        )
+        for worker in range(WORKERS)
+    ]
+    try:
+        deadline = time.monotonic() + 60
+        while not all(os.path.exists(f"{go_file}.ready{worker}") for worker in range(WORKERS)):
+            assert time.monotonic() < deadline, "workers did not start"
+            assert all(process.poll() is None for process in workers), "a worker exited early"
+            time.sleep(0.05)
+        open(go_file, "w").close()
+        assert [process.wait(timeout=60) for process in workers] == [0] * WORKERS
+    finally:
+        for process in workers:
+            if process.poll() is None:
+                process.kill()
+
+    with sqlite3.connect(db_path) as conn:
+        segments_count, accumulated_text = conn.execute(
+            "SELECT segments_count, accumulated_text FROM sessions WHERE session_id = 's1'"
+        ).fetchone()
+    words = accumulated_text.split()
+    assert segments_count == 1 + WORKERS * SEGMENTS_PER_WORKER
+    assert sorted(words) == sorted(
+        ["start"] + [f"w{worker}s{i}" for worker in range(WORKERS) for i in range(SEGMENTS_PER_WORKER)]
+    )
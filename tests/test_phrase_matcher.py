@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from phrase_matcher import PhraseMatcher, PhraseStreams
+
+EKUSU_NAU = "\u3048\u304f\u3059\u306a\u3046"  # "x now" in hiragana
+PHRASES = {"trigger": ["x now", "tweet now", EKUSU_NAU], "end": ["end tweet", "now"]}
+
+
+def test_scan_finds_overlapping_phrases_of_every_kind():
+    result = PhraseMatcher(PHRASES).scan("so X  Now it is, end tweet")
+    assert [(match.phrase, match.kind) for match in result.matches] == [
+        ("x now", "trigger"), ("now", "end"), ("end tweet", "end"),
+    ]
+    assert result.first("trigger").phrase == "x now"
+    assert result.ending_at("end", result.length).phrase == "end tweet"
+
+
+def test_source_span_points_into_the_original_text():
+    text = "so  X\tNOW\u3000hello"
+    result = PhraseMatcher(PHRASES).scan(text)
+    start, end = result.source_span(result.first("trigger"))
+    assert text[start:end] == "X\tNOW"
+    assert text[end:].strip() == "hello"
+
+
+def test_katakana_and_hiragana_spellings_match():
+    matcher = PhraseMatcher(PHRASES)
+    # Katakana, with a small tsu, mixed
+    for text in ("\u30a8\u30af\u30b9\u30ca\u30a6", "\u30a8\u30c3\u30af\u30b9\u306a\u3046", "\u3048\u304f\u3059\u30ca\u30a6"):
+        assert matcher.scan(text).has("trigger"), text
+
+
+def test_text_without_phrases():
+    result = PhraseMatcher(PHRASES).scan("nothing to see here")
+    assert not result.matches
+    assert result.first("trigger") is None
+
+
+def test_stream_finds_trigger_split_across_chunks():
+    matcher, streams = PhraseMatcher(PHRASES), PhraseStreams()
+    assert not streams.feed("s1", matcher, "ok so x").has("trigger")
+    text = "now hello"
+    result = streams.feed("s1", matcher, text)
+    trigger = result.first("trigger")
+    assert trigger.phrase == "x now" and trigger.start < 0
+    # Content starts after the part of the trigger in this chunk
+    assert text[result.source_span(trigger)[1]:].strip() == "hello"
+
+
+def test_stream_joins_japanese_chunks_without_a_space():
+    matcher, streams = PhraseMatcher(PHRASES), PhraseStreams()
+    streams.feed("s1", matcher, "\u4eca\u65e5\u306f\u30a8\u30af")
+    assert streams.feed("s1", matcher, "\u30b9\u306a\u3046\u304a\u306f\u3088\u3046").has("trigger")
+
+
+def test_streams_are_separate_and_reset():
+    matcher, streams = PhraseMatcher(PHRASES), PhraseStreams()
+    streams.feed("s1", matcher, "x")
+    assert not streams.feed("s2", matcher, "now").has("trigger")
+    streams.reset("s1")
+    assert not streams.feed("s1", matcher, "now").has("trigger")
+
+
+def test_stream_survives_a_matcher_change():
+    streams = PhraseStreams()
+    streams.feed("s1", PhraseMatcher(PHRASES), "please tweet")
+    # Phrases reloaded between chunks: the state is rebuilt from the kept tail
+    assert streams.feed("s1", PhraseMatcher(dict(PHRASES)), "now").has("trigger")
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+import pytest
+
+from phrase_registry import PhraseRegistry
+
+DEFAULTS = {"trigger": ["x now"], "end": ["end tweet"]}
+PHRASES = {
+    "default_locale": "en",
+    "locales": {"en": {"trigger": ["tweet now"]}, "ja": {"trigger": ["\u3048\u304f\u3059\u306a\u3046"]}},
+    "users": {"u1": {"locale": "ja", "trigger": ["hey x post"]}},
+}
+
+
+def _write(path, config, bump: int = 0):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(config if isinstance(config, str) else json.dumps(config))
+    # Several writes within one test can share a timestamp; the registry reloads on mtime
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + bump * 1_000_000_000))
+
+
+def _triggers(registry, uid=None, text="") -> bool:
+    return registry.matcher_for(uid).scan(text).has("trigger")
+
+
+def test_user_then_locale_then_default_phrases(tmp_path):
+    path = tmp_path / "phrases.json"
+    _write(path, PHRASES)
+    registry = PhraseRegistry(DEFAULTS, path=str(path), reload_interval=0)
+
+    assert _triggers(registry, "u1", "hey x post hello")
+    assert not _triggers(registry, "u1", "tweet now hello")
+    # Other users get the default locale; the built-in end phrases fill the gap
+    assert _triggers(registry, "u2", "tweet now hello")
+    assert registry.matcher_for("u2").scan("that's all end tweet").has("end")
+
+
+def test_edited_file_is_reloaded(tmp_path):
+    path = tmp_path / "phrases.json"
+    _write(path, PHRASES)
+    registry = PhraseRegistry(DEFAULTS, path=str(path), reload_interval=0)
+    assert not _triggers(registry, "u2", "post it now")
+
+    _write(path, {**PHRASES, "locales": {"en": {"trigger": ["post it now"]}}}, bump=1)
+    assert _triggers(registry, "u2", "post it now")
+    assert registry.metrics["reloads"] == 2
+
+
+@pytest.mark.parametrize("config", [
+    "{not json",
+    ["x now"],
+    {**PHRASES, "default_locale": ["en"]},
+    {**PHRASES, "users": {"u1": {"locale": ["ja"]}}},
+    {**PHRASES, "users": {"u1": "ja"}},
+    {**PHRASES, "locales": {"en": {"trigger": "tweet now"}}},
+    {**PHRASES, "locales": {"en": {"trigger": [1]}}},
+    {**PHRASES, "default": ["end tweet"]},
+])
+def test_invalid_file_keeps_previous_phrases(tmp_path, config):
+    path = tmp_path / "phrases.json"
+    _write(path, PHRASES)
+    registry = PhraseRegistry(DEFAULTS, path=str(path), reload_interval=0)
+    assert _triggers(registry, "u1", "hey x post hello")
+
+    _write(path, config, bump=1)
+    assert _triggers(registry, "u1", "hey x post hello")
+    assert _triggers(registry, "u2", "tweet now hello")
+    assert registry.metrics["reload_errors"] == 1
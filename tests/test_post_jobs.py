@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import post_jobs
+from post_jobs import PostJob, PostJobQueue
+
+
+async def _slow_post(job: PostJob):
+    await asyncio.sleep(0.2)
+    return "posted", f"Posted to X: '{job.text}'"
+
+
+def test_close_waits_for_running_job():
+    async def run():
+        queue = PostJobQueue(_slow_post, workers=1)
+        queue.start()
+        job = queue.submit("u1", "s1", "hello")
+        # The worker has taken the job: the queue itself is empty now
+        while job.status != "running":
+            await asyncio.sleep(0.01)
+        await queue.close()
+        return job
+
+    job = asyncio.run(run())
+    assert job.status == "posted"
+    assert job.done
+
+
+def test_close_gives_up_after_drain_timeout(monkeypatch):
+    monkeypatch.setattr(post_jobs, "POST_JOB_DRAIN_TIMEOUT", 0.05)
+
+    async def run():
+        queue = PostJobQueue(_slow_post, workers=1)
+        queue.start()
+        jobs = [queue.submit("u1", "s1", "one"), queue.submit("u1", "s2", "two")]
+        await queue.close()
+        return jobs
+
+    jobs = asyncio.run(run())
+    assert not any(job.done for job in jobs)
+
+
+def test_result_reported_by_another_worker(tmp_path):
+    from sqlite_storage import SQLiteBackend
+
+    path = str(tmp_path / "omi.db")
+    # Two workers on one database: the job runs on the first, the user reaches the second
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+
+    async def run():
+        runner = PostJobQueue(_slow_post, workers=1, store=first)
+        other = PostJobQueue(_slow_post, workers=1, store=second)
+        runner.start()
+        job = runner.submit("u1", "s1", "hello")
+        await first.close()
+        queued = await other.fetch(job.job_id)
+        await runner.close()
+        await first.close()
+        finished = await other.fetch(job.job_id)
+        results = [await other.take_result("s1"), await runner.take_result("s1")]
+        await first.close()
+        await second.close()
+        return queued, finished, results
+
+    queued, finished, (taken, taken_again) = asyncio.run(run())
+    assert queued.status in ("queued", "running")
+    assert (finished.status, finished.message) == ("posted", "Posted to X: 'hello'")
+    assert taken.job_id == finished.job_id
+    # Reported once, whichever worker asks next
+    assert taken_again is None
+
+
+def test_polled_result_is_not_reported_again(tmp_path):
+    from sqlite_storage import SQLiteBackend
+
+    backend = SQLiteBackend(str(tmp_path / "omi.db"))
+
+    async def run():
+        queue = PostJobQueue(_slow_post, workers=1, store=backend)
+        queue.start()
+        job = queue.submit("u1", "s1", "hello")
+        await queue.close()
+        queue.ack(await queue.fetch(job.job_id))
+        taken = await queue.take_result("s1")
+        await backend.close()
+        return taken
+
+    assert asyncio.run(run()) is None
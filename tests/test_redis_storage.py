@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""RedisBackend against fakeredis's in-process TCP server."""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from records import SessionRecord, UserRecord
+from redis_storage import RedisBackend, RespClient
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+@pytest.fixture
+def redis_url():
+    server = fakeredis.TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address
+    yield f"redis://{host}:{port}/0"
+    server.shutdown()
+    server.server_close()
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_users_round_trip_as_hashes(redis_url):
+    async def run():
+        backend = RedisBackend(redis_url, session_ttl=60, oauth_ttl=60)
+        backend.save_user("u1", UserRecord("u1", "access", None, 2e9, 1e9))
+        user = await backend.load_user("u1")
+        backend.delete_user("u1")
+        missing = await backend.load_user("u1")
+        await backend.close()
+        return user, missing
+
+    user, missing = _run(run())
+    assert user == UserRecord("u1", "access", None, 2e9, 1e9)
+    assert missing is None
+
+
+def test_expiring_users_come_from_the_expiry_index(redis_url):
+    async def run():
+        backend = RedisBackend(redis_url, session_ttl=60, oauth_ttl=60)
+        backend.save_user("soon", UserRecord("soon", "access", "refresh", 1000.0, 0.0))
+        backend.save_user("later", UserRecord("later", "access", "refresh", 5000.0, 0.0))
+        backend.save_user("gone", UserRecord("gone", "access", "refresh", 1000.0, 0.0))
+        backend.delete_user("gone")
+        expiring = await backend.load_expiring_users(2000.0)
+        await backend.close()
+        return expiring
+
+    assert [user.uid for user in _run(run())] == ["soon"]
+
+
+def test_session_updates_are_pipelined_and_push_out_the_ttl(redis_url):
+    async def run():
+        backend = RedisBackend(redis_url, session_ttl=60, oauth_ttl=60)
+        session = SessionRecord("s1", "u1", created_at=1e9)
+        backend.save_session("s1", session)
+        session.tweet_mode, session.segments_count = "recording", 2
+        # Only the changed fields are sent, HSET and EXPIRE in the same pipeline
+        backend.update_session("s1", {"tweet_mode": "recording", "segments_count": 2}, session)
+        stored = await backend.load_session("s1")
+        client = RespClient(redis_url)
+        ttl = await client.execute("TTL", "omi:session:s1")
+        await client.close()
+        await backend.close()
+        return stored, ttl
+
+    stored, ttl = _run(run())
+    assert stored == SessionRecord("s1", "u1", "recording", 2, "", 1e9)
+    assert 0 < ttl <= 60
+    assert RedisBackend.update_session is not RedisBackend.save_session
+
+
+def test_idle_session_expires(redis_url):
+    async def run():
+        backend = RedisBackend(redis_url, session_ttl=1, oauth_ttl=60)
+        backend.save_session("s1", SessionRecord("s1", "u1"))
+        before = await backend.load_session("s1")
+        await asyncio.sleep(1.1)
+        after = await backend.load_session("s1")
+        await backend.close()
+        return before, after
+
+    before, after = _run(run())
+    assert before is not None
+    assert after is None
+
+
+def test_oauth_state_keys_expire(redis_url):
+    async def run():
+        backend = RedisBackend(redis_url, session_ttl=60, oauth_ttl=30)
+        data = {"uid": "u1", "code_verifier": "verifier", "created_at": time.time()}
+        backend.save_oauth_state("state1", data)
+        loaded = await backend.load_oauth_state("state1")
+        client = RespClient(redis_url)
+        ttl = await client.execute("TTL", "omi:oauth:state1")
+        await client.close()
+        backend.delete_oauth_state("state1")
+        deleted = await backend.load_oauth_state("state1")
+        await backend.close()
+        return data, loaded, ttl, deleted
+
+    data, loaded, ttl, deleted = _run(run())
+    assert loaded == data
+    assert 0 < ttl <= 30
+    assert deleted is None
+
+
+def test_cancelled_read_is_not_a_flush_error(redis_url):
+    async def run():
+        backend = RedisBackend(redis_url, session_ttl=60, oauth_ttl=60)
+        backend.save_user("u1", UserRecord("u1", "access", "refresh", 2e9, 1e9))
+        reader = asyncio.get_running_loop().create_task(backend.load_user("u1"))
+        await asyncio.sleep(0)
+        reader.cancel()
+        user = await backend.load_user("u1")
+        await backend.close()
+        return backend.metrics, user
+
+    metrics, user = _run(run())
+    assert metrics["flush_errors"] == 0
+    assert user is not None and user.refresh_token == "refresh"
+
+
+def test_lease_held_by_one_owner_at_a_time(redis_url):
+    async def run():
+        first = RedisBackend(redis_url, session_ttl=60, oauth_ttl=60)
+        second = RedisBackend(redis_url, session_ttl=60, oauth_ttl=60)
+        results = [
+            await first.acquire_lease("session:s1", "worker-1", 30),
+            await second.acquire_lease("session:s1", "worker-2", 30),
+            await first.acquire_lease("session:s1", "worker-1", 30),
+        ]
+        await second.release_lease("session:s1", "worker-2")  # not its lease: no-op
+        results.append(await second.acquire_lease("session:s1", "worker-2", 30))
+        await first.release_lease("session:s1", "worker-1")
+        await first.close()  # the DEL is queued; let it reach the server
+        results.append(await second.acquire_lease("session:s1", "worker-2", 30))
+        await second.close()
+        return results
+
+    assert _run(run()) == [True, False, True, False, True]
+
+
+def test_writes_survive_a_dropped_connection(redis_url, monkeypatch):
+    import redis_storage
+
+    pipeline = RespClient.pipeline
+    calls = {"count": 0}
+
+    async def flaky_pipeline(self, commands):
+        calls["count"] += 1
+        if calls["count"] == 1:
+            raise ConnectionResetError("Connection reset by peer")
+        return await pipeline(self, commands)
+
+    monkeypatch.setattr(RespClient, "pipeline", flaky_pipeline)
+    monkeypatch.setattr(redis_storage, "REDIS_RETRY_DELAY", 0.001)
+
+    async def run():
+        backend = RedisBackend(redis_url, session_ttl=60, oauth_ttl=60)
+        # A rotated refresh token must not be lost to one connection blip
+        backend.save_user("u1", UserRecord("u1", "access", "rotated", 2e9, 1e9))
+        await backend.close()
+        reader = RedisBackend(redis_url, session_ttl=60, oauth_ttl=60)
+        user = await reader.load_user("u1")
+        await reader.close()
+        return backend.metrics, user
+
+    metrics, user = _run(run())
+    assert metrics["write_retries"] == 1
+    assert metrics["flush_errors"] == 0
+    assert user.refresh_token == "rotated"
+
+
+def test_expired_holder_cannot_release_the_next_lease(redis_url):
+    async def run():
+        backend = RedisBackend(redis_url, session_ttl=60, oauth_ttl=60)
+        results = [await backend.acquire_lease("scheduler", "worker-1", 0.05)]
+        await asyncio.sleep(0.1)
+        results.append(await backend.acquire_lease("scheduler", "worker-2", 30))
+        # worker-1 wakes up late and lets go of what it thinks is its lease
+        await backend.release_lease("scheduler", "worker-1")
+        results.append(await backend.acquire_lease("scheduler", "worker-3", 30))
+        results.append(await backend.acquire_lease("scheduler", "worker-2", 30))
+        await backend.close()
+        return results
+
+    assert _run(run()) == [True, True, False, True]
+
+
+def test_job_result_taken_once_across_workers(redis_url):
+    job = {
+        "job_id": "j1",
+        "session_id": "s1",
+        "status": "posted",
+        "message": "Posted to X: 'hi'",
+        "created_at": 1.0,
+        "finished_at": 2.0,
+    }
+
+    async def run():
+        first = RedisBackend(redis_url, session_ttl=60, oauth_ttl=60)
+        second = RedisBackend(redis_url, session_ttl=60, oauth_ttl=60)
+        first.save_job(job, notify=True, ttl=60)
+        await first._queue.join()
+        loaded = await second.load_job("j1")
+        taken = await asyncio.gather(first.take_job_result("s1"), second.take_job_result("s1"))
+        # Acked by a /jobs poll: nothing left to report
+        first.save_job({**job, "job_id": "j2"}, notify=True, ttl=60)
+        first.ack_job_result("s1", "j2")
+        after_ack = await first.take_job_result("s1")
+        ttl = await first._read(("TTL", "omi:job:j1"))
+        await first.close()
+        await second.close()
+        return loaded, taken, after_ack, ttl
+
+    loaded, taken, after_ack, ttl = _run(run())
+    assert loaded == job
+    assert sorted(taken, key=lambda data: data is None) == [job, None]
+    assert after_ack is None
+    assert 0 < ttl <= 60
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import sqlite3
+
+import aiosqlite
+
+import sqlite_storage
+from records import UserRecord
+from sqlite_storage import SQLiteBackend, UPSERT_USER_SQL
+
+
+def _user(uid: str) -> UserRecord:
+    return UserRecord(uid, f"access-{uid}", f"refresh-{uid}", 2e9, 1e9)
+
+
+def _stored_uids(path: str) -> set:
+    with sqlite3.connect(path) as conn:
+        return {row[0] for row in conn.execute("SELECT uid FROM users")}
+
+
+def test_transient_failure_retries_whole_batch(tmp_path, monkeypatch):
+    path = str(tmp_path / "omi.db")
+    backend = SQLiteBackend(path)
+    execute = aiosqlite.Connection.execute
+    calls = {"users": 0}
+
+    async def flaky_execute(self, sql, parameters=None):
+        if sql is UPSERT_USER_SQL:
+            calls["users"] += 1
+            if calls["users"] == 2:
+                raise sqlite3.OperationalError("database is locked")
+        return await execute(self, sql, parameters)
+
+    monkeypatch.setattr(aiosqlite.Connection, "execute", flaky_execute)
+    monkeypatch.setattr(sqlite_storage, "SQLITE_RETRY_DELAY", 0.001)
+
+    async def run():
+        # Queued together, so they share one transaction
+        for uid in ("u1", "u2", "u3"):
+            backend.save_user(uid, _user(uid))
+        backend.start()
+        await backend.close()
+
+    asyncio.run(run())
+    assert _stored_uids(path) == {"u1", "u2", "u3"}
+    assert backend.metrics["write_retries"] == 1
+    assert backend.metrics["flush_errors"] == 0
+
+
+def test_bad_statement_does_not_drop_the_rest_of_its_batch(tmp_path):
+    path = str(tmp_path / "omi.db")
+    backend = SQLiteBackend(path)
+
+    async def run():
+        backend.save_user("u1", _user("u1"))
+        backend._submit("INSERT INTO no_such_table VALUES (?)", (1,))
+        backend.save_user("u2", _user("u2"))
+        backend.start()
+        await backend.close()
+
+    asyncio.run(run())
+    assert _stored_uids(path) == {"u1", "u2"}
+    assert backend.metrics["flush_errors"] == 1
+
+
+def test_reads_see_writes_queued_before_them(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "omi.db"))
+
+    async def run():
+        backend.start()
+        backend.save_user("u1", _user("u1"))
+        user = await backend.load_user("u1")
+        await backend.close()
+        return user
+
+    assert asyncio.run(run()) == _user("u1")
+
+
+def test_lease_held_by_one_owner_at_a_time(tmp_path):
+    path = str(tmp_path / "omi.db")
+    # Two backends on one file, as two worker processes would have
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+
+    async def run():
+        results = [
+            await first.acquire_lease("session:s1", "worker-1", 30),
+            await second.acquire_lease("session:s1", "worker-2", 30),
+            await first.acquire_lease("session:s1", "worker-1", 30),
+        ]
+        await first.release_lease("session:s1", "worker-1")
+        await first.close()
+        results.append(await second.acquire_lease("session:s1", "worker-2", 0))
+        # Expired (ttl 0): free for anyone
+        results.append(await first.acquire_lease("session:s1", "worker-1", 30))
+        await first.close()
+        await second.close()
+        return results
+
+    assert asyncio.run(run()) == [True, False, True, True, True]
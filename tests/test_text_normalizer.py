@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import random
+
+import pytest
+
+from text_normalizer import _normalize_slow, fold_kana, normalize
+
+# "x now" in katakana (with a small tsu) and in hiragana
+EKUSU_NAU_KATAKANA = "\u30a8\u30c3\u30af\u30b9\u306a\u3046"
+EKUSU_NAU = "\u3048\u304f\u3059\u306a\u3046"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("X Now", "x now"),
+    ("  x \t now\n", "x now"),
+    (" x now ", "x now"),
+    ("\uff38 \uff2e\uff4f\uff57", "x now"),  # full width
+    (EKUSU_NAU_KATAKANA, "\u30a8\u30af\u30b9\u306a\u3046"),
+    # Long-vowel mark dropped, no space next to Japanese
+    ("\u30c4\u30a4\u30fc\u30c8 \u3057\u307e\u3059", "\u30c4\u30a4\u30c8\u3057\u307e\u3059"),
+    ("x \u306a\u3046 now", "x\u306a\u3046now"),
+    ("\uff74\uff78\uff7d", "\u30a8\u30af\u30b9"),  # half-width katakana
+])
+def test_normalize(text, expected):
+    assert normalize(text).text == expected
+
+
+def test_fold_kana():
+    assert fold_kana(normalize(EKUSU_NAU_KATAKANA).text) == EKUSU_NAU
+
+
+def test_fast_path_agrees_with_slow_path():
+    alphabet = ["a", "B", " ", "  ", "\t", "\n", "\u3042", "\u30a2", "\u30fc", "\u3063", "\u30c3", "\u6f22", "x"]
+    rng = random.Random(7)
+    for _ in range(5000):
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+        fast, slow = normalize(text), _normalize_slow(text)
+        assert fast.text == slow.text, text
+        for i in range(len(fast.text) + 1):
+            for j in range(i, len(fast.text) + 1):
+                assert fast.to_source(i, j) == slow.to_source(i, j), (text, i, j)
+
+
+@pytest.mark.parametrize("text, phrase", [
+    ("so  X\tNOW please", "x now"),
+    ("\uff38 \uff2e\uff4f\uff57 please", "x now"),
+    ("\u4eca\u65e5\u306f" + EKUSU_NAU_KATAKANA + "\u3067\u3059", "\u30a8\u30af\u30b9\u306a\u3046"),
+    ("\u4eca\u65e5 \u306f \u30c4\u30a4\u30fc\u30c8", "\u306f\u30c4\u30a4\u30c8"),
+])
+def test_to_source_round_trips(text, phrase):
+    normalized = normalize(text)
+    start = normalized.text.index(phrase)
+    source_start, source_end = normalized.to_source(start, start + len(phrase))
+    # The source slice normalizes back to the phrase; the rest starts at the next kept character
+    assert normalize(text[source_start:source_end]).text == phrase
+    assert normalize(text[source_end:]).text == normalized.text[start + len(phrase):].lstrip()
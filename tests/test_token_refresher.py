@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("tweepy")
+
+import simple_storage
+from records import UserRecord
+from simple_storage import SimpleUserStorage, StorageLeases
+from sqlite_storage import SQLiteBackend
+from token_refresher import RefreshScheduler, TokenRefresher
+from twitter_client import TokenRefreshRejected
+
+
+class FakeX:
+    """refresh_access_token that fails with the given errors first."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def refresh_access_token(self, refresh_token: str) -> dict:
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"access_token": f"access-{self.calls}", "refresh_token": f"refresh-{self.calls}", "expires_in": 7200}
+
+
+async def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_concurrent_refreshes_share_one_call(json_storage):
+    x = FakeX()
+    refresher = TokenRefresher(x)
+    callers = 20
+
+    async def run():
+        json_storage.start()
+        SimpleUserStorage.save_user("u1", "access", "refresh", expires_in=0)
+        # One caller gives up (client disconnect): the others still get the refresh
+        quitter = asyncio.ensure_future(refresher.refresh("u1"))
+        results = asyncio.gather(*(refresher.refresh("u1") for _ in range(callers - 1)))
+        await asyncio.sleep(0)
+        quitter.cancel()
+        users = await results
+        await json_storage.close()
+        return users
+
+    users = asyncio.run(run())
+    assert x.calls == 1
+    assert all(user is users[0] for user in users)
+    assert users[0].access_token == "access-1"
+    assert refresher.metrics["shared_waits"] == callers - 1
+
+
+def test_transient_failure_keeps_user_and_retries(json_storage):
+    x = FakeX(Exception("Failed to refresh token: ReadTimeout"))
+    scheduler = RefreshScheduler(TokenRefresher(x), retry_base=0.05)
+
+    async def run():
+        json_storage.start()
+        SimpleUserStorage.save_user("u1", "access", "refresh", expires_in=0)
+        scheduler.start()
+        await _wait_for(lambda: SimpleUserStorage.get_user("u1").access_token == "access-2")
+        await scheduler.close()
+        await json_storage.close()
+
+    asyncio.run(run())
+    assert x.calls == 2
+    assert scheduler.metrics["retries"] == 1
+    assert scheduler.refresher.metrics["rejected"] == 0
+
+
+def test_rejected_refresh_token_deletes_user(json_storage):
+    x = FakeX(TokenRefreshRejected("Token refresh rejected: invalid_request"))
+    scheduler = RefreshScheduler(TokenRefresher(x), retry_base=0.05)
+
+    async def run():
+        json_storage.start()
+        SimpleUserStorage.save_user("u1", "access", "refresh", expires_in=0)
+        scheduler.start()
+        await _wait_for(lambda: SimpleUserStorage.get_user("u1") is None)
+        await asyncio.sleep(0.2)
+        await scheduler.close()
+        await json_storage.close()
+
+    asyncio.run(run())
+    assert x.calls == 1
+    assert scheduler.metrics["retries"] == 0
+    assert scheduler.refresher.metrics["rejected"] == 1
+
+
+def test_one_worker_schedules_refreshes(json_storage, tmp_path, monkeypatch):
+    backend = SQLiteBackend(str(tmp_path / "omi.db"))
+    monkeypatch.setattr(simple_storage, "backend", backend)
+    monkeypatch.setattr(simple_storage, "SHARED_STATE", True)
+    now = time.time()
+    backend.save_user("u1", UserRecord("u1", "access", "refresh", now, now - 7200))
+    x = FakeX()
+
+    def worker(owner: str) -> RefreshScheduler:
+        # Two workers sharing one database, told apart by their lease owner
+        refresher = TokenRefresher(x, StorageLeases("refresh:", enabled=True, owner=owner))
+        leases = StorageLeases("scheduler:", ttl=0.3, enabled=True, owner=owner)
+        return RefreshScheduler(refresher, rescan=0.1, leases=leases)
+
+    workers = [worker("w1"), worker("w2")]
+
+    async def refreshed() -> bool:
+        user = await backend.load_user("u1")
+        return user.access_token != "access"
+
+    async def run():
+        for scheduler in workers:
+            scheduler.start()
+        deadline = time.monotonic() + 5
+        while not await refreshed():
+            assert time.monotonic() < deadline, "timed out"
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.3)
+        leaders = [scheduler for scheduler in workers if scheduler.snapshot()["leading"]]
+        assert len(leaders) == 1
+        # Shutdown hands the lease over
+        await leaders[0].close()
+        follower = workers[1 - workers.index(leaders[0])]
+        await _wait_for(lambda: follower.snapshot()["leading"])
+        await follower.close()
+        await backend.close()
+
+    asyncio.run(run())
+    assert x.calls == 1
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import asyncio
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+import tweet_detector
+from completeness import CompletenessScorer
+from tweet_detector import TweetDetector
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    prompts = []
+
+    def generate_text(prompt):
+        prompts.append(prompt)
+        return "0.7"
+
+    monkeypatch.setattr(tweet_detector.gemini_client, "generate_text", generate_text)
+    monkeypatch.setattr(TweetDetector, "completeness", CompletenessScorer(confidence=0.6))
+    return prompts
+
+
+def test_confident_local_scores_skip_gemini(gemini):
+    assert asyncio.run(TweetDetector.ai_check_completeness("Best day ever")) == 0.8
+    assert asyncio.run(TweetDetector.ai_check_completeness("I really think that")) == 0.1
+    assert gemini == []
+
+
+def test_uncertain_text_is_sent_to_gemini(gemini):
+    assert asyncio.run(TweetDetector.ai_check_completeness("went to the park today with friends")) == 0.7
+    assert len(gemini) == 1
+    assert TweetDetector.completeness.snapshot()["escalated"] == 1
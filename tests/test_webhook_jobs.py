@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""Post job results reported on later /webhook responses."""
+import asyncio
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+pytest.importorskip("tweepy")
+httpx = pytest.importorskip("httpx")
+
+import main_simple
+from post_jobs import PostJobQueue
+from simple_storage import SimpleUserStorage
+
+
+def test_new_job_id_is_not_replaced_by_an_earlier_result(json_storage, monkeypatch):
+    async def fake_extract(text):
+        return text.strip()
+
+    async def fake_post(access_token, text):
+        return {"success": True, "tweet_id": "1", "text": text}
+
+    monkeypatch.setattr(main_simple.tweet_detector, "ai_extract_tweet_from_segments", fake_extract)
+    monkeypatch.setattr(main_simple.twitter_client, "post_tweet", fake_post)
+    monkeypatch.setattr(main_simple, "SEGMENTS_REQUIRED", 1)
+    monkeypatch.setattr(main_simple, "ensure_hashtags", lambda text: text)
+    # asyncio queues bind to the first loop that uses them; this test gets its own
+    monkeypatch.setattr(main_simple, "post_jobs", PostJobQueue(main_simple.run_post_job))
+
+    async def run():
+        json_storage.start()
+        SimpleUserStorage.save_user("u1", "access", "refresh", expires_in=7200)
+        main_simple.post_jobs.start()
+        transport = httpx.ASGITransport(app=main_simple.app)
+        responses = []
+        async with httpx.AsyncClient(transport=transport, base_url="http://omi") as client:
+            for text in ("x now first tweet", "x now second tweet", "and then some"):
+                response = await client.post(
+                    "/webhook",
+                    params={"uid": "u1", "session_id": "s1"},
+                    json=[{"text": text}]
+                )
+                responses.append(response.json())
+                # Let the queued job finish before the next webhook
+                await main_simple.post_jobs._queue.join()
+        await main_simple.post_jobs.close()
+        await json_storage.close()
+        return responses
+
+    first, second, third = asyncio.run(run())
+    assert "job_id" in first
+    # The first job's result is ready, but this response must carry the new job
+    assert "job_id" in second and second["job_id"] != first["job_id"]
+    assert third["message"].startswith("Posted to X:")
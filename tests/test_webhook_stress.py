@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent /webhook calls for the same sessions through the ASGI app: every
+segment must end up in the post, and each session must post exactly once.
+"""
+import asyncio
+import dataclasses
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+pytest.importorskip("tweepy")
+httpx = pytest.importorskip("httpx")
+
+import main_simple
+from simple_storage import SimpleUserStorage
+
+SESSIONS = 10
+SEGMENTS_REQUIRED = 20
+
+
+def test_concurrent_segments_post_once_without_losing_text(json_storage, monkeypatch):
+    posted = []
+
+    async def fake_extract(text):
+        return text.strip()
+
+    async def fake_post(access_token, text):
+        posted.append(text)
+        return {"success": True, "tweet_id": str(len(posted)), "text": text}
+
+    real_load_session = main_simple.load_session
+
+    async def slow_load_session(session_id, uid):
+        session = await real_load_session(session_id, uid)
+        # Like a storage round trip: a snapshot of the record that can go stale
+        # while the other webhooks for this session run
+        snapshot = dataclasses.replace(session) if session is not None else None
+        await asyncio.sleep(0.001)
+        return snapshot
+
+    monkeypatch.setattr(main_simple.tweet_detector, "ai_extract_tweet_from_segments", fake_extract)
+    monkeypatch.setattr(main_simple.twitter_client, "post_tweet", fake_post)
+    monkeypatch.setattr(main_simple, "load_session", slow_load_session)
+    monkeypatch.setattr(main_simple, "SEGMENTS_REQUIRED", SEGMENTS_REQUIRED)
+    monkeypatch.setattr(main_simple, "ensure_hashtags", lambda text: text)
+
+    async def webhook(client, session_id, text):
+        response = await client.post(
+            "/webhook",
+            params={"uid": "u1", "session_id": session_id},
+            json=[{"text": text}]
+        )
+        assert response.status_code == 200, response.text
+
+    async def run_session(client, session_id):
+        await webhook(client, session_id, f"x now {session_id}start")
+        # The trigger was segment 1; these complete the tweet together
+        await asyncio.gather(*(
+            webhook(client, session_id, f"{session_id}w{i}")
+            for i in range(SEGMENTS_REQUIRED - 1)
+        ))
+
+    async def run():
+        json_storage.start()
+        SimpleUserStorage.save_user("u1", "access", "refresh", expires_in=7200)
+        main_simple.post_jobs.start()
+        transport = httpx.ASGITransport(app=main_simple.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://omi") as client:
+            await asyncio.gather(*(run_session(client, f"s{n}") for n in range(SESSIONS)))
+        await main_simple.post_jobs.close()
+        await json_storage.close()
+
+    asyncio.run(run())
+    assert len(posted) == SESSIONS
+    for n in range(SESSIONS):
+        session_id = f"s{n}"
+        posts = [text for text in posted if f"{session_id}start" in text.split()]
+        assert len(posts) == 1
+        words = set(posts[0].split())
+        assert {f"{session_id}w{i}" for i in range(SEGMENTS_REQUIRED - 1)} <= words
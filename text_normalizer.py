@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Transcript normalization for phrase matching, with an offset map back to
+the original text.
+NFKC (full/half width), lowercase, long-vowel mark and small tsu dropped,
+whitespace collapsed to one space between ASCII words and dropped next to
+Japanese. Katakana and hiragana are folded together by the matcher (see
+fold_kana), so one canonical phrase covers every spelling.
+"""
+import re
+import unicodedata
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
+
+# Long-vowel mark and small tsu (hiragana and katakana) are dropped
+DROPPED_CHARS = ("\u30fc", "\u3063", "\u30c3")
+
+# Katakana U+30A1..U+30F6 sit 0x60 above the matching hiragana
+KATAKANA_OFFSET = 0x60
+_KANA_TABLE = {code: code - KATAKANA_OFFSET for code in range(0x30A1, 0x30F7)}
+
+# Dakuten/handakuten left over from half-width katakana after NFKC
+_VOICED_MARKS = ("\u3099", "\u309a")
+
+# Whitespace and dropped characters, where normalize() may move positions
+_GAP = re.compile(r"[\s\u30fc\u3063\u30c3]+")
+_SPACE_RUN = re.compile(r"\s{2,}")
+# ASCII whitespace str.split() breaks on besides the space (single-character
+# `in` checks run at memchr speed, unlike isprintable())
+_ASCII_SPACES = ("\t", "\n", "\x0b", "\x0c", "\r", "\x1c", "\x1d", "\x1e", "\x1f")
+
+
+class NormalizedText:
+    """Normalized text plus the mapping of its positions back to source"""
+
+    __slots__ = ("text", "source", "_origin", "_positions", "_aligned")
+
+    def __init__(self, text: str, source: str, origin: Optional[List[int]] = None, aligned: bool = False):
+        self.text = text
+        self.source = source
+        self._origin = origin  # origin[i]: index in source of text[i] (slow path only)
+        self._positions: "Optional[_PositionMap]" = None  # fast path, built when first needed
+        self._aligned = aligned  # same positions as source (nothing dropped or expanded)
+
+    def to_source(self, start: int, end: int) -> Tuple[int, int]:
+        """Source slice for text[start:end].
+
+        The end also covers characters dropped right after the slice (spaces,
+        long-vowel marks), so source[end:] starts at the next kept character.
+        """
+        if self._aligned:
+            return start, end
+        return self._position(start), self._position(end)
+
+    def _position(self, index: int) -> int:
+        if index >= len(self.text):
+            return len(self.source)
+        if self._origin is not None:
+            return self._origin[index]
+        if self._positions is None:
+            # Only texts that took normalize()'s fast path get here
+            self._positions = _PositionMap(self.source.lower())
+        return self._positions.position(index)
+
+
+def normalize(text: str) -> NormalizedText:
+    """Normalize text for phrase matching (the offset map is built lazily)."""
+    if text.isascii():
+        folded = text.lower()
+        if "  " in folded or any(ch in folded for ch in _ASCII_SPACES):
+            # Other whitespace than single spaces between words
+            folded = " ".join(folded.split())
+        elif folded[:1] == " " or folded[-1:] == " ":
+            folded = folded.strip(" ")
+        # Same length: at most tabs/newlines became spaces, positions are unchanged
+        return NormalizedText(folded, text, aligned=len(folded) == len(text))
+    if not unicodedata.is_normalized("NFKC", text):
+        return _normalize_slow(text)
+    folded = text.lower()
+    if len(folded) != len(text):
+        # A few characters lowercase to more than one (e.g. "İ")
+        return _normalize_slow(text)
+    for ch in DROPPED_CHARS:
+        if ch in folded:
+            folded = folded.replace(ch, "")
+    words = folded.split()
+    if len(words) == 1 and len(words[0]) == len(text):
+        return NormalizedText(folded, text, aligned=True)
+    return NormalizedText(_join_words(words), text)
+
+
+def fold_kana(text: str) -> str:
+    """Katakana to hiragana."""
+    return text.translate(_KANA_TABLE)
+
+
+def _join_words(words: List[str]) -> str:
+    # One space between ASCII words; none next to Japanese
+    if not words:
+        return ""
+    parts = [words[0]]
+    for previous, word in zip(words, words[1:]):
+        if previous[-1].isascii() and word[0].isascii():
+            parts.append(" ")
+        parts.append(word)
+    return "".join(parts)
+
+
+class _PositionMap:
+    """Positions of normalize()'s fast path mapped back to source, built up
+    only as far as asked (a trigger is usually near the start)."""
+
+    __slots__ = ("lowered", "starts", "sources", "shift", "gaps")
+
+    def __init__(self, lowered: str):
+        self.lowered = lowered
+        self.starts = [0]  # normalized start of each run kept in place
+        self.sources = [0]  # its source start
+        self.shift = 0  # source index - normalized index in the last run
+        n = len(lowered)
+        if lowered.isascii():
+            # Only whitespace runs and whitespace at the ends move positions
+            kept_from = n - len(lowered.lstrip())
+            kept_to = len(lowered.rstrip())
+            gaps = [(0, kept_from)] if kept_from else []
+            if kept_from < n:
+                gaps.extend(map(re.Match.span, _SPACE_RUN.finditer(lowered, kept_from, kept_to)))
+                if kept_to < n:
+                    gaps.append((kept_to, n))
+            self.gaps: Optional[Iterator[Tuple[int, int]]] = iter(gaps)
+        else:
+            self.gaps = map(re.Match.span, _GAP.finditer(lowered))
+
+    def position(self, index: int) -> int:
+        starts = self.starts
+        if self.gaps is not None and index >= starts[-1]:
+            self._map_gaps(index)
+        k = bisect_right(starts, index) - 1
+        return self.sources[k] + index - starts[k]
+
+    def _map_gaps(self, index: int):
+        """Map gaps until a kept run starts past index."""
+        lowered, starts, sources, shift = self.lowered, self.starts, self.sources, self.shift
+        n = len(lowered)
+        for a, b in self.gaps:
+            joined = 0 < a and b < n and lowered[a - 1].isascii() and lowered[b].isascii()
+            if joined:
+                # Between ASCII words only a gap with whitespace keeps a space
+                space = next((i for i in range(a, b) if lowered[i].isspace()), -1)
+                joined = space >= 0
+                if joined and b - a == 1:
+                    # A single space between ASCII words stays where it is
+                    continue
+            at = a - shift
+            if joined:
+                # Kept as one space (at the first whitespace character)
+                starts.append(at)
+                sources.append(space)
+                at += 1
+            starts.append(at)
+            sources.append(b)
+            shift = b - at
+            if at > index:
+                self.shift = shift
+                return
+        self.gaps = None
+
+
+@lru_cache(maxsize=4096)
+def _fold_char(ch: str) -> str:
+    return unicodedata.normalize("NFKC", ch).lower()
+
+
+def _normalize_slow(text: str) -> NormalizedText:
+    folded, origin = _normalize_with_origin(text)
+    return NormalizedText(folded, text, origin)
+
+
+def _normalize_with_origin(text: str) -> Tuple[str, List[int]]:
+    """Character by character version of normalize() that records origins."""
+    chars: List[str] = []
+    origin: List[int] = []
+    space = -1  # index of a pending whitespace run
+    joinable = False  # chars[-1] directly precedes the current character
+    for index, ch in enumerate(text):
+        for out in _fold_char(ch):
+            if out in DROPPED_CHARS:
+                joinable = False
+                continue
+            if out.isspace():
+                if chars and space < 0:
+                    space = index
+                joinable = False
+                continue
+            if out in _VOICED_MARKS and joinable:
+                # Half-width kana + separate (han)dakuten, as NFKC on the whole text would
+                composed = unicodedata.normalize("NFC", chars[-1] + out)
+                if len(composed) == 1:
+                    chars[-1] = composed
+                    continue
+            if space >= 0:
+                if chars[-1].isascii() and out.isascii():
+                    chars.append(" ")
+                    origin.append(space)
+                space = -1
+            chars.append(out)
+            origin.append(index)
+            joinable = True
+    return "".join(chars), origin
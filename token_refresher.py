@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+Single-flight token refresh and a background refresh scheduler.
+X rotates refresh tokens, so two concurrent refreshes for the same user make
+the second one fail. At most one refresh per uid is in flight; concurrent
+callers wait for it and share its result. In shared mode a storage lease
+extends this across workers, and only the worker holding the scheduler lease
+refreshes in the background.
+"""
+import asyncio
+import heapq
+import os
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from app_logging import get_logger
+from records import UserRecord
+from simple_storage import SimpleUserStorage, StorageLeases, TOKEN_EXPIRY_MARGIN
+from twitter_client import TokenRefreshRejected, TwitterClient
+
+# Background refresh starts this many seconds before expiry (before the
+# webhook's TOKEN_EXPIRY_MARGIN, so webhooks rarely refresh inline)
+TOKEN_REFRESH_AHEAD = float(os.getenv("TOKEN_REFRESH_AHEAD", "900"))
+TOKEN_REFRESH_CONCURRENCY = int(os.getenv("TOKEN_REFRESH_CONCURRENCY", "4"))
+# Shared mode: the scheduling worker re-reads soon-to-expire users from storage this often
+TOKEN_REFRESH_RESCAN = float(os.getenv("TOKEN_REFRESH_RESCAN", "60"))
+# A refresh that failed for any reason but a rejected token is retried after
+# TOKEN_REFRESH_RETRY_BASE seconds, doubling up to TOKEN_REFRESH_RETRY_MAX
+TOKEN_REFRESH_RETRY_BASE = float(os.getenv("TOKEN_REFRESH_RETRY_BASE", "5"))
+TOKEN_REFRESH_RETRY_MAX = float(os.getenv("TOKEN_REFRESH_RETRY_MAX", "300"))
+
+SCHEDULER_LEASE = "token-refresh"
+
+log = get_logger("refresh")
+
+
+class TokenRefresher:
+    """Refresh expiring user tokens, one request to X per uid at a time"""
+
+    def __init__(self, twitter_client: TwitterClient, leases: Optional[StorageLeases] = None):
+        self.twitter_client = twitter_client
+        self.leases = leases or StorageLeases("refresh:")
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.metrics = {
+            "refreshes": 0,
+            "inline_refreshes": 0,
+            "refresh_failures": 0,
+            "rejected": 0,
+            "shared_waits": 0,
+            "adopted": 0,
+        }
+
+    async def refresh(
+        self,
+        uid: str,
+        margin: float = TOKEN_EXPIRY_MARGIN,
+        background: bool = False
+    ) -> Optional[UserRecord]:
+        """Refresh uid's tokens if they expire within margin seconds.
+
+        Returns the (possibly unchanged) user, or None if re-auth is needed.
+        Other failures (timeouts, X errors) raise: the tokens may still be good.
+        """
+        task = self._inflight.get(uid)
+        if task is None:
+            if not background:
+                self.metrics["inline_refreshes"] += 1
+            task = asyncio.get_running_loop().create_task(self._refresh(uid, margin))
+            self._inflight[uid] = task
+            task.add_done_callback(lambda _: self._inflight.pop(uid, None))
+        else:
+            self.metrics["shared_waits"] += 1
+        # Shielded: a caller that disconnects must not cancel everyone's refresh
+        return await asyncio.shield(task)
+
+    async def _refresh(self, uid: str, margin: float) -> Optional[UserRecord]:
+        # Across workers too; the re-read below sees a refresh that finished first
+        async with self.leases.hold(uid):
+            return await self._refresh_held(uid, margin)
+
+    async def _refresh_held(self, uid: str, margin: float) -> Optional[UserRecord]:
+        user = await SimpleUserStorage.fetch_user(uid)
+        if user is None:
+            return None
+        if time.time() < user.expires_at - margin:
+            # Already refreshed (e.g. by another worker) while we were queued
+            return user
+
+        refresh_token = user.refresh_token
+        if not refresh_token or refresh_token == "null":
+            log.warning("No refresh token! User must re-authenticate with offline.access scope.")
+            return None
+
+        try:
+            log.info("Refreshing token for user %s...", uid[:10])
+            new_token_data = await self.twitter_client.refresh_access_token(refresh_token)
+
+            new_access_token = new_token_data.get("access_token")
+            if not new_access_token:
+                raise Exception("Token refresh failed: access_token missing")
+
+            SimpleUserStorage.save_user(
+                uid=uid,
+                access_token=new_access_token,
+                refresh_token=new_token_data.get("refresh_token", refresh_token),
+                expires_in=new_token_data.get("expires_in", 7200)
+            )
+            self.metrics["refreshes"] += 1
+            log.info("Token refreshed for user %s...", uid[:10])
+            return SimpleUserStorage.get_user(uid)
+
+        except Exception as e:
+            self.metrics["refresh_failures"] += 1
+            log.error("Refresh error: %s", e)
+            # Another worker may have won the race and rotated the refresh
+            # token; adopt its tokens instead of deleting the user
+            current = await SimpleUserStorage.fetch_user(uid)
+            if current is not None and current.refresh_token != refresh_token:
+                self.metrics["adopted"] += 1
+                log.info("Adopted tokens refreshed elsewhere for user %s...", uid[:10])
+                return current
+            if not isinstance(e, TokenRefreshRejected):
+                raise
+            # X refused the refresh token: only re-auth helps
+            self.metrics["rejected"] += 1
+            SimpleUserStorage.delete_user(uid)
+            return None
+
+
+class RefreshScheduler:
+    """Refresh tokens ahead of expiry in the background.
+
+    Users sit in a min-heap keyed by when their refresh is due; at most
+    TOKEN_REFRESH_CONCURRENCY refreshes run at once. Failed refreshes are
+    retried with exponential backoff. In shared mode only the holder of the
+    scheduler lease schedules anything, finding users by rescanning storage.
+    """
+
+    def __init__(
+        self,
+        refresher: TokenRefresher,
+        ahead: float = TOKEN_REFRESH_AHEAD,
+        concurrency: int = TOKEN_REFRESH_CONCURRENCY,
+        rescan: float = TOKEN_REFRESH_RESCAN,
+        retry_base: float = TOKEN_REFRESH_RETRY_BASE,
+        retry_max: float = TOKEN_REFRESH_RETRY_MAX,
+        leases: Optional[StorageLeases] = None
+    ):
+        self.refresher = refresher
+        self.ahead = ahead
+        self.concurrency = concurrency
+        self.rescan = rescan
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.leases = leases or StorageLeases("scheduler:")
+        self._leading = not self.leases.enabled
+        self._heap: List[Tuple[float, str, float]] = []  # (due_at, uid, expires_at)
+        self._scheduled: Dict[str, float] = {}  # uid -> expires_at it was scheduled for; other heap entries are stale
+        self._attempts: Dict[str, int] = {}  # uid -> failed refreshes in a row
+        self._running: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._lease_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.metrics = {
+            "background_refreshes": 0,
+            "background_failures": 0,
+            "retries": 0,
+            "last_lag_ms": 0.0,
+            "max_lag_ms": 0.0,
+        }
+
+    def track(self, user: UserRecord):
+        """(Re)schedule a user's refresh from its current expires_at."""
+        if not self._leading:
+            # Another worker schedules refreshes; it finds this user by rescanning
+            return
+        if not user.refresh_token or user.refresh_token == "null":
+            return
+        if self._scheduled.get(user.uid) == user.expires_at:
+            return
+        # Tokens that live shorter than the window refresh at half their lifetime
+        remaining = max(0.0, user.expires_at - time.time())
+        due_at = user.expires_at - min(self.ahead, remaining / 2)
+        self._scheduled[user.uid] = user.expires_at
+        heapq.heappush(self._heap, (due_at, user.uid, user.expires_at))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            loop = asyncio.get_running_loop()
+            if self.leases.enabled:
+                self._lease_task = loop.create_task(self._hold_lease())
+            else:
+                for user in SimpleUserStorage.list_users():
+                    self.track(user)
+            self._task = loop.create_task(self._run())
+
+    async def close(self):
+        tasks = [task for task in (self._task, self._lease_task) if task is not None]
+        tasks.extend(self._running)
+        for task in tasks:
+            task.cancel()
+        self._task = None
+        self._lease_task = None
+        self._running.clear()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.leases.enabled and self._leading:
+            # Hand over now rather than after the lease expires
+            self._set_leading(False)
+            try:
+                await self.leases.release(SCHEDULER_LEASE)
+            except Exception as e:
+                log.warning("Could not release the refresh scheduler lease: %s", e)
+
+    def snapshot(self) -> dict:
+        return {
+            **self.metrics,
+            "leading": self._leading,
+            "scheduled_users": len(self._scheduled),
+            "running": len(self._running),
+        }
+
+    async def _hold_lease(self):
+        """Shared mode: take or renew the scheduler lease; while held, rescan storage."""
+        interval = min(self.leases.ttl / 3, self.rescan)
+        next_scan = 0.0
+        while True:
+            try:
+                leading = await self.leases.try_acquire(SCHEDULER_LEASE)
+            except Exception as e:
+                log.warning("Refresh scheduler lease check failed: %s", e)
+                leading = False
+            if leading != self._leading:
+                log.info("%s background token refresh", "Took over" if leading else "Handed off")
+                self._set_leading(leading)
+                next_scan = 0.0
+            if leading and time.time() >= next_scan:
+                next_scan = time.time() + self.rescan
+                try:
+                    # Everyone due before the next scan
+                    for user in await SimpleUserStorage.fetch_expiring_users(time.time() + self.ahead + self.rescan):
+                        self.track(user)
+                except Exception as e:
+                    log.warning("Could not read expiring users: %s", e)
+            await asyncio.sleep(interval)
+
+    def _set_leading(self, leading: bool):
+        self._leading = leading
+        self._heap.clear()
+        self._scheduled.clear()
+        self._attempts.clear()
+        self._wakeup.set()
+
+    def _retry(self, uid: str, expires_at: float) -> float:
+        """Schedule another attempt after a failed refresh; returns the delay."""
+        attempt = self._attempts.get(uid, 0)
+        self._attempts[uid] = attempt + 1
+        delay = min(self.retry_base * 2 ** attempt, self.retry_max)
+        # track() may have rescheduled the user while the refresh ran
+        if self._leading and uid not in self._scheduled:
+            self.metrics["retries"] += 1
+            self._scheduled[uid] = expires_at
+            heapq.heappush(self._heap, (time.time() + delay, uid, expires_at))
+            self._wakeup.set()
+        return delay
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            due_at, uid, expires_at = self._heap[0]
+            delay = due_at - time.time()
+            if delay > 0:
+                # Sleep until due, or until track() schedules something earlier
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            if self._scheduled.get(uid) != expires_at:
+                continue
+            del self._scheduled[uid]
+            await self._slots.acquire()
+            task = asyncio.get_running_loop().create_task(self._refresh(uid, due_at, expires_at))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _refresh(self, uid: str, due_at: float, expires_at: float):
+        try:
+            lag_ms = max(0.0, (time.time() - due_at) * 1000)
+            self.metrics["last_lag_ms"] = round(lag_ms, 3)
+            self.metrics["max_lag_ms"] = max(self.metrics["max_lag_ms"], round(lag_ms, 3))
+            user = await self.refresher.refresh(uid, margin=self.ahead, background=True)
+            self._attempts.pop(uid, None)
+            if user is None:
+                self.metrics["background_failures"] += 1
+                return
+            self.metrics["background_refreshes"] += 1
+            self.track(user)
+        except Exception as e:
+            self.metrics["background_failures"] += 1
+            delay = self._retry(uid, expires_at)
+            log.error("Background refresh failed for user %s..., retrying in %.0fs: %s", uid[:10], delay, e)
+        finally:
+            self._slots.release()
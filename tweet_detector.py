@@ -6,8 +6,15 @@ import os
 from dotenv import load_dotenv
 import google.generativeai as genai
 
+from app_logging import get_logger
+from completeness import CompletenessScorer
+from phrase_matcher import PhraseMatcher, ScanResult
+from text_normalizer import fold_kana, normalize
+
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))  # Load .env file
 
+log = get_logger("detector")
+
 
 class GeminiClient:
     """Gemini API client wrapper."""
@@ -32,19 +39,15 @@ gemini_client = GeminiClient()
 class TweetDetector:
     """Detects tweet trigger phrases and extracts tweet content."""
     
+    # Canonical forms: matching is on normalized text (text_normalizer), so
+    # katakana, half-width, long-vowel, small-tsu and spacing variants of
+    # these match too
     TRIGGER_PHRASES = [
         "x now",
-        "x\u30ca\u30a6",
         "x\u306a\u3046",
-        "\u30a8\u30c3\u30af\u30b9\u30ca\u30a6",
-        "\u30a8\u30c3\u30af\u30b9\u306a\u3046",
-        "\u30a8\u30b9\u30ca",
+        "\u3048\u304f\u3059\u306a\u3046",
         "\u3048\u3059\u306a",
-        "\u30a8\u30b9\u30ca\u30a6",
         "\u3048\u3059\u306a\u3046",
-        "\u30a8\u30af\u30b9\u30ca\u30a6",
-        "\u30a8\u30af\u30b9\u306a\u3046",
-        "\u3048\u304f\u3059\u306a\u3046",
         "tweet now",
         "post tweet",
         "send tweet",
@@ -61,61 +64,71 @@ class TweetDetector:
         "finish tweet"
     ]
     
+    # Local completeness scores, trusted outside the uncertainty band
+    completeness = CompletenessScorer()
+    
     @staticmethod
     def normalize_text(text: str) -> str:
         """Normalize text for comparison."""
-        return text.lower().strip()
+        return fold_kana(normalize(text).text)
+    
+    @classmethod
+    def matcher(cls) -> PhraseMatcher:
+        """Automaton over TRIGGER_PHRASES and END_PHRASES, compiled on first use."""
+        matcher = cls.__dict__.get("_matcher")
+        if matcher is None:
+            matcher = PhraseMatcher({"trigger": cls.TRIGGER_PHRASES, "end": cls.END_PHRASES})
+            cls._matcher = matcher
+        return matcher
+    
+    @classmethod
+    def scan(cls, text: str) -> ScanResult:
+        """All trigger and end phrases in text, from one (cached) pass."""
+        return cls.matcher().scan(text)
     
     @classmethod
     def detect_trigger(cls, text: str) -> bool:
         """Check if text contains a tweet trigger phrase."""
-        normalized = cls.normalize_text(text)
-        return any(trigger in normalized for trigger in cls.TRIGGER_PHRASES)
+        return cls.scan(text).has("trigger")
     
     @classmethod
     def detect_end(cls, text: str) -> bool:
         """Check if text contains an explicit end phrase."""
-        normalized = cls.normalize_text(text)
-        return any(end_phrase in normalized for end_phrase in cls.END_PHRASES)
+        return cls.scan(text).has("end")
     
     @classmethod
-    def extract_tweet_content(cls, text: str) -> Optional[str]:
-        """Extract tweet content after trigger phrase."""
-        normalized = cls.normalize_text(text)
-        
-        # Find the trigger phrase
-        trigger_index = -1
-        matched_trigger = None
-        for trigger in cls.TRIGGER_PHRASES:
-            idx = normalized.find(trigger)
-            if idx != -1:
-                trigger_index = idx
-                matched_trigger = trigger
-                break
-        
-        if trigger_index == -1 or matched_trigger is None:
+    def extract_tweet_content(cls, text: str, result: Optional[ScanResult] = None) -> Optional[str]:
+        """Extract tweet content after the earliest trigger phrase.
+
+        result: scan of text to use instead of scanning again (e.g. from PhraseStreams,
+        where the trigger may have started in an earlier chunk)
+        """
+        if result is None:
+            result = cls.scan(text)
+        trigger = result.first("trigger")
+        if trigger is None:
             return None
         
-        # Extract content after trigger
-        start_index = trigger_index + len(matched_trigger)
-        content = text[start_index:].strip()
-        
-        # Remove explicit end phrases if present
-        for end_phrase in cls.END_PHRASES:
-            if content.lower().endswith(end_phrase):
-                content = content[:-(len(end_phrase))].strip()
-                break
+        content_start = result.source_span(trigger)[1]
+        content_end = len(text)
+        # Remove an explicit end phrase if the text ends with one
+        end_phrase = result.ending_at("end", result.length, not_before=trigger.end)
+        if end_phrase is not None:
+            content_end = result.source_span(end_phrase)[0]
         
+        content = text[content_start:content_end].strip()
         return content if content else None
     
     @classmethod
     async def ai_check_completeness(cls, accumulated_text: str) -> float:
         """
-        Use AI to check if tweet sounds complete.
+        Check if tweet sounds complete.
         Returns a score from 0.0 to 1.0:
         - 0.0 = definitely incomplete, wait for more
         - 1.0 = definitely complete, post now
         - 0.5+ = probably complete enough
+        The local score is used when it is confident (COMPLETENESS_CONFIDENCE);
+        only uncertain texts are sent to Gemini.
         """
         # If explicit end phrase, it's complete
         if cls.detect_end(accumulated_text):
@@ -126,6 +139,11 @@ class TweetDetector:
         if len(cleaned) < 3:
             return 0.0
         
+        local_score = cls.completeness.score(cleaned)
+        if cls.completeness.is_confident(local_score):
+            log.debug("Completeness: %.2f (local) for '%s...'", local_score, cleaned[:50])
+            return local_score
+        
         prompt = f"""You judge whether a short text sounds like a complete post.
 
     Complete (0.8-1.0):
@@ -154,11 +172,11 @@ class TweetDetector:
             result = await asyncio.to_thread(gemini_client.generate_text, prompt)
             score = float(result.strip())
             score = max(0.0, min(1.0, score))
-            print(f"INFO Completeness: {score:.2f} for '{cleaned[:50]}...'", flush=True)
+            log.info("Completeness: %.2f for '%s...'", score, cleaned[:50])
             return score
         except Exception as e:
-            print(f"WARN AI check failed: {e}, defaulting to complete", flush=True)
-            return 0.9 if len(cleaned) > 8 else 0.5
+            log.warning("AI check failed: %s, using local score %.2f", e, local_score)
+            return local_score
     
     @classmethod
     async def ai_extract_tweet_from_segments(cls, all_segments_text: str) -> str:
@@ -206,7 +224,7 @@ class TweetDetector:
             return cleaned
 
         except Exception as e:
-            print(f"WARN AI extraction failed: {e}, using basic cleanup", flush=True)
+            log.warning("AI extraction failed: %s, using basic cleanup", e)
             return cls.clean_tweet_content(all_segments_text)
     
     @classmethod
@@ -249,7 +267,7 @@ class TweetDetector:
             return cleaned
 
         except Exception as e:
-            print(f"WARN AI cleanup failed: {e}, using basic cleanup")
+            log.warning("AI cleanup failed: %s, using basic cleanup", e)
             return cls.clean_tweet_content(extracted_content)
     
     @classmethod
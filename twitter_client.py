@@ -1,11 +1,31 @@
 # -*- coding: utf-8 -*-
 import tweepy
+import httpx
 from typing import Optional
 import os
 from dotenv import load_dotenv
 
+from app_logging import get_logger
+from simple_storage import OAuthStateStorage
+
 load_dotenv(dotenv_path=os.path.join(os.path.dirname(__file__), ".env"))  # Load .env file
 
+log = get_logger("twitter")
+
+TWITTER_API_BASE = os.getenv("TWITTER_API_BASE", "https://api.twitter.com").rstrip("/")
+TWITTER_TOKEN_URL = f"{TWITTER_API_BASE}/2/oauth2/token"
+TWITTER_TWEETS_URL = f"{TWITTER_API_BASE}/2/tweets"
+# Seconds; a slow X endpoint must not hold a webhook forever
+TWITTER_HTTP_TIMEOUT = float(os.getenv("TWITTER_HTTP_TIMEOUT", "10"))
+TWITTER_CONNECT_TIMEOUT = float(os.getenv("TWITTER_CONNECT_TIMEOUT", "5"))
+TWITTER_MAX_CONNECTIONS = int(os.getenv("TWITTER_MAX_CONNECTIONS", "100"))
+# Needs the h2 package (pip install "httpx[http2]")
+TWITTER_HTTP2 = os.getenv("TWITTER_HTTP2", "false").lower() == "true"
+
+
+class TokenRefreshRejected(Exception):
+    """X refused the refresh token (revoked or already used): the user must re-authenticate."""
+
 
 class TwitterClient:
     """Handles Twitter API interactions."""
@@ -15,61 +35,82 @@ class TwitterClient:
         self.api_secret = os.getenv("TWITTER_API_SECRET")
         self.client_id = os.getenv("TWITTER_CLIENT_ID")
         self.client_secret = os.getenv("TWITTER_CLIENT_SECRET")
-        self._oauth_handlers = {}  # Store OAuth handlers for callback
-        self._state_to_uid = {}  # Map Tweepy's state to our uid
-    
-    def get_oauth2_client(self, access_token: str) -> tweepy.Client:
-        """Create Twitter API client with OAuth 2.0 user context."""
-        # For OAuth 2.0 user access tokens, use bearer_token parameter
-        # This sends the token in Authorization: Bearer header
-        return tweepy.Client(bearer_token=access_token)
+        self._http: Optional[httpx.AsyncClient] = None
+
+    def _get_http(self) -> httpx.AsyncClient:
+        """Shared keep-alive client, created on first use inside the event loop."""
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=httpx.Timeout(TWITTER_HTTP_TIMEOUT, connect=TWITTER_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=TWITTER_MAX_CONNECTIONS,
+                    max_keepalive_connections=TWITTER_MAX_CONNECTIONS
+                ),
+                http2=TWITTER_HTTP2
+            )
+        return self._http
+
+    async def aclose(self):
+        """Close pooled connections (call from the app's shutdown hook)."""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
     
     async def post_tweet(self, access_token: str, text: str) -> Optional[dict]:
         """Post a tweet to Twitter."""
         try:
-            # Use Tweepy Client with OAuth 2.0 bearer token
-            client = tweepy.Client(bearer_token=access_token)
-            
-            # Create tweet using user context
-            response = client.create_tweet(text=text, user_auth=False)
+            # X API v2 with the user's OAuth 2.0 bearer token, over the pooled client
+            response = await self._get_http().post(
+                TWITTER_TWEETS_URL,
+                json={"text": text},
+                headers={"Authorization": f"Bearer {access_token}"}
+            )
             
-            if response.data:
-                return {
-                    "success": True,
-                    "tweet_id": response.data['id'],
-                    "text": text
-                }
-            return None
+            if response.status_code in (200, 201):
+                data = response.json().get("data")
+                if data:
+                    return {
+                        "success": True,
+                        "tweet_id": data["id"],
+                        "text": text
+                    }
+                return None
+
+            error_msg = f"{response.status_code} - {response.text}"
+            log.error("Twitter API error: %s", error_msg)
+            return {
+                "success": False,
+                "error": error_msg
+            }
             
-        except tweepy.TweepyException as e:
-            print(f"Twitter API error: {e}")
-            import traceback
-            traceback.print_exc()
+        except httpx.HTTPError as e:
+            log.error("Twitter API error: %r", e)
             return {
                 "success": False,
-                "error": str(e)
+                "error": str(e) or type(e).__name__
             }
         except Exception as e:
-            print(f"Unexpected error: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception("Unexpected error: %s", e)
             return {
                 "success": False,
                 "error": str(e)
             }
     
+    def _new_oauth_handler(self, redirect_uri: str) -> tweepy.OAuth2UserHandler:
+        return tweepy.OAuth2UserHandler(
+            client_id=self.client_id,
+            redirect_uri=redirect_uri,
+            scope=["tweet.read", "tweet.write", "users.read", "offline.access"],
+            client_secret=self.client_secret
+        )
+
     def get_authorization_url(self, redirect_uri: str, uid: str) -> str:
         """
         Generate OAuth 2.0 authorization URL with PKCE.
         Tweepy handles PKCE internally through the OAuth2UserHandler instance.
         Returns auth_url
         """
-        oauth2_user_handler = tweepy.OAuth2UserHandler(
-            client_id=self.client_id,
-            redirect_uri=redirect_uri,
-            scope=["tweet.read", "tweet.write", "users.read", "offline.access"],
-            client_secret=self.client_secret
-        )
+        oauth2_user_handler = self._new_oauth_handler(redirect_uri)
         
         # get_authorization_url() returns the URL with Tweepy's own state parameter
         # Tweepy internally generates and stores code_verifier in the handler
@@ -79,27 +120,26 @@ class TwitterClient:
         # The state is stored in the handler internally
         tweepy_state = oauth2_user_handler._state
         
-        # Store handler by Tweepy's state for later use in callback
-        self._oauth_handlers[tweepy_state] = oauth2_user_handler
-        
-        # Map Tweepy's state to our uid
-        self._state_to_uid[tweepy_state] = uid
+        # Keep only the uid and PKCE verifier (not the handler itself); the
+        # handler is rebuilt in the callback, which may run on another worker
+        # or after a restart
+        OAuthStateStorage.save_oauth_state(tweepy_state, uid, oauth2_user_handler._client.code_verifier)
         
         return auth_url
     
-    def get_access_token(self, authorization_response: str, state: str) -> tuple[dict, str]:
+    def get_access_token(self, authorization_response: str, state: str, redirect_uri: str) -> tuple[dict, str]:
         """
         Exchange authorization code for access token.
         Returns (token_dict, uid)
         """
-        # Retrieve the stored OAuth handler by state
-        oauth2_user_handler = self._oauth_handlers.get(state)
-        
-        if not oauth2_user_handler:
-            raise Exception("OAuth session not found. Please restart authentication.")
-        
-        # Get the uid associated with this state
-        uid = self._state_to_uid.get(state)
+        # Rebuild the OAuth handler from the saved PKCE verifier
+        saved = OAuthStateStorage.get_oauth_state(state)
+        if not saved:
+            raise Exception("OAuth session not found or expired. Please restart authentication.")
+        oauth2_user_handler = self._new_oauth_handler(redirect_uri)
+        oauth2_user_handler._state = state
+        oauth2_user_handler._client.code_verifier = saved["code_verifier"]
+        uid = saved["uid"]
         
         if not uid:
             raise Exception("User ID not found for this session.")
@@ -108,33 +148,30 @@ class TwitterClient:
         token_dict = oauth2_user_handler.fetch_token(authorization_response)
         
         # Debug: Log what we got
-        print("Token exchange result:", flush=True)
-        print(f"   Keys in token_dict: {list(token_dict.keys())}", flush=True)
-        print(f"   Has refresh_token: {'refresh_token' in token_dict}", flush=True)
+        log.info(
+            "Token exchange result: keys=%s has_refresh_token=%s",
+            list(token_dict.keys()),
+            "refresh_token" in token_dict
+        )
         
-        # Clean up stored handler and mapping
-        if state in self._oauth_handlers:
-            del self._oauth_handlers[state]
-        if state in self._state_to_uid:
-            del self._state_to_uid[state]
+        # The state is single-use
+        OAuthStateStorage.remove_oauth_state(state)
         
         return token_dict, uid
     
-    def refresh_access_token(self, refresh_token: str) -> dict:
+    async def refresh_access_token(self, refresh_token: str) -> dict:
         """
         Refresh the access token using refresh token.
         Returns new token_dict with access_token, refresh_token, expires_in
         """
         try:
-            import requests
-
             if not self.client_id or not self.client_secret:
                 raise Exception("Client ID/Secret not configured")
             
             # Make direct API call to refresh token
             # Tweepy's refresh_token method can be unreliable
-            response = requests.post(
-                "https://api.twitter.com/2/oauth2/token",
+            response = await self._get_http().post(
+                TWITTER_TOKEN_URL,
                 auth=(self.client_id, self.client_secret),
                 data={
                     "grant_type": "refresh_token",
@@ -146,16 +183,20 @@ class TwitterClient:
             
             if response.status_code == 200:
                 token_data = response.json()
-                print("Token refresh successful")
+                log.info("Token refresh successful")
                 return token_data
+            elif response.status_code == 400:
+                # invalid_grant / invalid_request: this refresh token will never work
+                log.error("Token refresh rejected: %s", response.text)
+                raise TokenRefreshRejected(f"Token refresh rejected: {response.text}")
             else:
                 error_msg = response.text
-                print(f"Token refresh failed: {response.status_code} - {error_msg}")
+                log.error("Token refresh failed: %s - %s", response.status_code, error_msg)
                 raise Exception(f"Token refresh failed: {error_msg}")
                 
+        except TokenRefreshRejected:
+            raise
         except Exception as e:
-            print(f"Token refresh error: {e}", flush=True)
-            import traceback
-            traceback.print_exc()
+            log.exception("Token refresh error: %s", e)
             raise Exception(f"Failed to refresh token: {e}")
 